@@ -1,12 +1,55 @@
+import re
 import time
-import pyvisa
 import numpy as np
-import pylab as pl
-import matplotlib.pyplot as plt
+import waveforms
 
 # set maximum allowed current and voltage to prevent user typos from breaking anything
 SMU_I_HARD_MAX = 10e-3
 
+# every data element the SMU can return, in the order it returns them
+ALL_ELEMENTS = ("VOLT", "CURR", "RES", "TIME", "STAT")
+
+# transfer formats understood by read_data, mapped to the numpy dtype of one element
+# binary formats are requested with swapped (little-endian) byte order so they decode without a copy
+DATA_FORMATS = {"ascii": None, "sreal": "<f4", "real64": "<f8"}
+
+# longest command the SMU input buffer accepts, list uploads are chunked to fit
+SMU_INPUT_BUFFER = 256
+# most points a single :SOUR:LIST command may carry
+SMU_LIST_MAX_POINTS = 100
+# most points a source list can hold
+SMU_LIST_MAX_LENGTH = 2500
+# shortest and longest arm layer timer interval in seconds
+SMU_TIMER_MIN = 0.001
+SMU_TIMER_MAX = 99999.999
+# readings the trace buffer holds
+SMU_TRACE_MAX = 2500
+
+# rough per-point timing used by plan_speed_profile, in seconds
+# source, settle and bookkeeping on top of integration
+SMU_POINT_OVERHEAD = 2e-3
+# front panel update
+SMU_DISPLAY_OVERHEAD = 1e-3
+# range check, more if the range actually changes
+SMU_AUTORANGE_OVERHEAD = 1e-3
+# with autozero on, each reading also integrates the reference and zero, roughly doubling the time
+SMU_AUTOZERO_FACTOR = 2
+
+# speed profile settings allowed for each accuracy class, the most accurate choices first
+# only "fast" gives up auto range, which leaves the measurement on the compliance range
+SPEED_CLASSES = {"high": {"NPLC": (10, 5, 1), "autozero": ("ON",), "auto_range": True, "source_delay": 1e-3},
+                 "normal": {"NPLC": (1, 0.5, 0.1), "autozero": ("ON", "ONCE"), "auto_range": True, "source_delay": 1e-3},
+                 "fast": {"NPLC": (0.1, 0.05, 0.01), "autozero": ("ONCE", "OFF"), "auto_range": False, "source_delay": 0}}
+
+class InstrumentError(RuntimeError):
+    '''
+    errors reported by the SMU's error queue, errors is a list of (code, message)
+    '''
+    
+    def __init__(self, errors):
+        self.errors = errors
+        RuntimeError.__init__(self, "; ".join("{} {}".format(code, message) for code, message in errors))
+
 class Keithley2401():
     
     def __init__(self, visa_resource):
@@ -17,15 +60,109 @@ class Keithley2401():
         self.info_dict["model_number"] = "Keithley2401"
         self.info_dict["serial_number"] = "Unknown"
         self.info_dict["resource_name"] = self.visa_resource.resource_name
+        self.data_format = "ascii"
+        self.elements = ALL_ELEMENTS
+        self.last_setup_time = None
+        # True between arm and fetch_data
+        self.armed = False
+        # wait for a service request instead of polling the status byte
+        self.use_srq = False
+        # service requests are queued by the resource once arm has enabled them
+        self.srq_enabled = False
+        # shadow copy of the settings sent with configure, keyed by SCPI header
+        self.state = {}
+        # raw bytes of each uploaded source list, a cheaper check than formatting the list again
+        self.list_keys = {}
+        # largest voltage set_voltage_level accepts, updated by the voltage sourcing setups
+        self.V_limit = 20
+        # optional instrumentation.Instrumentation, times every write, read and query
+        self.instrumentation = None
+        # power line frequency (Hz), sets how long an NPLC takes
+        self.line_frequency = 60
     
     def write(self, txt):
+        if self.instrumentation is None:
+            self.visa_resource.write(txt)
+            return
+        t_start = time.perf_counter()
         self.visa_resource.write(txt)
+        self.instrumentation.record(self, "write", txt, time.perf_counter() - t_start, len(txt))
 
     def read(self):
-        return self.visa_resource.read()
+        if self.instrumentation is None:
+            return self.visa_resource.read()
+        t_start = time.perf_counter()
+        response = self.visa_resource.read()
+        self.instrumentation.record(self, "read", None, time.perf_counter() - t_start, 0, len(response))
+        return response
+
+    def read_raw(self, size = None):
+        t_start = time.perf_counter()
+        # binary blocks may contain the termination character, so read an exact byte count when it is known
+        if size is None:
+            response = self.visa_resource.read_raw()
+        else:
+            response = self.visa_resource.read_bytes(size)
+        if self.instrumentation is not None:
+            self.instrumentation.record(self, "read", None, time.perf_counter() - t_start, 0, len(response))
+        return response
 
     def query(self, txt):
-        return self.visa_resource.query(txt)
+        if self.instrumentation is None:
+            return self.visa_resource.query(txt)
+        t_start = time.perf_counter()
+        response = self.visa_resource.query(txt)
+        self.instrumentation.record(self, "query", txt, time.perf_counter() - t_start, len(txt), len(response))
+        return response
+
+    def configure(self, header, value):
+        '''
+        sends a setting only if it differs from what was last configured
+        
+        Parameters
+        ----------
+        header : str
+            SCPI command, ex. ":SENS:CURR:NPLC"
+        value : str or number
+            setting, sent as "header value"
+        
+        Returns
+        -------
+        sent : bool
+            False if the setting was already in place
+        '''
+        value = str(value)
+        if self.state.get(header) == value:
+            return False
+        self.write(header + " " + value)
+        self.state[header] = value
+        return True
+
+    def invalidate_state(self):
+        '''
+        forget the cached settings, call after anything that changes them behind the driver's back
+        '''
+        self.state = {}
+        self.list_keys = {}
+
+    def verify_state(self):
+        '''
+        Queries every cached setting and compares it with the instrument.
+        Mismatched settings are dropped from the cache so the next setup resends them.
+        
+        Returns
+        -------
+        mismatches : dict
+            keys: SCPI header
+            values: (cached value, instrument value)
+        '''
+        mismatches = {}
+        for header, value in list(self.state.items()):
+            actual = self.query(header + "?").strip()
+            if not same_setting(value, actual):
+                mismatches[header] = (value, actual)
+                del self.state[header]
+        return mismatches
 
     def get_info(self):
         '''
@@ -44,6 +181,7 @@ class Keithley2401():
         call at the beginning of a measurement to put the SMU in a known state
         '''
         self.write("*RST;") #reset settings to default
+        self.invalidate_state()
         
         # clears standard event register, operation event resiter, measurment event register, questionable event register
         self.write("*CLS;") 
@@ -52,8 +190,7 @@ class Keithley2401():
         # SMU.write(":SYSTem:PRESet;")
         
         # you can turn off autozero to make measurements faster
-        # but you will loose accuracy
-        # SMU.write(":SYST:AZER OFF;") 
+        # but you will loose accuracy, plan_speed_profile chooses it with the NPLC
         
         # output stays on until you explicitly turn it off
         self.write(":SOUR:CLE:AUTO OFF;")
@@ -79,11 +216,56 @@ class Keithley2401():
         # turn on current measurement
         self.write(":SENS:FUNC 'CURR';")
         
+        # *RST puts the data format back to ascii with all elements
+        if self.data_format != "ascii" or self.elements != ALL_ELEMENTS:
+            self._apply_data_format()
+        
         #set arm and trigger to actiavate immmediatly
         #SMU.write(':ARM:SOURce IMMediate')
         #SMU.write(':TRIG:SOUR IMMediate')
         #SMU.write(':TRIG:OUT SOURce')
 
+    def set_data_format(self, data_format = "sreal", elements = ("VOLT", "CURR", "TIME")):
+        '''
+        choose how readings are transferred from the SMU
+        
+        Parameters
+        ----------
+        data_format : str
+            "sreal" (32 bit float), "real64" (64 bit float) or "ascii".
+            The binary formats are decoded straight into numpy by read_data.
+            Use "real64" for long runs, 32 bit timestamps lose ms resolution after a few hours.
+        elements : tuple of str
+            data elements to return with each reading, from ALL_ELEMENTS.
+            "VOLT", "CURR" and "TIME" are always needed by read_data.
+        '''
+        data_format = data_format.lower()
+        if data_format not in DATA_FORMATS:
+            raise(ValueError("Invalid data format: {}".format(data_format)))
+        
+        elements = [e.upper() for e in elements]
+        for e in elements:
+            if e not in ALL_ELEMENTS:
+                raise(ValueError("Invalid data element: {}".format(e)))
+        for e in ("VOLT", "CURR", "TIME"):
+            if e not in elements:
+                raise(ValueError("Data element {} is required".format(e)))
+        
+        self.data_format = data_format
+        # the SMU always returns elements in its own fixed order
+        self.elements = tuple(e for e in ALL_ELEMENTS if e in elements)
+        self._apply_data_format()
+    
+    def _apply_data_format(self):
+        if self.data_format == "ascii":
+            self.configure(":FORM:DATA", "ASC")
+        elif self.data_format == "sreal":
+            self.configure(":FORM:DATA", "SRE")
+        else:
+            self.configure(":FORM:DATA", "REAL,64")
+        self.configure(":FORM:BORD", "SWAP")
+        self.configure(":FORM:ELEM", ",".join(self.elements))
+
 #     def sweep_setup(self, NPLC = 10, C_compliance = 10e-3):
 #         # set NPLC
 #         self.write(":SENS:CURR:NPLC {};".format(NPLC))
@@ -96,99 +278,277 @@ class Keithley2401():
 #         self.write(":SENS:CURR:RANGE:AUTO 1")
   
      
-    def setup_timeseries_Vmeas(self, NPLC = 10, I_range = 10e-3, V_compliance = 3, current_list = [0], init_wait = 0.25):
+    def setup_timeseries_Vmeas(self, NPLC = 10, I_range = 10e-3, V_compliance = 3, current_list = [0], init_wait = 0.25, interval = None, source_delay = None, trigger_delay = None):
         '''
         call to change measurement configuration
+        the time spent is stored in self.last_setup_time (seconds)
+        
+        if interval (seconds) is given, the SMU's own timer starts one point of the list every interval,
+        otherwise points follow each other as fast as the SMU can go
         '''
+        t_start = time.perf_counter()
 
         # set NPLC
-        self.write(":SENS:CURR:NPLC {};".format(NPLC))
-        self.write(":SENS:VOLT:NPLC {};".format(NPLC))
+        self.configure(":SENS:CURR:NPLC", NPLC)
+        self.configure(":SENS:VOLT:NPLC", NPLC)
         # configure output mode, range, and compliance for smu
         
         # set to source current
-        self.write(":SOUR:FUNC CURR;")
+        self.configure(":SOUR:FUNC", "CURR")
         
         # set current range
-        self.write(":SOUR:CURR:RANG "+str(I_range)+" ;")
+        self.configure(":SOUR:CURR:RANG", I_range)
         
         # measurement range is on the same range as compliance
-        self.write(":SENS:VOLT:PROT:RSYN ON;")
-        self.write(":SENS:VOLT:PROT "+str(V_compliance))
+        self.configure(":SENS:VOLT:PROT:RSYN", "ON")
+        self.configure(":SENS:VOLT:PROT", V_compliance)
     
         # validate current settings
-        is_number = True
-        in_range = True
+        current_list = validate_levels(current_list, SMU_I_HARD_MAX, "current list")
+        
+        if len(current_list) > SMU_LIST_MAX_LENGTH:
+            raise(ValueError("Current list is longer than {} points".format(SMU_LIST_MAX_LENGTH)))
         
         self.num_readings = len(current_list)
-        for I in current_list:
-            if not np.can_cast(type(I),np.floating):
-                is_number = False
-                
-            if np.abs(I)>SMU_I_HARD_MAX:
-                in_range = False
-            
-        good = in_range and is_number
-        if not good:
-            raise(ValueError("Invalid current list"))
-        
-        self.write(":SOURce:CURR:MODE LIST")
-        self.write(":SOUR:LIST:CURR {}".format(current_list[0])) 
-        for current in current_list[1:]:
-            self.write(":SOUR:LIST:CURR:APP {}".format(current))
+        self.configure(":SOUR:CURR:MODE", "LIST")
+        self.upload_list(":SOUR:LIST:CURR", current_list)
+        
+        self.set_delays(source_delay, trigger_delay)
         
         # when triggered, take self.num_readings measurements
-        self.write(":TRIG:COUN {}".format(self.num_readings))
+        self.set_point_count(self.num_readings, interval)
+        self.last_setup_time = time.perf_counter() - t_start
         
-    def setup_timeseries_Imeas(self, NPLC = 10, V_range = 2, V_compliance = 5, I_compliance = 1e-1, voltage_list = [0], init_wait = 0.25):
+    def setup_timeseries_Imeas(self, NPLC = 10, V_range = 2, V_compliance = 5, I_compliance = 1e-1, voltage_list = [0], init_wait = 0.25, interval = None, source_delay = None, trigger_delay = None):
         '''
         call to change measurement configuration
+        the time spent is stored in self.last_setup_time (seconds)
+        
+        if interval (seconds) is given, the SMU's own timer starts one point of the list every interval,
+        otherwise points follow each other as fast as the SMU can go
         '''
+        t_start = time.perf_counter()
 
         # set NPLC
-        self.write(":SENS:CURR:NPLC {};".format(NPLC))
-        self.write(":SENS:VOLT:NPLC {};".format(NPLC))
+        self.configure(":SENS:CURR:NPLC", NPLC)
+        self.configure(":SENS:VOLT:NPLC", NPLC)
         # configure output mode, range, and compliance for smu
         
         # set to source voltage
-        self.write(":SOUR:FUNC VOLT;")
+        self.configure(":SOUR:FUNC", "VOLT")
         
         # set voltage range
-        self.write(":SOUR:VOLT:RANG "+str(V_range)+" ;")
+        self.configure(":SOUR:VOLT:RANG", V_range)
         
         # measurement range is on the same range as I_compliance
-        self.write(":SENS:CURR:PROT:RSYN ON;")
-        self.write(":SENS:CURR:PROT "+str(I_compliance))
+        self.configure(":SENS:CURR:PROT:RSYN", "ON")
+        self.configure(":SENS:CURR:PROT", I_compliance)
         
-        # validate current settings
-        is_number = True
-        in_range = True
+        # validate voltage settings
+        voltage_list = validate_levels(voltage_list, V_compliance, "voltage list")
+        self.V_limit = V_compliance
+        
+        if len(voltage_list) > SMU_LIST_MAX_LENGTH:
+            raise(ValueError("Voltage list is longer than {} points".format(SMU_LIST_MAX_LENGTH)))
         
         self.num_readings = len(voltage_list)
-        for V in voltage_list:
-            if not np.can_cast(type(V),np.floating):
-                is_number = False
-                
-            if np.abs(V)>V_compliance:
-                in_range = False
-            
-        good = in_range and is_number
-        if not good:
-            raise(ValueError("Invalid current list"))
-        
-        self.write(":SOURce:VOLT:MODE LIST")
-        self.write(":SOUR:LIST:VOLT {}".format(voltage_list[0])) 
-        for voltage in voltage_list[1:]:
-            self.write(":SOUR:LIST:VOLT:APP {}".format(voltage))
+        self.configure(":SOUR:VOLT:MODE", "LIST")
+        self.upload_list(":SOUR:LIST:VOLT", voltage_list)
+        
+        self.set_delays(source_delay, trigger_delay)
         
         # when triggered, take self.num_readings measurements
-        self.write(":TRIG:COUN {}".format(self.num_readings))
+        self.set_point_count(self.num_readings, interval)
+        self.last_setup_time = time.perf_counter() - t_start
+        
+    def upload_list(self, header, values):
+        '''
+        sends a source list in as few commands as the SMU input buffer allows
+        
+        Parameters
+        ----------
+        header : str
+            list command, ex. ":SOUR:LIST:VOLT". Later chunks are sent with ":APP".
+        values : numpy array
+            already validated list of levels
+        '''
+        # the whole list is cached under its header so an unchanged list is not sent again
+        key = np.asarray(values, dtype = np.float64).tobytes()
+        if header in self.state and self.list_keys.get(header) == key:
+            return
+        tokens = np.char.mod("%.7g", values)
+        payload = ",".join(tokens)
+        first = True
+        start = 0
+        while start < len(tokens):
+            command = header if first else header + ":APP"
+            # fit as many points as possible after the command, a space and the terminator
+            budget = SMU_INPUT_BUFFER - len(command) - 2
+            lengths = np.cumsum(np.char.str_len(tokens[start:start + SMU_LIST_MAX_POINTS]) + 1) - 1
+            stop = start + max(int(np.searchsorted(lengths, budget, side = "right")), 1)
+            self.write(command + " " + ",".join(tokens[start:stop]))
+            first = False
+            start = stop
+        self.state[header] = payload
+        self.list_keys[header] = key
+
+    def set_point_count(self, num_readings, interval = None):
+        '''
+        sets how many source-measure points one :READ? or :INIT runs
+        
+        Parameters
+        ----------
+        num_readings : int
+            number of points
+        interval : float or None
+            None to run the points back to back on the trigger layer,
+            otherwise seconds between points, timed by the arm layer timer
+        '''
+        self.num_readings = num_readings
+        if interval is None:
+            # only undo the timer if it was set, *RST leaves the arm layer immediate with count 1
+            if self.state.get(":ARM:SOUR", "IMM") != "IMM":
+                self.configure(":ARM:SOUR", "IMM")
+                self.configure(":ARM:COUN", 1)
+            self.configure(":TRIG:COUN", num_readings)
+        else:
+            if not SMU_TIMER_MIN <= interval <= SMU_TIMER_MAX:
+                raise(ValueError("Invalid timer interval: {}".format(interval)))
+            self.configure(":ARM:SOUR", "TIM")
+            self.configure(":ARM:TIM", "{:.6g}".format(interval))
+            self.configure(":TRIG:COUN", 1)
+            self.configure(":ARM:COUN", num_readings)
+
+    def set_delays(self, source_delay = None, trigger_delay = None):
+        '''
+        sets the delay (seconds) between sourcing and measuring, and before each source action.
+        None leaves a delay as it is.
+        '''
+        if source_delay is not None:
+            self.configure(":SOUR:DEL", source_delay)
+        if trigger_delay is not None:
+            self.configure(":TRIG:DEL", trigger_delay)
+
+    def plan_speed_profile(self, interval, accuracy = "normal"):
+        '''
+        Chooses the most accurate settings that still fit one source-measure point in interval.
+        Apply them with apply_speed_profile.
+        
+        Parameters
+        ----------
+        interval : float
+            target time between points (s)
+        accuracy : str
+            "high", "normal" or "fast", see SPEED_CLASSES
         
+        Returns
+        -------
+        profile : dict
+            keys: "accuracy", "NPLC", "autozero" ("ON", "ONCE" or "OFF"), "display" (bool), "auto_range" (bool),
+            "source_delay", "trigger_delay" (s), "point_time" (expected s per point), "interval",
+            "feasible" (False if even the fastest settings of the class take longer than interval)
+        '''
+        if accuracy not in SPEED_CLASSES:
+            raise(ValueError("Invalid accuracy class: {}".format(accuracy)))
+        settings = SPEED_CLASSES[accuracy]
+        profile = None
+        for NPLC in settings["NPLC"]:
+            for autozero in settings["autozero"]:
+                # the display does not change the reading, it goes first when time is short
+                for display in (True, False):
+                    profile = {"accuracy": accuracy, "NPLC": NPLC, "autozero": autozero, "display": display,
+                               "auto_range": settings["auto_range"], "source_delay": settings["source_delay"], "trigger_delay": 0}
+                    profile["point_time"] = self.estimate_point_time(profile)
+                    profile["interval"] = interval
+                    profile["feasible"] = profile["point_time"] <= interval
+                    if profile["feasible"]:
+                        return profile
+        # nothing fits, the fastest settings of the class
+        return profile
+
+    def estimate_point_time(self, profile):
+        '''
+        Returns the expected time (s) of one source-measure point with a speed profile's settings.
+        Voltage and current are both measured.
+        '''
+        conversions = 2*(SMU_AUTOZERO_FACTOR if profile["autozero"] == "ON" else 1)
+        point_time = conversions*profile["NPLC"]/self.line_frequency + SMU_POINT_OVERHEAD
+        point_time += profile["source_delay"] + profile["trigger_delay"]
+        if profile["display"]:
+            point_time += SMU_DISPLAY_OVERHEAD
+        if profile["auto_range"]:
+            point_time += SMU_AUTORANGE_OVERHEAD
+        return point_time
+
+    def current_speed_profile(self, NPLC, source_delay = 0, trigger_delay = 0, measured = "CURR"):
+        '''
+        Returns the speed profile the SMU will run with once a setup sends NPLC and the delays,
+        for estimate_point_time. Autozero, display and auto range are read from the settings sent so far,
+        measured ("CURR" or "VOLT") picks the auto range; a setting never sent is at its *RST value, on.
+        '''
+        return {"NPLC": NPLC,
+                "autozero": self.state.get(":SYST:AZER", "ON"),
+                "display": self.state.get(":DISP:ENAB", "ON") == "ON",
+                "auto_range": self.state.get(":SENS:{}:RANG:AUTO".format(measured), "ON") == "ON",
+                "source_delay": source_delay,
+                "trigger_delay": trigger_delay}
+
+    def apply_speed_profile(self, profile):
+        '''
+        Sends a profile from plan_speed_profile. Call it after the setup, which sets its own NPLC,
+        or pass profile["NPLC"] to the setup. initial_setup turns the display back on.
+        '''
+        self.configure(":SENS:CURR:NPLC", profile["NPLC"])
+        self.configure(":SENS:VOLT:NPLC", profile["NPLC"])
+        if profile["autozero"] == "ONCE":
+            # autozeroes now and then stays off, so it is sent every time
+            self.write(":SYST:AZER ONCE")
+            self.state[":SYST:AZER"] = "OFF"
+        else:
+            self.configure(":SYST:AZER", profile["autozero"])
+        self.configure(":DISP:ENAB", "ON" if profile["display"] else "OFF")
+        self.set_delays(profile["source_delay"], profile["trigger_delay"])
+        # only the measured function has its own range, the sourced one reads back on the source range
+        measured = "VOLT" if self.state.get(":SOUR:FUNC") == "CURR" else "CURR"
+        self.configure(":SENS:{}:RANG:AUTO".format(measured), "ON" if profile["auto_range"] else "OFF")
+
+    def set_current_level(self, current_level):
+        '''
+        changes the sourced current without reconfiguring anything else
+        '''
+        current_level = validate_levels([current_level], SMU_I_HARD_MAX, "current setting")[0]
+        self.configure(":SOUR:CURR:LEV", current_level)
+
+    def set_voltage_level(self, voltage_level):
+        '''
+        changes the sourced voltage without reconfiguring anything else
+        '''
+        voltage_level = validate_levels([voltage_level], self.V_limit, "voltage setting")[0]
+        self.configure(":SOUR:VOLT:LEV", voltage_level)
+
     def initiate_timeseries_Vmeas(self):
         self.write(':READ?')
         
     def initiate_timeseries_Imeas(self):
         self.write(':READ?')
+
+    def initiate_list(self, fixed_level):
+        '''
+        starts the configured source list with :READ?, the SMU sources fixed_level once the list is done.
+        The level goes in the same message as the :READ?, so the output does not move to it before the list starts.
+        '''
+        if self.state.get(":SOUR:FUNC") == "CURR":
+            header = ":SOUR:CURR:LEV"
+            fixed_level = validate_levels([fixed_level], SMU_I_HARD_MAX, "current setting")[0]
+        else:
+            header = ":SOUR:VOLT:LEV"
+            fixed_level = validate_levels([fixed_level], self.V_limit, "voltage setting")[0]
+        value = str(fixed_level)
+        if self.state.get(header) == value:
+            self.write(":READ?")
+            return
+        self.write(header + " " + value + ";:READ?")
+        self.state[header] = value
     
     def turn_on(self):
         self.write(":OUTP ON")
@@ -197,108 +557,268 @@ class Keithley2401():
         self.write(":OUTP OFF;")
     
 
-    # todo: make this do something
+    def get_errors(self):
+        '''
+        Empties the SMU's error queue in one query.
+        
+        Returns
+        -------
+        errors : list of (int, str)
+            error code and message, oldest first
+        '''
+        reply = self.query(":SYST:ERR:ALL?")
+        errors = [(int(code), message) for code, message in re.findall(r'([+-]?\d+),"([^"]*)"', reply)]
+        return [e for e in errors if e[0] != 0]
+
     def raise_errors(self):
-        raise NotImplementedError
+        '''
+        raises InstrumentError with everything in the SMU's error queue, if anything
+        '''
+        errors = self.get_errors()
+        if errors:
+            raise(InstrumentError(errors))
 
     def setup_single_Vmeas(self, NPLC = 10, I_range = 10e-3, V_compliance = 3, current_level = 0, init_wait = 0.25):
 
         # set NPLC
-        self.write(":SENS:CURR:NPLC {};".format(NPLC))
-        self.write(":SENS:VOLT:NPLC {};".format(NPLC))
+        self.configure(":SENS:CURR:NPLC", NPLC)
+        self.configure(":SENS:VOLT:NPLC", NPLC)
         # configure output mode, range, and compliance for smu
         
         # set to source current
-        self.write(":SOUR:FUNC CURR;")
+        self.configure(":SOUR:FUNC", "CURR")
         
         # set current range
-        self.write(":SOUR:CURR:RANG "+str(I_range)+" ;")
+        self.configure(":SOUR:CURR:RANG", I_range)
         
         # measurement range is on the same range as compliance
-        self.write(":SENS:VOLT:PROT:RSYN ON;")
-        self.write(":SENS:VOLT:PROT "+str(V_compliance))
-        is_number = True
-        in_range = True
-        
-        # validate current setting
-        if not np.can_cast(type(current_level),np.floating):
-            is_number = False
-                
-        if np.abs(current_level)>SMU_I_HARD_MAX:
-                in_range = False
-                
-        good = in_range and is_number
-        if not good:
-            raise(ValueError("Invalid current setting"))
+        self.configure(":SENS:VOLT:PROT:RSYN", "ON")
+        self.configure(":SENS:VOLT:PROT", V_compliance)
         
         self.num_readings = 1
-        self.write(":SOURce:CURR:MODE FIXED")
-        self.write(":SOUR:CURR:LEV {}".format(current_level))
-        self.write(":TRIG:COUN {}".format(self.num_readings))
+        self.configure(":SOUR:CURR:MODE", "FIXED")
+        self.set_current_level(current_level)
+        self.set_point_count(self.num_readings)
     
     def setup_single_Imeas(self, NPLC = 10, V_range = 2, V_compliance = 5, I_compliance = 1e-1, voltage_level = 0, init_wait = 0.25):
         
         # set NPLC
-        self.write(":SENS:CURR:NPLC {};".format(NPLC))
-        self.write(":SENS:VOLT:NPLC {};".format(NPLC))
+        self.configure(":SENS:CURR:NPLC", NPLC)
+        self.configure(":SENS:VOLT:NPLC", NPLC)
         # configure output mode, range, and compliance for smu
         
         # set to source voltage
-        self.write(":SOUR:FUNC VOLT;")
+        self.configure(":SOUR:FUNC", "VOLT")
         
         # set voltage range
-        self.write(":SOUR:VOLT:RANG "+str(V_range)+" ;")
+        self.configure(":SOUR:VOLT:RANG", V_range)
         
         # measurement range is on the same range as I_compliance
-        self.write(":SENS:CURR:PROT:RSYN ON;")
-        self.write(":SENS:CURR:PROT "+str(I_compliance))
-        is_number = True
-        in_range = True
-        
-        # validate voltage setting
-        if not np.can_cast(type(voltage_level),np.floating):
-            is_number = False
-                
-        if np.abs(voltage_level)>V_compliance:
-                in_range = False
-                
-        good = in_range and is_number
-        if not good:
-            raise(ValueError("Invalid voltage setting"))
+        self.configure(":SENS:CURR:PROT:RSYN", "ON")
+        self.configure(":SENS:CURR:PROT", I_compliance)
         
         self.num_readings = 1
-        self.write(":SOURce:VOLT:MODE FIXED")
-        self.write(":SOUR:VOLT:LEV {}".format(voltage_level))
-        self.write(":TRIG:COUN {}".format(self.num_readings))
-        
+        self.configure(":SOUR:VOLT:MODE", "FIXED")
+        self.V_limit = V_compliance
+        self.set_voltage_level(voltage_level)
+        self.set_point_count(self.num_readings)
+        
+    def _read_readings(self, num_readings):
+        # one row per reading, one column per element
+        n_elements = len(self.elements)
+        if self.data_format == "ascii":
+            nums = np.array(self.read().split(","), dtype = float)
+        else:
+            dtype = np.dtype(DATA_FORMATS[self.data_format])
+            # "#0" header, the readings, then the terminator
+            raw = self.read_raw(2 + num_readings*n_elements*dtype.itemsize + 1)
+            nums = parse_binary_block(raw, dtype)
+        return nums[:num_readings*n_elements].reshape(num_readings, n_elements)
+
+    def _columns(self, readings, time_column_name = "timestamp", v_column_name = "Voltage (V)", i_column_name = "Current (A)"):
+        out = {}
+        out[time_column_name] = readings[:, self.elements.index("TIME")]
+        out[i_column_name] = readings[:, self.elements.index("CURR")]
+        out[v_column_name] = readings[:, self.elements.index("VOLT")]
+        return out
+
     def read_data(self, time_column_name = "timestamp", v_column_name = "Voltage (V)", i_column_name = "Current (A)"):
-        data = self.read()
-        nums = np.array([float(x) for x in data.split(",")])
-        volts_index = np.array((0 + np.arange(self.num_readings)*5),dtype = "int64")
-        curr_index = np.array((1 + np.arange(self.num_readings)*5),dtype = "int64")
-        time_index = np.array((3 + np.arange(self.num_readings)*5),dtype = "int64")
-        voltages = nums[volts_index]
-        currents = nums[curr_index]
-        times = nums[time_index]
+        # the columns below are strided views, not copies
+        readings = self._read_readings(self.num_readings)
     
         out = None
         if self.num_readings == 1:
-            voltage = voltages[0]
-            current = currents[0]
-            #times = times[0]
+            voltage = float(readings[0, self.elements.index("VOLT")])
+            current = float(readings[0, self.elements.index("CURR")])
             out = current, voltage
         
         else:
-            out = {}
-            out[time_column_name] = times
-            out[i_column_name] = currents
-            out[v_column_name] = voltages
+            out = self._columns(readings, time_column_name, v_column_name, i_column_name)
         
         return out
     
-    # todo: make this do something
-    def wait_for_data(self):
-        pass
+    def arm(self):
+        '''
+        Starts the configured measurement and returns at once, while the SMU integrates.
+        Collect the result with fetch_data; the host is free to do other work in between,
+        as long as it does not talk to the SMU.
+        '''
+        # the operation complete bit of the event status register shows up as ESB in the status byte
+        self.configure("*ESE", 1)
+        if self.use_srq:
+            self.configure("*SRE", 32)
+            if not self.srq_enabled:
+                import pyvisa
+                self.visa_resource.enable_event(pyvisa.constants.EventType.service_request, pyvisa.constants.EventMechanism.queue)
+                self.srq_enabled = True
+        self.write(":INIT;*OPC")
+        self.armed = True
+
+    def is_data_ready(self):
+        '''
+        checks the status byte with a serial poll, which does not disturb the measurement
+        '''
+        return bool(self.visa_resource.read_stb() & 32)
+
+    def wait_for_data(self, timeout = None, poll_interval = 1e-3):
+        '''
+        Waits until a measurement started with arm is complete. Returns at once if nothing is armed.
+        
+        Parameters
+        ----------
+        timeout : float or None
+            seconds to wait before raising TimeoutError, None to wait as long as it takes
+        poll_interval : float
+            seconds between status byte polls
+        '''
+        if not self.armed:
+            return
+        if self.use_srq:
+            # only needed for its constants, the driver itself works on any resource with read/write
+            import pyvisa
+            timeout_ms = pyvisa.constants.VI_TMO_INFINITE if timeout is None else int(1000*timeout)
+            self.visa_resource.wait_on_event(pyvisa.constants.EventType.service_request, timeout_ms)
+            # a request raised while nothing was waiting would end the next wait early
+            self.visa_resource.discard_events(pyvisa.constants.EventType.service_request, pyvisa.constants.EventMechanism.queue)
+        else:
+            t_start = time.monotonic()
+            while not self.is_data_ready():
+                if timeout is not None and time.monotonic() - t_start > timeout:
+                    raise(TimeoutError("SMU measurement did not complete in {} s".format(timeout)))
+                time.sleep(poll_interval)
+        # reading the event status register clears it for the next arm
+        self.query("*ESR?")
+        self.armed = False
+
+    def fetch_data(self, timeout = None):
+        '''
+        Waits for the measurement started with arm and returns it like read_data does.
+        '''
+        self.wait_for_data(timeout)
+        self.write(":FETC?")
+        return self.read_data()
+    
+    def setup_trace(self, num_readings, interval = None):
+        '''
+        Sets the point count and sizes the trace buffer so each :INIT stores its readings on the SMU.
+        Set up the source and measurement first, ex. with setup_single_Vmeas.
+        
+        Parameters
+        ----------
+        num_readings : int
+            readings per :INIT, at most SMU_TRACE_MAX
+        interval : float or None
+            as in set_point_count
+        '''
+        if not 1 <= num_readings <= SMU_TRACE_MAX:
+            raise(ValueError("Invalid trace length: {}, the buffer holds 1 to {} readings".format(num_readings, SMU_TRACE_MAX)))
+        self.set_point_count(num_readings, interval)
+        self.configure(":TRAC:FEED", "SENS")
+        self.configure(":TRAC:POIN", num_readings)
+
+    def arm_trace(self):
+        '''
+        clears the trace buffer and starts filling it, like arm
+        '''
+        # the feed control falls back to NEVer each time the buffer fills, so it is not cached
+        self.write(":TRAC:CLE;:TRAC:FEED:CONT NEXT")
+        self.arm()
+
+    def fetch_trace(self, timeout = None):
+        '''
+        Waits for the trace started with arm_trace and returns its readings,
+        one row per reading and one column per element in self.elements.
+        '''
+        self.wait_for_data(timeout)
+        self.write(":TRAC:DATA?")
+        return self._read_readings(self.num_readings)
+
+    def acquire_trace(self, num_readings, interval = None, chunk_size = SMU_TRACE_MAX, timeout = None, on_chunk = None,
+                      time_column_name = "timestamp", v_column_name = "Voltage (V)", i_column_name = "Current (A)"):
+        '''
+        Takes num_readings readings at the SMU's own speed, stored in its trace buffer
+        and read out in bulk, chunk_size readings at a time.
+        
+        The next chunk is started before the last one is copied and handed to on_chunk,
+        so the SMU only pauses while a chunk goes over the bus. The pause shows in the timestamps.
+        Set up the source and measurement first, ex. with setup_single_Vmeas, and call turn_on.
+        The point count is left as the last chunk's, run a setup again before other measurements.
+        
+        Parameters
+        ----------
+        num_readings : int
+            total number of readings
+        interval : float or None
+            None to take readings back to back, otherwise seconds between readings, timed by the SMU
+        chunk_size : int
+            readings per buffer fill, at most SMU_TRACE_MAX
+        timeout : float or None
+            seconds to wait for each chunk
+        on_chunk : callable or None
+            called with each chunk's columns, a dict like the one returned, ex. for plotting or saving.
+            If it returns True the run stops there, the chunk already started is aborted.
+        
+        Returns
+        -------
+        out : dict
+            keys: time_column_name, i_column_name, v_column_name
+            values: numpy arrays, views of one contiguous array of every reading taken
+        '''
+        if num_readings < 1:
+            raise(ValueError("Invalid number of readings: {}".format(num_readings)))
+        chunk_size = min(chunk_size, num_readings)
+        readings = np.empty((num_readings, len(self.elements)))
+        
+        self.setup_trace(chunk_size, interval)
+        self.arm_trace()
+        done = 0
+        while done < num_readings:
+            chunk = self.fetch_trace(timeout)
+            remaining = num_readings - done - len(chunk)
+            if remaining > 0:
+                self.setup_trace(min(chunk_size, remaining), interval)
+                self.arm_trace()
+            # the SMU is already filling the next chunk
+            readings[done:done + len(chunk)] = chunk
+            stop = False
+            if on_chunk is not None:
+                stop = on_chunk(self._columns(readings[done:done + len(chunk)], time_column_name, v_column_name, i_column_name))
+            done += len(chunk)
+            if stop:
+                if self.armed:
+                    self.abort()
+                break
+        
+        return self._columns(readings[:done], time_column_name, v_column_name, i_column_name)
+
+    def abort(self):
+        '''
+        stops a measurement started with arm or arm_trace, its readings are lost
+        '''
+        self.write(":ABOR")
+        # clears the operation complete bit in case it was set
+        self.query("*ESR?")
+        self.armed = False
     
     def single_Vmeas(self):
         self.write(':READ?')
@@ -310,9 +830,91 @@ class Keithley2401():
     
     def fetch_timeseries_Vmeas(self, time_column_name = "timestamp", v_column_name = "Voltage (V)", i_column_name = "Current (A)"):
         #SMU_columns = ["Time", "Current (mA)", "Voltage (V)"]
-        self.wait_for_data()
+        if self.armed:
+            self.wait_for_data()
+            self.write(":FETC?")
         return self.read_data(time_column_name, v_column_name, i_column_name)
     
+def same_setting(cached, actual):
+    '''
+    Compares a configured value with the instrument's reply to the matching query,
+    ex. "10" with "+1.000000E+01", "ON" with "1" or "FIXED" with "FIX".
+    Comma separated values (lists, data elements) are compared item by item.
+    '''
+    cached_items = cached.split(",")
+    actual_items = actual.split(",")
+    if len(cached_items) != len(actual_items):
+        return False
+    if len(cached_items) > 1:
+        return all(same_setting(c, a) for c, a in zip(cached_items, actual_items))
+    
+    try:
+        return bool(np.isclose(float(cached), float(actual), rtol = 1e-6, atol = 0))
+    except ValueError:
+        pass
+    aliases = {"ON": "1", "OFF": "0"}
+    cached = cached.strip().upper().strip("'\"")
+    actual = actual.strip().upper().strip("'\"")
+    cached = aliases.get(cached, cached)
+    actual = aliases.get(actual, actual)
+    return cached.startswith(actual) or actual.startswith(cached)
+
+def validate_levels(levels, limit, name = "level list"):
+    '''
+    Checks a list of source levels in one pass.
+    
+    Parameters
+    ----------
+    levels : list or numpy array
+        source levels, must be real numbers
+    limit : float
+        largest allowed magnitude
+    name : str
+        used in the error message
+    
+    Returns
+    -------
+    levels : numpy array of float64
+    '''
+    levels = np.asarray(levels)
+    good = levels.ndim == 1 and len(levels) > 0 and levels.dtype.kind in "biuf"
+    if good:
+        levels = levels.astype(np.float64)
+        good = bool(np.all(np.isfinite(levels)) and np.all(np.abs(levels) <= limit))
+    if not good:
+        raise(ValueError("Invalid {}".format(name)))
+    return levels
+
+def parse_binary_block(raw, dtype):
+    '''
+    Decodes an IEEE 488.2 binary block into a numpy array without copying it.
+    
+    Parameters
+    ----------
+    raw : bytes
+        response starting with "#0" (indefinite length, as sent by the 2400)
+        or "#<n><length>" (definite length)
+    dtype : numpy dtype
+        type of one element in the block
+    
+    Returns
+    -------
+    nums : numpy array
+        read-only view onto raw
+    '''
+    dtype = np.dtype(dtype)
+    if raw[:1] != b"#":
+        raise(ValueError("Response is not a binary block"))
+    n_digits = int(raw[1:2])
+    if n_digits == 0:
+        start = 2
+        # drop the trailing terminator
+        length = (len(raw) - start)//dtype.itemsize*dtype.itemsize
+    else:
+        start = 2 + n_digits
+        length = int(raw[2:start])
+    return np.frombuffer(raw, dtype = dtype, count = length//dtype.itemsize, offset = start)
+    
 #%%
 if __name__ == "__main__":
     NPLC = 1
@@ -322,7 +924,9 @@ if __name__ == "__main__":
     init_wait = 0.25 # does not do anything yet
     current_level = 1e-3
     
-    rm=visa.ResourceManager()
+    import pyvisa
+    import pylab as pl
+    rm=pyvisa.ResourceManager()
     SMU_RM = rm.open_resource('GPIB0::3::INSTR')
     SMU = Keithley2401(SMU_RM)
     SMU.initial_setup()
@@ -382,86 +986,22 @@ if __name__ == "__main__":
     #print(SMU_data)
     #print(single)
 
-class DynamicUpdateOG():
-    
-    def on_launch(self, x_label, y_label):
-        #set up plot
-        self.figure, self.ax = plt.subplots()
-        self.lines, = self.ax.plot([],[], 'o')
-        #set up axis which scale with data
-        self.ax.set_autoscalex_on(True)
-        self.ax.set_autoscaley_on(True)
-        #set up figure labels
-        self.ax.set_xlabel(x_label)
-        self.ax.set_ylabel(y_label)
-        self.ax.grid
-        ...
-
-    def on_running(self, xdata, ydata):
-        #update data (with the new _and_ the old points)
-        self.lines.set_xdata(xdata)
-        self.lines.set_ydata(ydata)
-        #need both of these in order to rescale
-        self.ax.relim()
-        self.ax.autoscale_view()
-        #we need to draw *and* flush
-        self.figure.canvas.draw()
-        self.figure.canvas.flush_events()
-        
-    def on_completion(self, fname, level, var1, var2, var3, var4):
-        #saves data to a .png file
-        from datetime import date
-        d = date.today()
-        self.figure.tight_layout
-        self.figure.savefig(F'{d.strftime("%Y_%m_%d")}_{fname}_{level}.png', dpi = 300, bbox_inches = 'tight')
-        np.savetxt(F'{d.strftime("%Y_%m_%d")}_{fname}_data_{level}.csv', np.c_[np.asarray(var1), np.asarray(var2)], delimiter = ',')
-        np.savetxt(F'{d.strftime("%Y_%m_%d")}_{fname}_vs_time_data.csv', np.c_[np.asarray(var3), np.asarray(var4)], delimiter = ',')
-
-class DynamicUpdateCV():
-    
-    def on_launch(self, x_label, y_label, min_x, max_x):
-        #set up plot
-        self.figure, self.ax = plt.subplots()
-        self.lines, = self.ax.plot([],[], 'o')
-        #set up axis which scale with data
-        self.ax.set_autoscaley_on(True)
-        self.ax.set_xlim(min_x, max_x)
-        #set up figure labels
-        self.ax.set_xlabel(x_label)
-        self.ax.set_ylabel(y_label)
-        self.ax.grid
-        ...
-
-    def on_running(self, xdata, ydata):
-        #update data (with the new _and_ the old points)
-        self.lines.set_xdata(xdata)
-        self.lines.set_ydata(ydata)
-        #need both of these in order to rescale
-        self.ax.relim()
-        self.ax.autoscale_view()
-        #we need to draw *and* flush
-        self.figure.canvas.draw()
-        self.figure.canvas.flush_events()
-        
-    def on_completion(self, fname, volt_range, scan, var1, var2):
-        #saves data to a .png file
-        from datetime import date
-        d = date.today()
-        self.figure.tight_layout
-        self.figure.savefig(F'{d.strftime("%Y_%m_%d")}_{fname}_{volt_range}_{scan}.png', dpi = 300, bbox_inches = 'tight')
-        np.savetxt(F'{d.strftime("%Y_%m_%d")}_cyclic_voltammetry_data_{volt_range}_{scan}.csv', np.c_[np.asarray(var1), np.asarray(var2)], delimiter = ',')
-
 class vlist():
     #creates a list of voltages the program will iterate through, 
+    #kept for older scripts, new code should use the numpy arrays from waveforms.triangle
     def generate(self, initial_voltage, final_voltage, scan_rate, cycles):
-        self.voltage_range = []
-        self.set_voltages_list = list(np.arange(initial_voltage, final_voltage, scan_rate))
-        self.set_voltages_list.append(final_voltage)
-        self.set_voltages_list_itr = self.set_voltages_list[:-1] + list(reversed(self.set_voltages_list[1:]))
+        #one point per second, so the scan rate (V/s) is also the step between points (V)
+        times, levels = waveforms.triangle(initial_voltage, final_voltage, scan_rate = scan_rate, step = scan_rate, cycles = cycles)
+        self.voltage_range = levels.tolist()
+    
+        return self.voltage_range
 
-        for c in range(0, cycles):
-            self.voltage_range = self.voltage_range + self.set_voltages_list_itr
+# the live plot classes are in plotting.py and only imported when one is asked for, ex. K2401.LivePlotOG,
+# so the driver loads without matplotlib, or a display, on headless computers
+PLOTTING_CLASSES = ("DynamicUpdateOG", "DynamicUpdateCV", "MinMaxDecimator", "LivePlot", "LivePlotOG", "LivePlotCV")
 
-        self.voltage_range.append(initial_voltage)
-    
-        return self.voltage_range
\ No newline at end of file
+def __getattr__(name):
+    if name in PLOTTING_CLASSES:
+        import plotting
+        return getattr(plotting, name)
+    raise(AttributeError("module {!r} has no attribute {!r}".format(__name__, name)))
@@ -0,0 +1,229 @@
+import threading
+import numpy as np
+import scheduler
+
+class RingBuffer():
+    '''
+    Preallocated table of readings passed from one writer thread to one reader.
+
+    The writer fills a row and only then advances its counter, the reader copies
+    everything up to the counter it saw. Neither side takes a lock.
+    When the reader falls a whole buffer behind, policy decides:
+        "overwrite" - the writer keeps going, the oldest unread rows are lost and counted in dropped
+        "block" - the writer waits for the reader, each wait is counted in stalls
+    '''
+
+    def __init__(self, capacity, columns = ("timestamp", "Current (A)", "Voltage (V)"), policy = "overwrite"):
+        if policy not in ("overwrite", "block"):
+            raise(ValueError("Invalid policy: {}".format(policy)))
+        self.capacity = capacity
+        self.columns = tuple(columns)
+        self.policy = policy
+        self.data = np.zeros((capacity, len(self.columns)))
+        # total rows ever written / consumed, each is only changed by one side
+        self.written = 0
+        # rows written once the write in progress is done, set before the row is touched
+        self.writing = 0
+        self.consumed = 0
+        self.dropped = 0
+        self.stalls = 0
+        self.space = threading.Event()
+
+    def write(self, row):
+        '''
+        adds one reading, row holds one value per column
+        '''
+        if self.policy == "block":
+            while self.written - self.consumed >= self.capacity:
+                self.stalls += 1
+                self.space.clear()
+                # recheck after clearing so a read in between is not missed
+                if self.written - self.consumed >= self.capacity:
+                    self.space.wait(0.1)
+        self.writing = self.written + 1
+        self.data[self.written % self.capacity] = row
+        self.written += 1
+
+    def read_new(self):
+        '''
+        Returns the readings added since the last call.
+
+        Returns
+        -------
+        rows : numpy array
+            one row per reading, a copy that stays valid
+        '''
+        end = self.written
+        start = max(self.consumed, end - self.capacity)
+        index = np.arange(start, end) % self.capacity
+        rows = self.data[index]
+        # rows the writer was overwriting, or had started to, while we were copying are not trustworthy
+        oldest_valid = self.writing - self.capacity
+        if oldest_valid > start:
+            rows = rows[oldest_valid - start:]
+            start = oldest_valid
+        self.dropped += start - self.consumed
+        self.consumed = end
+        self.space.set()
+        return rows
+
+    def pending(self):
+        '''
+        number of readings waiting for read_new
+        '''
+        return min(self.written - self.consumed, self.capacity)
+
+class AcquisitionThread(threading.Thread):
+    '''
+    Takes readings on a fixed schedule in its own thread, so plotting or saving in the main thread
+    cannot hold up the measurement. Rows also go to buffer, a RingBuffer, if one is given,
+    for a caller that polls it with read_new.
+
+    measure is called once per tick and returns (current, voltage),
+    ex. Keithley2401.single_Vmeas. Rows are (seconds since start, current, voltage).
+    Each row is also passed to the write_row method of every sink, ex. a streamfile.StreamWriter.
+    
+    If finish is given, measure only starts the reading and finish returns it,
+    ex. measure = Keithley2401.arm, finish = Keithley2401.fetch_data.
+    The sinks are then fed while the SMU integrates, instead of after.
+    
+    analysis, ex. an online_analysis.OnlineAnalysis, sees each row as soon as it is read;
+    the thread stops on the row that meets one of its stop conditions.
+    
+    sampler, ex. an AdaptiveSampler, sets the interval after each row. The run then ends
+    after duration seconds rather than a number of readings.
+    '''
+
+    def __init__(self, measure, interval, buffer = None, num_readings = None, policy = "catch_up", sinks = (), finish = None, analysis = None,
+                 sampler = None, duration = None):
+        threading.Thread.__init__(self, daemon = True)
+        self.measure = measure
+        self.finish = finish
+        self.analysis = analysis
+        self.sampler = sampler
+        self.duration = duration
+        self.sinks = list(sinks)
+        self.unsunk = []
+        self.buffer = buffer
+        self.num_readings = num_readings
+        self.clock = scheduler.DeadlineScheduler(interval, policy = policy)
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            i = 0
+            while not self.stop_event.is_set() and (self.num_readings is None or i < self.num_readings):
+                scheduled = self.clock.wait()
+                if self.duration is not None and scheduled > self.duration:
+                    break
+                if self.finish is None:
+                    I, V = self.measure()
+                else:
+                    self.measure()
+                    # overlaps the SMU's integration
+                    self._feed_sinks()
+                    I, V = self.finish()
+                row = (self.clock.elapsed(), I, V)
+                if self.buffer is not None:
+                    self.buffer.write(row)
+                self.unsunk.append(row)
+                i += 1
+                if self.analysis is not None:
+                    self.analysis.write_row(row)
+                    if self.analysis.stopped:
+                        break
+                if self.sampler is not None:
+                    self.clock.set_interval(self.sampler.update(row))
+                if self.finish is None:
+                    self._feed_sinks()
+        except Exception as e:
+            # handed to the main thread through check
+            self.error = e
+        finally:
+            # the rows read before a failed measure or finish still reach the sinks
+            try:
+                self._feed_sinks()
+            except Exception as e:
+                if self.error is None:
+                    self.error = e
+
+    def _feed_sinks(self):
+        for row in self.unsunk:
+            for sink in self.sinks:
+                sink.write_row(row)
+        self.unsunk = []
+
+    def stop(self):
+        '''
+        asks the thread to finish after the current reading
+        '''
+        self.stop_event.set()
+
+    def check(self):
+        '''
+        re-raises an error from the acquisition thread in the caller's thread
+        '''
+        if self.error is not None:
+            raise(self.error)
+
+class AdaptiveSampler():
+    '''
+    Chooses the time to the next reading from the last few: shorter while the signal changes,
+    geometrically longer while it is flat, always between min_interval and max_interval.
+    
+    The signal counts as changing when any of these goes over its threshold, None leaves a criterion out:
+        dV_dt, dI_dt - rate of change between the last two readings (V/s, A/s)
+        V_residual, I_residual - distance of the last reading from the line through the two before it (V, A),
+                                 which catches a change of slope, ex. the start of a transient
+    Set the thresholds above the noise, or the interval stays at min_interval.
+    The interval is divided by how far the worst criterion is over its threshold, and multiplied by backoff
+    once every criterion is under its threshold divided by backoff. In between it is kept.
+    '''
+
+    def __init__(self, min_interval, max_interval, dV_dt = None, dI_dt = None, V_residual = None, I_residual = None, backoff = 1.5,
+                 columns = ("timestamp", "Current (A)", "Voltage (V)")):
+        if not 0 < min_interval <= max_interval or backoff <= 1:
+            raise(ValueError("Invalid adaptive sampling settings"))
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        i_current = columns.index("Current (A)")
+        i_voltage = columns.index("Voltage (V)")
+        # (column, rate threshold, residual threshold)
+        self.criteria = [(i_voltage, dV_dt, V_residual), (i_current, dI_dt, I_residual)]
+        self.interval = min_interval
+        self.previous = []
+        self.n_faster = 0
+        self.n_slower = 0
+
+    def update(self, row):
+        '''
+        takes the latest reading, returns the interval (s) until the next one
+        '''
+        self.previous.append(row)
+        if len(self.previous) > 3:
+            self.previous.pop(0)
+        if len(self.previous) < 2:
+            return self.interval
+        # how far over its threshold the worst criterion is
+        ratio = 0.0
+        t1 = self.previous[-2][0]
+        t2 = self.previous[-1][0]
+        for column, rate_threshold, residual_threshold in self.criteria:
+            x1 = self.previous[-2][column]
+            x2 = self.previous[-1][column]
+            if rate_threshold is not None and t2 > t1:
+                ratio = max(ratio, abs(x2 - x1)/(t2 - t1)/rate_threshold)
+            if residual_threshold is not None and len(self.previous) == 3 and t1 > self.previous[0][0]:
+                t0 = self.previous[0][0]
+                x0 = self.previous[0][column]
+                predicted = x1 + (x1 - x0)/(t1 - t0)*(t2 - t1)
+                ratio = max(ratio, abs(x2 - predicted)/residual_threshold)
+        if ratio > 1:
+            self.interval = max(self.min_interval, self.interval/ratio)
+            self.n_faster += 1
+        elif ratio < 1/self.backoff:
+            self.interval = min(self.max_interval, self.interval*self.backoff)
+            self.n_slower += 1
+        return self.interval
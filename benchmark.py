@@ -0,0 +1,131 @@
+#times the driver's per-call overhead against the simulated SMU, no instrument needed
+#python benchmark.py [--latency SECONDS] [--repeat N] [--json FILE] [--max-import-time SECONDS]
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import numpy as np
+import Keithley2401_voltmeter_063023 as K2401
+import simulated_smu
+
+def timed(function, repeat):
+    '''
+    Returns the median and best time of repeat calls, in seconds.
+    '''
+    times = np.zeros(repeat)
+    for i in range(repeat):
+        t_start = time.perf_counter()
+        function()
+        times[i] = time.perf_counter() - t_start
+    return float(np.median(times)), float(times.min())
+
+# modules the driver must not load at import, ex. for a headless run
+HEAVY_MODULES = ("matplotlib", "pylab", "pyvisa")
+
+def import_time(module = "Keithley2401_voltmeter_063023", repeat = 5):
+    '''
+    Times importing module in a fresh interpreter, which is what a script pays at startup.
+
+    Returns
+    -------
+    median, best : float
+        seconds
+    heavy : list of str
+        the HEAVY_MODULES that came with it
+    '''
+    code = ("import sys, time, json; t = time.perf_counter(); import {}; t = time.perf_counter() - t; "
+            "print(json.dumps([t, [m for m in {!r} if m in sys.modules]]))").format(module, HEAVY_MODULES)
+    times = np.zeros(repeat)
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, "-c", code], cwd = os.path.dirname(os.path.abspath(__file__)),
+                                capture_output = True, text = True, check = True).stdout
+        times[i], heavy = json.loads(output)
+    return float(np.median(times)), float(times.min()), heavy
+
+def new_smu(latency, data_format = "ascii"):
+    resource = simulated_smu.SimulatedKeithley2401(latency = latency)
+    smu = K2401.Keithley2401(resource)
+    smu.initial_setup()
+    if data_format != "ascii":
+        smu.set_data_format(data_format)
+    return smu
+
+def run(latency = 0.0, repeat = 20, list_sizes = (100, 2500)):
+    '''
+    Returns {benchmark name: {"median": s, "best": s}}.
+    '''
+    results = {}
+
+    def record(name, function, n = repeat):
+        median, best = timed(function, n)
+        results[name] = {"median": median, "best": best}
+
+    median, best, heavy = import_time()
+    results["import driver"] = {"median": median, "best": best, "heavy_modules": heavy}
+
+    record("initial_setup", lambda: new_smu(latency))
+
+    smu = new_smu(latency)
+    record("setup_single_Vmeas cold", lambda: (smu.invalidate_state(), smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)))
+    record("setup_single_Vmeas warm", lambda: smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3))
+    # alternating modes, as in potentiostatic/galvanostatic steps
+    record("switch Vmeas/Imeas", lambda: (smu.setup_single_Imeas(NPLC = 1, voltage_level = 1), smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)))
+    smu.turn_on()
+    smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)
+    record("single_Vmeas", smu.single_Vmeas, 10*repeat)
+    smu.setup_single_Imeas(NPLC = 1, voltage_level = 1)
+    record("single_Imeas", smu.single_Imeas, 10*repeat)
+    # the same reading split into :INIT and :FETC?, host work can go between the two
+    record("arm/fetch_data", lambda: (smu.arm(), smu.fetch_data()), 10*repeat)
+
+    for n in list_sizes:
+        levels = np.linspace(0, 1, n)
+        record("list upload {} cold".format(n), lambda: (smu.invalidate_state(), smu.setup_timeseries_Imeas(NPLC = 0.01, voltage_list = levels)))
+        record("list upload {} warm".format(n), lambda: smu.setup_timeseries_Imeas(NPLC = 0.01, voltage_list = levels))
+
+    for data_format in ("ascii", "sreal", "real64"):
+        smu = new_smu(latency, data_format)
+        smu.turn_on()
+        for n in list_sizes:
+            smu.setup_timeseries_Imeas(NPLC = 0.01, voltage_list = np.linspace(0, 1, n))
+            record("list run {} {}".format(n, data_format), lambda: (smu.write(":READ?"), smu.read_data()))
+
+            # parsing alone: the same response fed back over and over
+            smu.write(":READ?")
+            response = smu.visa_resource.output[0]
+            def parse():
+                smu.visa_resource.output.append(response)
+                smu.read_data()
+            record("read_data parse {} {}".format(n, data_format), parse)
+            smu.visa_resource.output.clear()
+
+    return results
+
+def report(results):
+    width = max(len(name) for name in results)
+    for name, times in results.items():
+        print("{}  {:10.1f} us  (best {:.1f} us)".format(name.ljust(width), 1e6*times["median"], 1e6*times["best"]))
+
+#%%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Times Keithley2401 driver overhead against the simulated SMU")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "simulated bus latency per transaction (s)")
+    parser.add_argument("--repeat", type = int, default = 20, help = "repetitions per benchmark")
+    parser.add_argument("--json", help = "also write the results to this file")
+    parser.add_argument("--max-import-time", type = float, default = None,
+                        help = "fail (exit status 1) if importing the driver takes longer than this (s) or loads matplotlib or pyvisa")
+    args = parser.parse_args()
+
+    results = run(latency = args.latency, repeat = args.repeat)
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latency": args.latency, "repeat": args.repeat, "results": results}, f, indent = 2)
+    if args.max_import_time is not None:
+        driver = results["import driver"]
+        if driver["median"] > args.max_import_time or driver["heavy_modules"]:
+            print("driver import too slow: {:.3f} s, loads {}".format(driver["median"], ", ".join(driver["heavy_modules"]) or "nothing heavy"))
+            sys.exit(1)
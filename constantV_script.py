@@ -4,66 +4,117 @@
 import sys
 sys.path.append(r'Desktop\SMU_files\\')
 import Keithley2401_voltmeter_063023 as K2401
-import pyvisa
+import acquisition
+import streamfile
+import mmapstore
+import instrumentation
+import online_analysis
+import session_recorder
+import shm_ring
+import live_viewer
 import time
 import datetime
 import csv
 import numpy as np
-import matplotlib.pyplot as plt
 
-rm = pyvisa.ResourceManager()
-SMU_RM = rm.open_resource('GPIB0::3::INSTR')
+#set SMU_RECORD=FILE to record the session, see session_recorder.py
+profile_io = False # count and time every SMU command, the summary is saved next to the data
+SMU_RM = session_recorder.open_resource('GPIB0::3::INSTR')
 SMU = K2401.Keithley2401(SMU_RM)
+#attached before anything is sent, so the setup is counted too
+if profile_io:
+    SMU.instrumentation = instrumentation.Instrumentation()
 SMU.initial_setup()
-plt.ion()
 
 #CHANGE THESE VALUES BEFORE RUNNING THE SCRIPT
-time0 = time.time()
 voltage_level = 3 # set a constant voltage
 measurement_time = 10 # number of seconds to perform measurement
 num_readings = 20 # number of data points to collect
 wait_time = measurement_time/num_readings # wait time between measurements in seconds
+frame_rate = 10 # plot updates per second
+export_csv = True # also write the data as CSV once the run is over
+headless = False # only stream the data to disk: no plot windows, matplotlib is never loaded and no display is needed
+adaptive = False # sample faster while the signal changes and slower while it is flat, the run then lasts measurement_time
+min_interval = 0.05 # shortest time between readings with adaptive sampling (s)
+max_interval = 60 # longest time between readings with adaptive sampling (s)
+dI_dt = 1e-6 # with adaptive sampling, readings speed up while the current changes faster than this (A/s)
+I_residual = 1e-6 # or strays further than this from the trend of the last readings (A)
+charge_target = None # stop once this much charge has passed (C)
+current_plateau = None # stop once the current changes by less than this (A/s), ex. 1e-7
 
-NPLC = 1
+accuracy = "normal" # "high", "normal" or "fast", the SMU's integration time, autozero, display and ranging are chosen to fit wait_time
+profile = SMU.plan_speed_profile(min_interval if adaptive else wait_time, accuracy)
+NPLC = profile["NPLC"]
+print(F'NPLC {NPLC}, autozero {profile["autozero"]}, {profile["point_time"]*1000:.1f} ms per point expected')
+if not profile["feasible"]:
+    print(F'the SMU cannot keep up with {wait_time} s between points at {accuracy} accuracy')
 V_range = 20 # voltage range
 I_compliance = 1e-1 # max current
 V_compliance = 5 # max voltage
 init_wait = 0.25 # does not do anything yet
 SMU.setup_single_Imeas(NPLC = NPLC, V_range = V_range, V_compliance = V_compliance, I_compliance = I_compliance, voltage_level = voltage_level, init_wait = init_wait)
+SMU.apply_speed_profile(profile)
 SMU.turn_on()
 
-#initializes dynamically updating plots
-vc = K2401.DynamicUpdateOG()
-tc = K2401.DynamicUpdateOG()
+#readings are published in shared memory and plotted by a viewer process, moving or resizing its windows cannot cost a reading
+#more viewers can watch the run: python live_viewer.py NAME --plot timestamp "Current (A)"
+shared = None
+if not headless:
+    shared = shm_ring.SharedRingBuffer()
+    print(F'live readings in shared memory {shared.name}')
+    viewers = [live_viewer.launch(shared.name, [("Voltage (V)", "Current (A)"), ("timestamp", "Current (A)")], frame_rate = frame_rate)]
 
-vc.on_launch("voltage (V)", "current (mA)")
-tc.on_launch("time (s)", "current (mA)")
+#generates data on fixed deadlines in a background thread, plotting cannot slow it down
+#every reading is streamed to disk as it comes in, nothing is lost if the run is interrupted
+level = F'{voltage_level}volt'
+metadata = dict(SMU.get_info(), NPLC = NPLC, wait_time = wait_time, speed_profile = profile, level = level)
+data_file = F'{datetime.date.today().strftime("%Y_%m_%d")}_CP_{level}.smu'
+writer = streamfile.StreamWriter(data_file, metadata = metadata)
+#memory-mapped copy with a min/max pyramid, RAM use stays flat however long the run
+store = mmapstore.MmapStore(F'{datetime.date.today().strftime("%Y_%m_%d")}_CP_{level}_store', mode = 'w')
+#charge passed and stop conditions, checked on every reading
+stop_conditions = []
+if charge_target is not None:
+    stop_conditions.append(online_analysis.ChargeTarget(charge_target))
+if current_plateau is not None:
+    stop_conditions.append(online_analysis.Plateau("Current (A)", current_plateau))
+analysis = online_analysis.OnlineAnalysis(stop_conditions)
+sampler = acquisition.AdaptiveSampler(min_interval, max_interval, dI_dt = dI_dt, I_residual = I_residual) if adaptive else None
+#each reading is armed with :INIT and fetched when the SMU reports it complete, the disk writes happen in between
+acq = acquisition.AcquisitionThread(SMU.arm, min_interval if adaptive else wait_time, num_readings = None if adaptive else num_readings - 1, sinks = [writer, store] + ([shared] if shared is not None else []), finish = SMU.fetch_data, analysis = analysis,
+                                    sampler = sampler, duration = measurement_time if adaptive else None)
+acq.start()
+try:
+    #joined in short steps so Ctrl-C still gets through
+    while acq.is_alive():
+        acq.join(0.5)
+    acq.check()
+finally:
+    acq.stop()
+    acq.join()
+    writer.close()
+    store.close()
+    if shared is not None:
+        live_viewer.release(shared, viewers)
+    SMU.turn_off()
+print(acq.clock.stats())
 
-#creates lists to store data
-currents = []
-times = []
-voltages = []
+times = store.column("timestamp")
+currents = store.column("Current (A)")
+voltages = store.column("Voltage (V)")
 
-#generates data and accounts for time lag
-for i in range(1,num_readings):
-    time_1 = time.time()
-    
-    I,V = SMU.single_Vmeas()
-    currents.append(I)
-    voltages.append(V)
-    times.append(time.time()-time0)
-    vc.on_running(voltages, currents)
-    tc.on_running(times, currents)
-    
-    time_2 = time.time()
-    time_error = time_2 - time_1
-    
-    if time_error < wait_time:
-        time.sleep(wait_time - time_error)
-    else:
-        time.sleep(time_error)
-
-SMU.turn_off()
-
-#stores data and prints a figure displaying current vs. time
-tc.on_completion("CP", F'{voltage_level}volt', voltages, currents, times, currents)
\ No newline at end of file
+#prints a figure displaying current vs. time
+if not headless:
+    tc = K2401.LivePlotOG()
+    tc.on_launch("time (s)", "current (A)")
+    tc.extend(times, currents)
+    tc.on_running()
+    tc.on_completion("CP", level, voltages, currents, times, currents, save_data = False)
+print(F'{analysis.charge:.6g} C passed in {analysis.summary()["duration (s)"]:.1f} s')
+if analysis.stopped:
+    print(F'stopped early: {analysis.stop_reason} at {analysis.stop_time:.1f} s')
+if export_csv:
+    streamfile.export_csv(data_file)
+if SMU.instrumentation is not None:
+    SMU.instrumentation.save_summary(data_file.replace('.smu', '_io.txt'))
+    print(SMU.instrumentation.summary())
\ No newline at end of file
@@ -0,0 +1,235 @@
+#analyzes an archive of cyclic voltammetry CSV files in parallel
+#python cv_analysis.py DIRECTORY [--out DIRECTORY] [--workers N] [--smooth N] [--full]
+
+import os
+import re
+import csv
+import json
+import glob
+import argparse
+import concurrent.futures
+import numpy as np
+
+# files written by DynamicUpdateCV.on_completion: voltage, current, ex. 2023_06_30_cyclic_voltammetry_data_0-4_v_0.1_v_per_s.csv
+CV_FILE_PATTERN = "*cyclic_voltammetry_data_*.csv"
+SCAN_RATE_PATTERN = re.compile(r"_([0-9.eE+-]+)_v_per_s")
+
+SUMMARY_COLUMNS = ("file", "scan_rate", "cycle", "n_points", "Epa", "Ipa", "Epc", "Ipc", "dEp", "E_half",
+                   "charge", "anodic_charge", "cathodic_charge")
+
+def load_cv(path):
+    '''
+    Returns (voltages, currents, scan_rate) from a CV file, scan_rate (V/s) is read from the file name, None if it is not there.
+    '''
+    data = np.loadtxt(path, delimiter = ",", ndmin = 2)
+    match = SCAN_RATE_PATTERN.search(os.path.basename(path))
+    scan_rate = float(match.group(1)) if match else None
+    return data[:, 0], data[:, 1], scan_rate
+
+def segment(voltages):
+    '''
+    Splits a CV into sweeps of one direction and cycles of two sweeps.
+
+    Returns
+    -------
+    direction : numpy array
+        +1 or -1 per point, the direction of the sweep the point belongs to
+    sweep : numpy array
+        sweep number per point, from 0
+    cycle : numpy array
+        cycle number per point, from 0
+    '''
+    step = np.sign(np.diff(voltages))
+    moving = np.flatnonzero(step)
+    if len(moving) == 0:
+        zeros = np.zeros(len(voltages), dtype = int)
+        return zeros + 1, zeros, zeros
+    # a step where the voltage did not change keeps the direction of the step before it
+    last = np.zeros(len(step), dtype = int)
+    last[moving] = moving
+    last[:moving[0]] = moving[0]
+    np.maximum.accumulate(last, out = last)
+    step = step[last].astype(int)
+    # each point takes the direction of the step leading to it, so a vertex ends its sweep
+    direction = np.concatenate((step[:1], step))
+    sweep = np.concatenate(([0], np.cumsum(direction[1:] != direction[:-1])))
+    return direction, sweep, sweep//2
+
+def smooth(values, window):
+    '''
+    moving average over window points, same length, for peak finding on noisy currents
+    '''
+    if window <= 1 or len(values) < window:
+        return values
+    kernel = np.ones(window)/window
+    padded = np.pad(values, (window//2, window - 1 - window//2), mode = "edge")
+    return np.convolve(padded, kernel, mode = "valid")
+
+def analyze_cycles(voltages, currents, scan_rate = None, smooth_window = 5):
+    '''
+    Finds the peaks and charge of each cycle of a CV.
+
+    The anodic peak is the highest current of the rising sweep, the cathodic peak the lowest of the falling sweep.
+    A peak on the first or last point of its sweep is a vertex, not a peak, and is left as nan.
+    Charge needs the scan rate, which sets the time between points.
+
+    Returns
+    -------
+    rows : list of dict
+        one per cycle, keys are SUMMARY_COLUMNS except "file" and "scan_rate"
+    '''
+    voltages = np.asarray(voltages, dtype = float)
+    currents = np.asarray(currents, dtype = float)
+    direction, sweep, cycle = segment(voltages)
+    filtered = smooth(currents, smooth_window)
+
+    # peak of every sweep at once: sort by sweep, then by signed current, and take the first of each sweep
+    order = np.lexsort((-filtered*direction, sweep))
+    firsts = np.concatenate(([0], np.flatnonzero(np.diff(sweep[order])) + 1))
+    peaks = order[firsts]
+    sweep_starts = np.concatenate(([0], np.flatnonzero(np.diff(sweep)) + 1))
+    sweep_ends = np.concatenate((sweep_starts[1:], [len(sweep)])) - 1
+    at_vertex = (peaks == sweep_ends) | (peaks == sweep_starts)
+
+    # charge of every point's step, trapezoidal, then summed per cycle
+    if scan_rate:
+        dt = np.abs(np.diff(voltages))/scan_rate
+        step_charge = 0.5*(currents[1:] + currents[:-1])*dt
+        step_cycle = cycle[1:]
+        n_cycles = cycle[-1] + 1
+        charge = np.bincount(step_cycle, weights = step_charge, minlength = n_cycles)
+        anodic = np.bincount(step_cycle, weights = np.clip(step_charge, 0, None), minlength = n_cycles)
+        cathodic = np.bincount(step_cycle, weights = np.clip(step_charge, None, 0), minlength = n_cycles)
+    n_points = np.bincount(cycle)
+
+    rows = []
+    for c in range(cycle[-1] + 1):
+        row = {"cycle": c + 1, "n_points": int(n_points[c])}
+        row["Epa"] = row["Ipa"] = row["Epc"] = row["Ipc"] = np.nan
+        for s in range(2*c, min(2*c + 2, len(peaks))):
+            if at_vertex[s]:
+                continue
+            p = peaks[s]
+            if direction[p] > 0:
+                row["Epa"], row["Ipa"] = voltages[p], currents[p]
+            else:
+                row["Epc"], row["Ipc"] = voltages[p], currents[p]
+        row["dEp"] = row["Epa"] - row["Epc"]
+        row["E_half"] = (row["Epa"] + row["Epc"])/2
+        row["charge"] = charge[c] if scan_rate else np.nan
+        row["anodic_charge"] = anodic[c] if scan_rate else np.nan
+        row["cathodic_charge"] = cathodic[c] if scan_rate else np.nan
+        rows.append(row)
+    return rows
+
+def analyze_file(path, smooth_window = 5, scan_rate = None):
+    '''
+    Returns (path, rows, error) for one file, error is None or a message. Runs in the worker processes.
+    '''
+    try:
+        voltages, currents, file_scan_rate = load_cv(path)
+        rate = file_scan_rate if file_scan_rate is not None else scan_rate
+        rows = analyze_cycles(voltages, currents, rate, smooth_window)
+        for row in rows:
+            row["file"] = os.path.basename(path)
+            row["scan_rate"] = rate if rate is not None else np.nan
+        return path, rows, None
+    except Exception as e:
+        return path, [], "{}: {}".format(type(e).__name__, e)
+
+def analyze_archive(paths, out_directory, workers = None, smooth_window = 5, scan_rate = None, full = False):
+    '''
+    Analyzes every file in paths in a process pool and writes, in out_directory:
+        cv_summary.csv - one row per cycle of every file, SUMMARY_COLUMNS
+        cv_index.json - for each file: its size and modification time, its rows in cv_summary.csv
+                        ([first, last + 1], counted after the header) and any error
+    Files whose size and modification time match the previous index are not analyzed again, unless full.
+
+    Returns
+    -------
+    index : dict
+    '''
+    os.makedirs(out_directory, exist_ok = True)
+    summary_path = os.path.join(out_directory, "cv_summary.csv")
+    index_path = os.path.join(out_directory, "cv_index.json")
+
+    old_index = {}
+    old_rows = []
+    if not full and os.path.exists(index_path) and os.path.exists(summary_path):
+        with open(index_path) as f:
+            old_index = json.load(f)
+        with open(summary_path, newline = "") as f:
+            old_rows = list(csv.DictReader(f))
+
+    results = {}
+    todo = []
+    for path in paths:
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        entry = old_index.get(key)
+        if entry is not None and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+            start, stop = entry["rows"]
+            results[key] = (old_rows[start:stop], entry.get("error"), stat)
+        else:
+            todo.append((key, stat))
+
+    if todo:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as pool:
+            stats = dict(todo)
+            jobs = pool.map(analyze_file, [key for key, stat in todo], [smooth_window]*len(todo), [scan_rate]*len(todo),
+                            chunksize = max(1, len(todo)//(4*(workers or os.cpu_count() or 1))))
+            for key, rows, error in jobs:
+                results[key] = (rows, error, stats[key])
+
+    index = {}
+    with open(summary_path, "w", newline = "") as f:
+        writer = csv.DictWriter(f, fieldnames = SUMMARY_COLUMNS)
+        writer.writeheader()
+        n_rows = 0
+        for key in sorted(results):
+            rows, error, stat = results[key]
+            writer.writerows(rows)
+            index[key] = {"size": stat.st_size, "mtime": stat.st_mtime, "rows": [n_rows, n_rows + len(rows)], "error": error}
+            n_rows += len(rows)
+    with open(index_path, "w") as f:
+        json.dump(index, f, indent = 1)
+    return index
+
+def lookup(out_directory, file_name):
+    '''
+    Returns the summary rows of one file using the index, without reading the whole table.
+    '''
+    with open(os.path.join(out_directory, "cv_index.json")) as f:
+        index = json.load(f)
+    for key, entry in index.items():
+        if os.path.basename(key) == file_name or key == os.path.abspath(file_name):
+            start, stop = entry["rows"]
+            rows = []
+            with open(os.path.join(out_directory, "cv_summary.csv"), newline = "") as f:
+                reader = csv.DictReader(f)
+                for i, row in enumerate(reader):
+                    if i >= stop:
+                        break
+                    if i >= start:
+                        rows.append(row)
+            return rows
+    raise(KeyError("{} is not in the index".format(file_name)))
+
+#%%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Peaks, peak separation and charge of every cycle in a CV archive")
+    parser.add_argument("directory", help = "folder searched recursively for CV files")
+    parser.add_argument("--out", default = None, help = "folder for cv_summary.csv and cv_index.json, default the archive folder")
+    parser.add_argument("--pattern", default = CV_FILE_PATTERN)
+    parser.add_argument("--workers", type = int, default = None, help = "worker processes, default one per CPU")
+    parser.add_argument("--smooth", type = int, default = 5, help = "moving average window (points) for peak finding")
+    parser.add_argument("--scan-rate", type = float, default = None, help = "V/s, for files without it in their name")
+    parser.add_argument("--full", action = "store_true", help = "analyze every file again, not only new or changed ones")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.directory, "**", args.pattern), recursive = True))
+    index = analyze_archive(paths, args.out or args.directory, args.workers, args.smooth, args.scan_rate, args.full)
+    errors = {key: entry["error"] for key, entry in index.items() if entry["error"]}
+    print("{} files, {} cycles, {} errors".format(len(index), sum(e["rows"][1] - e["rows"][0] for e in index.values()), len(errors)))
+    for key, error in errors.items():
+        print(key, error)
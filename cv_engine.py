@@ -0,0 +1,182 @@
+import numpy as np
+import Keithley2401_voltmeter_063023 as K2401
+import waveforms
+
+class ListSweep():
+    '''
+    Base of the techniques run from the SMU's source lists, each point started by the arm layer timer.
+
+    A segment is one list: a dict with "levels", "interval" and "source_delay". _run_segments starts each segment,
+    then hands back the one before while it sweeps, so the host's work overlaps the SMU's.
+    Subclasses send the setup of a segment in _start_segment and leave the SMU at _final_level in _finish.
+
+    Between two lists the SMU sources its fixed level while the host reads one list and sets up the next.
+    Each list is started with the fixed level at the first level of the list after it, so in that gap
+    the output is already where the next list begins; the level changes at the end of a list, not at
+    the start of the next. It is sent with the :READ? (see initiate_list), a command sent while the list
+    runs would interrupt the read.
+    '''
+
+    def __init__(self, smu, NPLC = 1, V_range = 20, V_compliance = 11, I_compliance = 1e-1, source_delay = 0):
+        self.smu = smu
+        self.NPLC = NPLC
+        self.V_range = V_range
+        self.V_compliance = V_compliance
+        self.I_compliance = I_compliance
+        self.source_delay = source_delay
+        self.segments = []
+
+    # function the sweep measures, for its auto range
+    measured = "CURR"
+
+    def min_interval(self, source_delay = None):
+        '''
+        Returns the shortest time between points (seconds) the SMU can keep up with,
+        from the driver's timing model at its line frequency. source_delay defaults to the sweep's own.
+        Autozero, display and auto range are as the SMU is set now, apply_speed_profile before program to change them.
+        '''
+        if source_delay is None:
+            source_delay = self.source_delay
+        profile = self.smu.current_speed_profile(self.NPLC, source_delay, measured = self.measured)
+        return max(self.smu.estimate_point_time(profile), K2401.SMU_TIMER_MIN)
+
+    def _start_segment(self, segment, level_after):
+        # level_after is the fixed level to hold once the list is done
+        raise(NotImplementedError)
+
+    def _final_level(self):
+        # where the output is left at the end
+        raise(NotImplementedError)
+
+    def _finish(self):
+        raise(NotImplementedError)
+
+    def _read_segment(self, segment):
+        # the read waits for the whole list, give the bus enough time
+        resource = self.smu.visa_resource
+        old_timeout = getattr(resource, "timeout", None)
+        if old_timeout is not None:
+            resource.timeout = max(old_timeout, 1000*(len(segment["levels"])*segment["interval"] + 5))
+        try:
+            # read_data would hand a one point list back as a (current, voltage) tuple
+            return self.smu._columns(self.smu._read_readings(len(segment["levels"])))
+        finally:
+            if old_timeout is not None:
+                resource.timeout = old_timeout
+
+    def _run_segments(self, segments):
+        '''
+        Sweeps segments in order.
+
+        Yields
+        ------
+        segment, data : dict, dict
+            each segment with its readings as read_data returns a list, once the next one is sweeping.
+            The last comes after _finish, so do not talk to the SMU until the generator is exhausted.
+        '''
+        pending = None
+        for index, segment in enumerate(segments):
+            level_after = segments[index + 1]["levels"][0] if index + 1 < len(segments) else self._final_level()
+            self._start_segment(segment, level_after)
+            if pending is not None:
+                yield pending
+                pending = None
+            pending = (segment, self._read_segment(segment))
+        self._finish()
+        yield pending
+
+class CVEngine(ListSweep):
+    '''
+    Cyclic voltammetry run on the SMU's own clock.
+
+    The waveform is uploaded as source lists and each point is started by the arm layer timer,
+    so the scan rate does not depend on how fast Python, the bus or the plots are.
+    A cycle longer than one source list is split into segments; while a segment sweeps,
+    the previous cycle is handed back to the caller for plotting or saving.
+    '''
+
+    def __init__(self, smu, NPLC = 1, V_range = 20, V_compliance = 11, I_compliance = 1e-1, source_delay = 0):
+        ListSweep.__init__(self, smu, NPLC, V_range, V_compliance, I_compliance, source_delay)
+        self.interval = None
+        self.cycles = 0
+
+    def program(self, initial_voltage, final_voltage, scan_rate, step = 0.01, cycles = 1):
+        '''
+        prepares the waveform: initial_voltage -> final_voltage -> initial_voltage, cycles times
+
+        Parameters
+        ----------
+        initial_voltage, final_voltage : float
+            vertices (V), both are hit exactly
+        scan_rate : float
+            V/s
+        step : float
+            largest voltage step between points (V), rounded down so the vertices fit
+        cycles : int
+            number of cycles
+
+        Returns
+        -------
+        interval : float
+            time between points (s)
+        '''
+        if final_voltage == initial_voltage or scan_rate <= 0 or cycles < 1:
+            raise(ValueError("Invalid cyclic voltammetry settings"))
+        # each vertex appears once per cycle
+        cycle, actual_step = waveforms.triangle_cycle(initial_voltage, final_voltage, step)
+        interval = actual_step/scan_rate
+        if interval < self.min_interval():
+            raise(ValueError("Scan rate too fast: {:.3g} s per point, the SMU needs at least {:.3g} s at NPLC {}".format(interval, self.min_interval(), self.NPLC)))
+        K2401.validate_levels(cycle, self.V_compliance, "voltage list")
+
+        n_segments = int(np.ceil(len(cycle)/K2401.SMU_LIST_MAX_LENGTH))
+        self.segments = [{"levels": levels, "interval": interval, "source_delay": self.source_delay} for levels in np.array_split(cycle, n_segments)]
+        self.interval = interval
+        self.cycles = cycles
+        return interval
+
+    def _start_segment(self, segment, level_after):
+        # with an unchanged single segment only the :READ? goes over the bus, the list is cached
+        self.smu.setup_timeseries_Imeas(NPLC = self.NPLC, V_range = self.V_range, V_compliance = self.V_compliance, I_compliance = self.I_compliance,
+                                        voltage_list = segment["levels"], interval = segment["interval"], source_delay = segment["source_delay"])
+        self.smu.initiate_list(level_after)
+
+    def _final_level(self):
+        # end where the sweep started
+        return self.segments[0]["levels"][0]
+
+    def _finish(self):
+        self.smu.setup_single_Imeas(NPLC = self.NPLC, V_range = self.V_range, V_compliance = self.V_compliance, I_compliance = self.I_compliance,
+                                    voltage_level = self._final_level())
+
+    def run(self):
+        '''
+        Runs the programmed cycles. Call turn_on first.
+
+        Yields
+        ------
+        cycle_data : dict
+            keys: "cycle", "timestamp", "Set voltage (V)", "Voltage (V)", "Current (A)"
+            values: cycle number and numpy arrays, timestamps are from the SMU clock
+
+        The SMU is already running the next cycle when a cycle is yielded,
+        so do not talk to it until the generator is exhausted.
+        '''
+        if not self.segments:
+            raise(RuntimeError("Call program before run"))
+
+        cycle = 0
+        parts = []
+        for segment, data in self._run_segments(self.segments*self.cycles):
+            parts.append(data)
+            if len(parts) < len(self.segments):
+                continue
+            cycle += 1
+            cycle_data = {}
+            cycle_data["cycle"] = cycle
+            cycle_data["timestamp"] = np.concatenate([p["timestamp"] for p in parts]).astype(np.float64)
+            cycle_data["Set voltage (V)"] = np.concatenate([s["levels"] for s in self.segments])
+            cycle_data["Voltage (V)"] = np.concatenate([p["Voltage (V)"] for p in parts]).astype(np.float64)
+            cycle_data["Current (A)"] = np.concatenate([p["Current (A)"] for p in parts]).astype(np.float64)
+            parts = []
+            yield cycle_data
@@ -1,75 +1,84 @@
-#set voltage range and scan rate, read current at two data points per second resolution 
+#set voltage range and scan rate, read current with the points timed by the SMU
 
 #initial stetup
 import sys
 sys.path.append(r'Desktop\SMU_files\\')
 import Keithley2401_voltmeter_063023 as K2401
-import pyvisa
+import cv_engine
+import instrumentation
+import session_recorder
+import shm_ring
+import live_viewer
 import time
 import datetime
 import csv
 import numpy as np
-import matplotlib.pyplot as plt
 
-rm = pyvisa.ResourceManager()
-SMU_RM = rm.open_resource('GPIB0::3::INSTR')
+#set SMU_RECORD=FILE to record the session, see session_recorder.py
+profile_io = False #count and time every SMU command, the summary is saved next to the data
+SMU_RM = session_recorder.open_resource('GPIB0::3::INSTR')
 SMU = K2401.Keithley2401(SMU_RM)
+#attached before anything is sent, so the setup is counted too
+if profile_io:
+    SMU.instrumentation = instrumentation.Instrumentation()
 SMU.initial_setup()
-plt.ion()
+SMU.set_data_format("real64")
 
 #CHANGE THESE VALUES BEFORE RUNNING THE SCRIPT
 initial_voltage = 0 #sets initial voltage (V)
 final_voltage = 4 #sets final voltage (V)
 scan_rate = 0.1 #sets a scan rate (V/s)
+step = 0.01 #sets the voltage step between points (V)
 cycles = 5 #sets number of cycles
-
-#generates list of voltage values based on range and scan rate
-v = K2401.vlist()
-v_range = v.generate(initial_voltage = initial_voltage, final_voltage = final_voltage, scan_rate = scan_rate, cycles = cycles)
+headless = False #only save the data: no plot windows, matplotlib is never loaded and no display is needed
 
 NPLC = 1
 V_range = 20 # voltage range
 V_compliance = 11 # max voltage
 I_compliance = 1e-1 # max current
-voltage_level = initial_voltage #sets constant voltage initially
-init_wait = 0.25 # does not do anything yet
-SMU.setup_single_Imeas(NPLC = NPLC, V_range = V_range, V_compliance = V_compliance, I_compliance = I_compliance, voltage_level = voltage_level, init_wait = init_wait)
-SMU.turn_on()
 
-#initializes dynamically updating plot and creates lists to store data
-vc = K2401.DynamicUpdateCV()
+#uploads the voltage program, the SMU times every point itself
+cv = cv_engine.CVEngine(SMU, NPLC = NPLC, V_range = V_range, V_compliance = V_compliance, I_compliance = I_compliance)
+interval = cv.program(initial_voltage = initial_voltage, final_voltage = final_voltage, scan_rate = scan_rate, step = step, cycles = cycles)
+print(F'{interval*1000:.1f} ms per point')
+
+SMU.setup_single_Imeas(NPLC = NPLC, V_range = V_range, V_compliance = V_compliance, I_compliance = I_compliance, voltage_level = initial_voltage)
+SMU.turn_on()
 
-vc.on_launch("voltage (V)", "current (mA)", initial_voltage * 0.75, final_voltage * 1.75)
+#readings are published in shared memory and plotted by a viewer process, moving or resizing its window cannot hold up the SMU
+shared = None
+if not headless:
+    shared = shm_ring.SharedRingBuffer()
+    viewers = [live_viewer.launch(shared.name, [("Voltage (V)", "Current (A)")], xlim = (initial_voltage * 0.75, final_voltage * 1.75))]
 
+#creates lists to store data
 voltages = []
 currents = []
 times = []
 
-time0 = time.time()
-
-#iterates through list of voltage values and generates data
-for voltage in v_range:
-            
-    time_1 = time.time()
-        
-    SMU.write(":SOUR:VOLT:LEV {}".format(voltage))
-    I, V = SMU.single_Imeas()
-    currents.append(I)
-    voltages.append(V)
-    vc.on_running(voltages, currents)
-    
-    time_2 = time.time()
-    time_error = time_2 - time_1
-            
-    if time_error < 1:
-        time.sleep(1 - time_error)
-    else:
-        time.sleep(time_error)
-
-    times.append(time.time() - time0)
-        
-    
-SMU.turn_off()
+#each cycle is published while the SMU runs the next one
+try:
+    for cycle_data in cv.run():
+        voltages.extend(cycle_data["Voltage (V)"])
+        currents.extend(cycle_data["Current (A)"])
+        times.extend(cycle_data["timestamp"])
+        if shared is not None:
+            shared.write_rows(np.column_stack((cycle_data["timestamp"], cycle_data["Current (A)"], cycle_data["Voltage (V)"])))
+finally:
+    if shared is not None:
+        live_viewer.release(shared, viewers)
+    SMU.turn_off()
 
 #stores data and prints a figure displaying current vs. voltage
-vc.on_completion('cyclic_voltammogram', F'{initial_voltage}-{final_voltage}_v', F'{scan_rate}_v_per_s', voltages, currents)
\ No newline at end of file
+if headless:
+    #same file as LivePlotCV.on_completion writes
+    np.savetxt(F'{datetime.date.today().strftime("%Y_%m_%d")}_cyclic_voltammetry_data_{initial_voltage}-{final_voltage}_v_{scan_rate}_v_per_s.csv', np.c_[voltages, currents], delimiter = ',')
+else:
+    vc = K2401.LivePlotCV()
+    vc.on_launch("voltage (V)", "current (A)", initial_voltage * 0.75, final_voltage * 1.75)
+    vc.extend(voltages, currents)
+    vc.on_running()
+    vc.on_completion('cyclic_voltammogram', F'{initial_voltage}-{final_voltage}_v', F'{scan_rate}_v_per_s', voltages, currents)
+if SMU.instrumentation is not None:
+    SMU.instrumentation.save_summary(F'{datetime.date.today().strftime("%Y_%m_%d")}_cyclic_voltammogram_{scan_rate}_v_per_s_io.txt')
+    print(SMU.instrumentation.summary())
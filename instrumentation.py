@@ -0,0 +1,185 @@
+import sys
+import json
+import math
+import time
+import threading
+import numpy as np
+
+# latency histogram: BINS_PER_DECADE log-spaced bins from HISTOGRAM_MIN to HISTOGRAM_MAX seconds,
+# anything outside goes in the first or last bin
+HISTOGRAM_MIN = 1e-6
+HISTOGRAM_MAX = 100.0
+BINS_PER_DECADE = 10
+N_BINS = int(round(BINS_PER_DECADE*math.log10(HISTOGRAM_MAX/HISTOGRAM_MIN)))
+BIN_EDGES = HISTOGRAM_MIN*10**(np.arange(N_BINS + 1)/BINS_PER_DECADE)
+
+class CommandStats():
+    '''
+    count, time, bytes and latency histogram of one kind of bus transaction
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.histogram = np.zeros(N_BINS, dtype = np.int64)
+
+    def add(self, seconds, bytes_out, bytes_in):
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+        b = int(BINS_PER_DECADE*math.log10(seconds/HISTOGRAM_MIN)) if seconds > HISTOGRAM_MIN else 0
+        self.histogram[min(b, N_BINS - 1)] += 1
+
+    def percentile(self, q):
+        '''
+        upper edge of the histogram bin holding the q-th percentile (seconds)
+        '''
+        if self.count == 0:
+            return 0.0
+        b = int(np.searchsorted(np.cumsum(self.histogram), q/100*self.count))
+        return min(float(BIN_EDGES[min(b, N_BINS - 1) + 1]), self.max)
+
+    def to_dict(self):
+        out = {}
+        out["count"] = self.count
+        out["total"] = self.total
+        out["mean"] = self.total/self.count if self.count else 0.0
+        out["min"] = self.min if self.count else 0.0
+        out["max"] = self.max
+        out["p50"] = self.percentile(50)
+        out["p90"] = self.percentile(90)
+        out["p99"] = self.percentile(99)
+        out["bytes_out"] = self.bytes_out
+        out["bytes_in"] = self.bytes_in
+        # sparse, only the bins in use: {lower edge (s): count}
+        out["histogram"] = {"{:.3g}".format(BIN_EDGES[b]): int(n) for b, n in enumerate(self.histogram) if n}
+        return out
+
+class Instrumentation():
+    '''
+    Counts and times every write, read and query of the Keithley2401s it is attached to:
+        SMU.instrumentation = instrumentation.Instrumentation()
+    With the default SMU.instrumentation = None the cost is one attribute check per call.
+
+    Transactions are keyed by operation and SCPI header, arguments left out, ex. "write :SOUR:CURR:LEV"
+    or "read :READ?" (a read is keyed by the command written before it). Time is also attributed
+    to the outermost Keithley2401 method on the call stack, ex. setup_single_Vmeas or fetch_data.
+    One instance can be shared by several SMUs and threads.
+    '''
+
+    def __init__(self, attribute_callers = True):
+        self.attribute_callers = attribute_callers
+        self.commands = {}
+        self.callers = {}
+        self.last_header = {}
+        self.lock = threading.Lock()
+        self.t_start = time.perf_counter()
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}
+            self.callers = {}
+            self.t_start = time.perf_counter()
+
+    def record(self, smu, operation, command, seconds, bytes_out = 0, bytes_in = 0):
+        '''
+        adds one transaction, called by Keithley2401's bus methods
+
+        Parameters
+        ----------
+        smu : Keithley2401
+        operation : str
+            "write", "read" or "query"
+        command : str or None
+            what was written, None for a read
+        seconds : float
+            time the transaction took
+        bytes_out, bytes_in : int
+            bytes written and read
+        '''
+        caller = self._caller(smu) if self.attribute_callers else None
+        with self.lock:
+            if command is None:
+                header = self.last_header.get(id(smu), "")
+            else:
+                header = scpi_header(command)
+                self.last_header[id(smu)] = header
+            key = "{} {}".format(operation, header)
+            if key not in self.commands:
+                self.commands[key] = CommandStats()
+            self.commands[key].add(seconds, bytes_out, bytes_in)
+            if caller is not None:
+                if caller not in self.callers:
+                    self.callers[caller] = CommandStats()
+                self.callers[caller].add(seconds, bytes_out, bytes_in)
+
+    def _caller(self, smu):
+        # starts at the bus method and climbs while the frames belong to the same SMU
+        frame = sys._getframe(2)
+        caller = None
+        while frame is not None and frame.f_locals.get("self") is smu:
+            caller = frame.f_code.co_name
+            frame = frame.f_back
+        return caller
+
+    def to_dict(self):
+        '''
+        Returns everything collected.
+
+        Returns
+        -------
+        out : dict
+            keys: "duration" (s since start or reset), "bus_time" (s spent in transactions),
+            "commands" and "callers", each mapping a name to CommandStats.to_dict()
+        '''
+        with self.lock:
+            out = {}
+            out["duration"] = time.perf_counter() - self.t_start
+            out["bus_time"] = sum(stats.total for stats in self.commands.values())
+            out["commands"] = {key: stats.to_dict() for key, stats in self.commands.items()}
+            out["callers"] = {key: stats.to_dict() for key, stats in self.callers.items()}
+            return out
+
+    def save_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent = 2)
+
+    def summary(self, top = 15):
+        '''
+        Returns a text table of where the bus time went, by calling method and by command.
+        '''
+        data = self.to_dict()
+        lines = ["{:.3f} s run, {:.3f} s on the bus ({:.0%})".format(data["duration"], data["bus_time"],
+                                                                      data["bus_time"]/data["duration"] if data["duration"] else 0)]
+        for title, table in (("by method", data["callers"]), ("by command", data["commands"])):
+            if not table:
+                continue
+            lines.append("")
+            width = max(len(name) for name in table)
+            lines.append("{}  {:>7} {:>10} {:>10} {:>10} {:>10} {:>10}".format(title.ljust(width), "calls", "total ms", "mean us", "p99 us", "bytes out", "bytes in"))
+            ranked = sorted(table.items(), key = lambda item: item[1]["total"], reverse = True)
+            for name, stats in ranked[:top]:
+                lines.append("{}  {:7d} {:10.2f} {:10.1f} {:10.1f} {:10d} {:10d}".format(name.ljust(width), stats["count"], 1e3*stats["total"],
+                                                                                         1e6*stats["mean"], 1e6*stats["p99"], stats["bytes_out"], stats["bytes_in"]))
+        return "\n".join(lines)
+
+    def save_summary(self, path):
+        '''
+        writes the summary to path and the full statistics next to it, with a .json extension
+        '''
+        with open(path, "w") as f:
+            f.write(self.summary(top = 1000) + "\n")
+        self.save_json(path.rsplit(".", 1)[0] + ".json")
+
+def scpi_header(command):
+    '''
+    a command with its arguments left out, ex. ":SOUR:CURR:LEV 0.001;:OUTP ON" -> ":SOUR:CURR:LEV;:OUTP"
+    '''
+    return ";".join(part.strip().split(" ", 1)[0] for part in command.split(";") if part.strip())
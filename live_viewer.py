@@ -0,0 +1,100 @@
+#live plots of a run in their own process, reading the readings the acquisition publishes in shared memory
+#python live_viewer.py NAME [--plot X Y]... [--xlim MIN MAX] [--frame-rate 10]
+#ex. python live_viewer.py psm_1234 --plot timestamp "Voltage (V)" --plot "Current (A)" "Voltage (V)"
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+def launch(name, plots, xlim = None, frame_rate = 10):
+    '''
+    Starts a viewer process on the shm_ring.SharedRingBuffer called name, with one window per (x column, y column) in plots.
+    The windows can be moved, resized or closed at any time without touching the acquisition,
+    and several viewers can watch the same run.
+
+    Returns
+    -------
+    process : subprocess.Popen
+    '''
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "live_viewer.py"), name, "--frame-rate", str(frame_rate)]
+    for x, y in plots:
+        command += ["--plot", x, y]
+    if xlim is not None:
+        command += ["--xlim", str(xlim[0]), str(xlim[1])]
+    return subprocess.Popen(command)
+
+def release(ring, viewers, timeout = 10.0):
+    '''
+    Closes ring once the viewers started with launch have attached, so a viewer that is still starting
+    does not miss a short run. A viewer that exited, ex. no display, is not waited for.
+    '''
+    t_end = time.perf_counter() + timeout
+    while ring.wait_for_readers(len(viewers), 0.05) < len(viewers) and time.perf_counter() < t_end:
+        if any(viewer.poll() is not None for viewer in viewers):
+            break
+    ring.close()
+
+def run_viewer(name, plots, xlim = None, frame_rate = 10):
+    '''
+    Plots the readings of the SharedRingBuffer called name as they arrive, until the run is over,
+    then leaves the windows open until they are closed.
+    '''
+    # only the viewer process pays for matplotlib
+    import matplotlib.pyplot as plt
+    import plotting
+    import scheduler
+    import shm_ring
+
+    reader = shm_ring.SharedRingReader(name)
+    if hasattr(os, "nice"):
+        # the acquisition comes first when the CPU is busy
+        os.nice(5)
+    plt.ion()
+    windows = []
+    for x, y in plots:
+        plot = plotting.LivePlot()
+        min_x, max_x = xlim if xlim is not None else (None, None)
+        plot.on_launch(x, y, min_x, max_x)
+        windows.append((plot, reader.columns.index(x), reader.columns.index(y)))
+
+    frames = scheduler.DeadlineScheduler(1/frame_rate, policy = "skip")
+    try:
+        while plt.get_fignums():
+            frames.wait()
+            finished = reader.finished
+            rows = reader.read_new()
+            for plot, i_x, i_y in windows:
+                if not plt.fignum_exists(plot.figure.number):
+                    continue
+                if len(rows):
+                    plot.extend(rows[:, i_x], rows[:, i_y])
+                    plot.on_running()
+                else:
+                    # keeps the window responsive between readings
+                    plot.figure.canvas.flush_events()
+            # the flag is read before the rows, so the last rows are in by now
+            if finished:
+                break
+    finally:
+        dropped = reader.dropped
+        reader.close()
+    if dropped:
+        print("viewer {}: {} readings not plotted".format(name, dropped))
+    for plot, i_x, i_y in windows:
+        if plt.fignum_exists(plot.figure.number):
+            plot.finish()
+    plt.ioff()
+    plt.show()
+
+#%%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Live plots of an SMU run published in shared memory")
+    parser.add_argument("name", help = "shared memory name of the run's SharedRingBuffer")
+    parser.add_argument("--plot", nargs = 2, action = "append", metavar = ("X", "Y"), help = "columns for one window, repeat for more")
+    parser.add_argument("--xlim", nargs = 2, type = float, default = None, metavar = ("MIN", "MAX"))
+    parser.add_argument("--frame-rate", type = float, default = 10)
+    args = parser.parse_args()
+
+    run_viewer(args.name, args.plot or [("timestamp", "Voltage (V)")], args.xlim, args.frame_rate)
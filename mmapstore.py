@@ -0,0 +1,221 @@
+import os
+import sys
+import glob
+import json
+import numpy as np
+
+class GrowableArray():
+    '''
+    2D float64 array in a memory-mapped file that doubles its file when it fills up.
+    Only the pages in use are held in RAM, by the operating system.
+    '''
+
+    def __init__(self, path, width, n_rows = 0, capacity = 4096):
+        self.path = path
+        self.width = width
+        self.n_rows = n_rows
+        if os.path.exists(path):
+            capacity = max(capacity, os.path.getsize(path)//(8*width))
+        self._map(max(capacity, n_rows, 1))
+
+    def _map(self, capacity):
+        with open(self.path, "ab") as f:
+            if f.tell() < capacity*self.width*8:
+                f.truncate(capacity*self.width*8)
+        self.capacity = capacity
+        self.array = np.memmap(self.path, dtype = "<f8", mode = "r+", shape = (capacity, self.width))
+
+    def append(self, rows):
+        rows = np.asarray(rows, dtype = "<f8").reshape(-1, self.width)
+        if self.n_rows + len(rows) > self.capacity:
+            self.array.flush()
+            del self.array
+            self._map(max(2*self.capacity, self.n_rows + len(rows)))
+        self.array[self.n_rows:self.n_rows + len(rows)] = rows
+        self.n_rows += len(rows)
+
+    def view(self, start = 0, stop = None):
+        stop = self.n_rows if stop is None else min(stop, self.n_rows)
+        return self.array[start:stop]
+
+    def flush(self):
+        self.array.flush()
+
+class MmapStore():
+    '''
+    Keeps a run on disk as memory-mapped columns plus a min/max pyramid, so RAM use stays flat
+    however long the run is and any time window can be plotted without reading the whole run.
+
+    Level 0 holds every reading. Each bucket of level k holds the min and max of every column
+    over factor**k readings. The first column is the timestamp and must not decrease.
+
+    mode "a" reopens a store already in directory and appends to it, ex. to look at or continue a run,
+    mode "w" deletes it and starts a new run, as the scripts do.
+
+    The row counts are kept in meta.json, rewritten every meta_every rows and on flush,
+    so a run that crashes reopens with all but at most its last meta_every readings.
+    '''
+
+    def __init__(self, directory, columns = ("timestamp", "Current (A)", "Voltage (V)"), factor = 64, n_levels = 4, mode = "a", meta_every = 64):
+        if mode not in ("a", "w"):
+            raise(ValueError("Invalid mode: {}".format(mode)))
+        if meta_every < 1:
+            raise(ValueError("Invalid meta_every: {}".format(meta_every)))
+        os.makedirs(directory, exist_ok = True)
+        self.directory = directory
+        meta_path = os.path.join(directory, "meta.json")
+        if mode == "w":
+            # a second run under the same name would otherwise be appended to the first, timestamps going back to 0
+            for path in glob.glob(os.path.join(directory, "level*.f8")) + [meta_path]:
+                if os.path.exists(path):
+                    os.remove(path)
+        sizes = [0]*(n_levels + 1)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            columns, factor, sizes = meta["columns"], meta["factor"], meta["sizes"]
+        self.columns = tuple(columns)
+        self.factor = factor
+        self.meta_every = meta_every
+        n_columns = len(self.columns)
+        self.levels = [GrowableArray(os.path.join(directory, "level0.f8"), n_columns, sizes[0])]
+        # pyramid rows are [min of each column, max of each column]
+        for k in range(1, len(sizes)):
+            self.levels.append(GrowableArray(os.path.join(directory, "level{}.f8".format(k)), 2*n_columns, sizes[k]))
+
+    @property
+    def n_rows(self):
+        return self.levels[0].n_rows
+
+    def write_row(self, row):
+        '''
+        adds one reading, row holds one value per column
+        '''
+        self.levels[0].append(row)
+        # fill in every pyramid bucket this reading completes, at most one per level
+        n_columns = len(self.columns)
+        for k in range(1, len(self.levels)):
+            below = self.levels[k - 1]
+            if below.n_rows % self.factor:
+                break
+            block = below.view(below.n_rows - self.factor)
+            if k == 1:
+                self.levels[k].append(np.concatenate((block.min(axis = 0), block.max(axis = 0))))
+            else:
+                self.levels[k].append(np.concatenate((block[:, :n_columns].min(axis = 0), block[:, n_columns:].max(axis = 0))))
+        if self.n_rows % self.meta_every == 0:
+            self._write_meta()
+
+    def write_rows(self, rows):
+        for row in np.asarray(rows):
+            self.write_row(row)
+
+    def column(self, name):
+        '''
+        every reading of one column, as a memory-mapped view
+        '''
+        return self.levels[0].view()[:, self.columns.index(name)]
+
+    def _tail(self, k):
+        # min/max over the readings not yet in a complete bucket of level k
+        n_columns = len(self.columns)
+        lows = []
+        highs = []
+        for j in range(k):
+            done = self.levels[j + 1].n_rows*self.factor
+            rest = self.levels[j].view(done)
+            if len(rest) == 0:
+                continue
+            if j == 0:
+                lows.append(rest.min(axis = 0))
+                highs.append(rest.max(axis = 0))
+            else:
+                lows.append(rest[:, :n_columns].min(axis = 0))
+                highs.append(rest[:, n_columns:].max(axis = 0))
+        if not lows:
+            return None
+        return np.concatenate((np.min(lows, axis = 0), np.max(highs, axis = 0)))
+
+    def window(self, t_start = None, t_stop = None, max_points = 2000):
+        '''
+        Returns the readings between two timestamps, reduced to at most about max_points per column.
+
+        Parameters
+        ----------
+        t_start, t_stop : float or None
+            window in timestamp units, None for the start / end of the run
+        max_points : int
+            above this, whole buckets are returned as their min and max
+
+        Returns
+        -------
+        out : dict
+            keys: column names and "level" (pyramid level used, 0 for raw readings)
+            values: numpy arrays; above level 0 each bucket gives two values, its min then its max
+        '''
+        times = self.levels[0].view()[:, 0]
+        # binary search on the mapped timestamps only touches a few pages
+        i_start = 0 if t_start is None else int(np.searchsorted(times, t_start, side = "left"))
+        i_stop = len(times) if t_stop is None else int(np.searchsorted(times, t_stop, side = "right"))
+
+        k = 0
+        while k + 1 < len(self.levels) and (i_stop - i_start)/self.factor**k > max_points//2:
+            k += 1
+
+        out = {"level": k}
+        if k == 0:
+            rows = np.array(self.levels[0].view(i_start, i_stop))
+            for c, name in enumerate(self.columns):
+                out[name] = rows[:, c]
+            return out
+
+        size = self.factor**k
+        b_start = i_start//size
+        b_stop = -(-i_stop//size)
+        buckets = np.array(self.levels[k].view(b_start, b_stop))
+        if b_stop > self.levels[k].n_rows:
+            tail = self._tail(k)
+            if tail is not None:
+                buckets = np.vstack((buckets, tail))
+        n_columns = len(self.columns)
+        for c, name in enumerate(self.columns):
+            out[name] = np.stack((buckets[:, c], buckets[:, n_columns + c]), axis = 1).ravel()
+        return out
+
+    def _write_meta(self):
+        meta = {"columns": list(self.columns), "factor": self.factor, "sizes": [level.n_rows for level in self.levels]}
+        path = os.path.join(self.directory, "meta.json")
+        # replaced in one step, a crash while writing leaves the previous counts
+        with open(path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(path + ".tmp", path)
+
+    def flush(self):
+        for level in self.levels:
+            level.flush()
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+
+def plot_window(store, y_column, t_start = None, t_stop = None, ax = None):
+    '''
+    plots one column against time for a window of the run, reading only what is shown
+    '''
+    import matplotlib.pyplot as plt
+    if ax is None:
+        figure, ax = plt.subplots()
+    data = store.window(t_start, t_stop, max_points = 2*int(ax.bbox.width))
+    ax.plot(data[store.columns[0]], data[y_column])
+    ax.set_xlabel(store.columns[0])
+    ax.set_ylabel(y_column)
+    return ax
+
+#%%
+if __name__ == "__main__":
+    # python mmapstore.py DIRECTORY COLUMN [T_START T_STOP]
+    import matplotlib.pyplot as plt
+    store = MmapStore(sys.argv[1])
+    bounds = [float(t) for t in sys.argv[3:5]] + [None, None]
+    plot_window(store, sys.argv[2], bounds[0], bounds[1])
+    plt.show()
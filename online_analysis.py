@@ -0,0 +1,196 @@
+import math
+
+class ChargeCounter():
+    '''
+    Integrates current over time as readings come in, trapezoidal rule, O(1) per reading.
+    charge is the net charge (C), throughput the charge regardless of sign (C).
+    '''
+
+    def __init__(self):
+        self.charge = 0.0
+        self.throughput = 0.0
+        self.t = None
+        self.I = None
+
+    def update(self, t, I):
+        if self.t is not None:
+            dt = t - self.t
+            self.charge += 0.5*(I + self.I)*dt
+            if (I >= 0) == (self.I >= 0):
+                self.throughput += 0.5*abs(I + self.I)*dt
+            else:
+                # the current crosses zero within the step, integrate each side
+                self.throughput += 0.5*(I*I + self.I*self.I)/(abs(I) + abs(self.I))*dt
+        self.t = t
+        self.I = I
+        return self.charge
+
+class RunningStats():
+    '''
+    count, mean, standard deviation, min and max of a stream of values (Welford), O(1) per value
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def update(self, x):
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta/self.count
+        self.m2 += delta*(x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2/(self.count - 1)) if self.count > 1 else 0.0
+
+    def to_dict(self):
+        return {"count": self.count, "mean": self.mean, "std": self.std,
+                "min": self.min if self.count else 0.0, "max": self.max if self.count else 0.0}
+
+class VoltageCutoff():
+    '''
+    stops when the voltage goes above (direction "above") or below (direction "below") limit (V)
+    '''
+
+    def __init__(self, limit, direction = "above"):
+        if direction not in ("above", "below"):
+            raise(ValueError("Invalid direction: {}".format(direction)))
+        self.limit = limit
+        self.direction = direction
+
+    def check(self, analysis, row):
+        V = row[analysis.columns.index("Voltage (V)")]
+        return V >= self.limit if self.direction == "above" else V <= self.limit
+
+    def __str__(self):
+        return "voltage {} {} V".format(self.direction, self.limit)
+
+class ChargeTarget():
+    '''
+    stops once the net charge passed reaches charge (C), in either direction
+    '''
+
+    def __init__(self, charge):
+        self.charge = abs(charge)
+
+    def check(self, analysis, row):
+        return abs(analysis.counter.charge) >= self.charge
+
+    def __str__(self):
+        return "charge reached {} C".format(self.charge)
+
+class Plateau():
+    '''
+    Stops when a column levels off: its rate of change, smoothed over window seconds,
+    stays within threshold (units per second) for hold_time seconds.
+    ex. Plateau("Current (A)", 1e-7) for the current decay of a constant voltage run.
+    '''
+
+    def __init__(self, column, threshold, window = 10.0, hold_time = 0.0):
+        self.column = column
+        self.threshold = threshold
+        self.window = window
+        self.hold_time = hold_time
+        self.t_first = None
+        self.t = None
+        self.x = None
+        self.slope = None
+        self.since = None
+
+    def check(self, analysis, row):
+        t = row[0]
+        x = row[analysis.columns.index(self.column)]
+        if self.t is None:
+            self.t_first = t
+        elif t > self.t:
+            raw = (x - self.x)/(t - self.t)
+            # exponential moving average with a time constant of window
+            alpha = min((t - self.t)/self.window, 1.0)
+            self.slope = raw if self.slope is None else self.slope + alpha*(raw - self.slope)
+        self.t = t
+        self.x = x
+        if self.slope is None or t - self.t_first < self.window or abs(self.slope) > self.threshold:
+            self.since = None
+            return False
+        if self.since is None:
+            self.since = t
+        return t - self.since >= self.hold_time
+
+    def __str__(self):
+        return "{} plateau, below {} per s".format(self.column, self.threshold)
+
+class OnlineAnalysis():
+    '''
+    Follows a run reading by reading: charge passed, running statistics of every column
+    and the stop conditions, each O(1) per reading.
+
+    Pass it as analysis to acquisition.AcquisitionThread, which stops on the reading that meets
+    the first stop condition, or feed it with write_row / write_rows like any sink.
+    A stop condition has check(analysis, row), true to stop, and a readable str.
+    '''
+
+    def __init__(self, stop_conditions = (), columns = ("timestamp", "Current (A)", "Voltage (V)")):
+        self.columns = tuple(columns)
+        self.stop_conditions = list(stop_conditions)
+        self.counter = ChargeCounter()
+        self.stats = {name: RunningStats() for name in self.columns[1:]}
+        self.i_current = self.columns.index("Current (A)")
+        self.t_start = None
+        self.t_last = None
+        self.stop_reason = None
+        self.stop_time = None
+
+    @property
+    def charge(self):
+        return self.counter.charge
+
+    @property
+    def stopped(self):
+        return self.stop_reason is not None
+
+    def write_row(self, row):
+        '''
+        adds one reading, row holds one value per column, the timestamp first
+        '''
+        t = row[0]
+        if self.t_start is None:
+            self.t_start = t
+        self.t_last = t
+        self.counter.update(t, row[self.i_current])
+        for c, name in enumerate(self.columns[1:], 1):
+            self.stats[name].update(row[c])
+        for condition in self.stop_conditions:
+            # every condition sees every reading, some keep their own state
+            if condition.check(self, row) and self.stop_reason is None:
+                self.stop_reason = str(condition)
+                self.stop_time = t
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def summary(self):
+        '''
+        Returns the results so far.
+
+        Returns
+        -------
+        summary : dict
+            keys: "charge (C)", "throughput (C)", "duration (s)", "stop_reason", "stop_time",
+            and each column's RunningStats.to_dict()
+        '''
+        out = {}
+        out["charge (C)"] = self.counter.charge
+        out["throughput (C)"] = self.counter.throughput
+        out["duration (s)"] = self.t_last - self.t_start if self.t_start is not None else 0.0
+        out["stop_reason"] = self.stop_reason
+        out["stop_time"] = self.stop_time
+        for name, stats in self.stats.items():
+            out[name] = stats.to_dict()
+        return out
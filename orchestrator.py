@@ -0,0 +1,237 @@
+import time
+import argparse
+import threading
+import pyvisa
+import Keithley2401_voltmeter_063023 as K2401
+import scheduler
+
+class InstrumentPool():
+    '''
+    Opens every SMU through one pyvisa.ResourceManager, in one process, and gives each SMU its own lock.
+
+    Hold an SMU's lock for any exchange with it outside an Orchestrator run, ex. to change a level mid-run:
+        with pool.lock("cell1"):
+            pool["cell1"].set_current_level(2e-3)
+    '''
+
+    def __init__(self, resource_manager = None):
+        self.resource_manager = resource_manager
+        self.smus = {}
+        self.locks = {}
+
+    def open(self, name, resource, setup = True):
+        '''
+        adds an SMU to the pool and returns its Keithley2401
+
+        Parameters
+        ----------
+        name : str
+            name used for the SMU in the pool and its channel
+        resource : str or resource
+            VISA address, ex. 'GPIB0::3::INSTR', or an open resource such as a simulated_smu.SimulatedKeithley2401
+        setup : bool
+            run initial_setup
+        '''
+        if name in self.smus:
+            raise(ValueError("SMU {} is already open".format(name)))
+        if isinstance(resource, str):
+            if self.resource_manager is None:
+                self.resource_manager = pyvisa.ResourceManager()
+            resource = self.resource_manager.open_resource(resource)
+        smu = K2401.Keithley2401(resource)
+        if setup:
+            smu.initial_setup()
+        self.smus[name] = smu
+        self.locks[name] = threading.RLock()
+        return smu
+
+    def __getitem__(self, name):
+        return self.smus[name]
+
+    def lock(self, name):
+        return self.locks[name]
+
+    def close(self):
+        '''
+        turns every output off and closes the resources and the ResourceManager
+        '''
+        for name, smu in self.smus.items():
+            with self.locks[name]:
+                smu.turn_off()
+                smu.visa_resource.close()
+        self.smus = {}
+        self.locks = {}
+        if self.resource_manager is not None:
+            self.resource_manager.close()
+            self.resource_manager = None
+
+class Channel():
+    '''
+    One SMU's share of an Orchestrator run, with its own timebase, sinks and optional RingBuffer.
+    Rows are (seconds since the run started on this channel's clock, current, voltage),
+    timed from the start of the reading.
+    '''
+
+    def __init__(self, name, smu, lock, interval, num_readings = None, sinks = (), buffer = None, policy = "catch_up"):
+        self.name = name
+        self.smu = smu
+        self.lock = lock
+        self.num_readings = num_readings
+        self.sinks = list(sinks)
+        self.buffer = buffer
+        self.clock = scheduler.DeadlineScheduler(interval, policy = policy)
+        self.n_readings = 0
+        self.t_start = None
+
+    @property
+    def done(self):
+        return self.num_readings is not None and self.n_readings >= self.num_readings
+
+    def record(self, I, V):
+        row = (self.t_start, I, V)
+        if self.buffer is not None:
+            self.buffer.write(row)
+        for sink in self.sinks:
+            sink.write_row(row)
+        self.n_readings += 1
+
+class Orchestrator(threading.Thread):
+    '''
+    Runs several SMUs from one thread, each channel on its own schedule.
+
+    mode decides how the channels due at the same time share the bus:
+        "overlap" - each one is started with :INIT, then fetched as soon as its status byte reports completion,
+                    so the integrations run side by side and only the transfers take turns on the bus
+        "interleave" - each one is read with :READ? in turn, the integrations run one after another
+    Each SMU's lock is held from the start of its reading until it is fetched.
+    '''
+
+    def __init__(self, pool, mode = "overlap"):
+        threading.Thread.__init__(self, daemon = True)
+        if mode not in ("overlap", "interleave"):
+            raise(ValueError("Invalid mode: {}".format(mode)))
+        self.pool = pool
+        self.mode = mode
+        self.channels = []
+        self.stop_event = threading.Event()
+        self.error = None
+
+    def add_channel(self, name, interval, num_readings = None, sinks = (), buffer = None, policy = "catch_up"):
+        '''
+        schedules readings on the pool's SMU name, set up beforehand, ex. with setup_single_Vmeas and turn_on.
+        Arguments are as for acquisition.AcquisitionThread. Returns the Channel.
+        '''
+        channel = Channel(name, self.pool[name], self.pool.lock(name), interval, num_readings, sinks, buffer, policy)
+        self.channels.append(channel)
+        return channel
+
+    def run(self):
+        try:
+            for channel in self.channels:
+                channel.clock.start()
+            while not self.stop_event.is_set():
+                active = [channel for channel in self.channels if not channel.done]
+                if not active:
+                    break
+                wait = min(channel.clock.remaining() for channel in active)
+                if wait > 0:
+                    self.stop_event.wait(wait)
+                    continue
+                due = [channel for channel in active if channel.clock.remaining() <= 0]
+                for channel in due:
+                    channel.clock.wait()
+                if self.mode == "overlap":
+                    self._overlap(due)
+                else:
+                    self._interleave(due)
+        except Exception as e:
+            # handed to the main thread through check
+            self.error = e
+
+    def _overlap(self, due):
+        started = []
+        try:
+            for channel in due:
+                channel.lock.acquire()
+                started.append(channel)
+                channel.t_start = channel.clock.elapsed()
+                channel.smu.arm()
+            # each SMU is fetched as soon as its status byte reports completion, a slower one does not hold up the rest
+            waiting = list(due)
+            while waiting:
+                ready = [channel for channel in waiting if channel.smu.is_data_ready()]
+                if not ready:
+                    time.sleep(1e-3)
+                for channel in ready:
+                    I, V = channel.smu.fetch_data()
+                    channel.record(I, V)
+                    waiting.remove(channel)
+        except Exception:
+            # an SMU left armed would answer its next command with a stale reading
+            for channel in started:
+                if channel.smu.armed:
+                    try:
+                        channel.smu.abort()
+                    except Exception:
+                        # the first error is the one reported
+                        pass
+            raise
+        finally:
+            for channel in started:
+                channel.lock.release()
+
+    def _interleave(self, due):
+        for channel in due:
+            with channel.lock:
+                channel.t_start = channel.clock.elapsed()
+                channel.smu.write(":READ?")
+                I, V = channel.smu.read_data()
+                channel.record(I, V)
+
+    def stop(self):
+        '''
+        asks the thread to finish after the current readings
+        '''
+        self.stop_event.set()
+
+    def check(self):
+        '''
+        re-raises an error from the orchestrator thread in the caller's thread
+        '''
+        if self.error is not None:
+            raise(self.error)
+
+def run_simulated(n_smus, mode, n_readings = 50, NPLC = 1):
+    '''
+    Times n_readings readings on each of n_smus simulated SMUs taken back to back.
+    Returns the readings per second over all SMUs.
+    '''
+    import simulated_smu
+    pool = InstrumentPool()
+    orchestrator = Orchestrator(pool, mode)
+    for i in range(n_smus):
+        name = "cell{}".format(i + 1)
+        pool.open(name, simulated_smu.SimulatedKeithley2401(name, realtime = True))
+        pool[name].setup_single_Vmeas(NPLC = NPLC, current_level = 1e-3)
+        pool[name].turn_on()
+        orchestrator.add_channel(name, K2401.SMU_TIMER_MIN, num_readings = n_readings)
+    t_start = time.perf_counter()
+    orchestrator.start()
+    orchestrator.join()
+    orchestrator.check()
+    duration = time.perf_counter() - t_start
+    pool.close()
+    return n_smus*n_readings/duration
+
+#%%
+if __name__ == "__main__":
+    # shows how the reading rate scales with the number of SMUs, on simulated SMUs
+    parser = argparse.ArgumentParser(description = "Readings per second over N simulated SMUs")
+    parser.add_argument("--smus", type = int, nargs = "+", default = [1, 2, 4])
+    parser.add_argument("--readings", type = int, default = 50, help = "readings per SMU")
+    parser.add_argument("--nplc", type = float, default = 1)
+    args = parser.parse_args()
+    for mode in ("interleave", "overlap"):
+        for n_smus in args.smus:
+            rate = run_simulated(n_smus, mode, args.readings, args.nplc)
+            print("{:10s} {} SMUs  {:7.1f} readings/s".format(mode, n_smus, rate))
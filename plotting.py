@@ -0,0 +1,252 @@
+import numpy as np
+import matplotlib.pyplot as plt
+
+class DynamicUpdateOG():
+    
+    def on_launch(self, x_label, y_label):
+        #set up plot
+        self.figure, self.ax = plt.subplots()
+        self.lines, = self.ax.plot([],[], 'o')
+        #set up axis which scale with data
+        self.ax.set_autoscalex_on(True)
+        self.ax.set_autoscaley_on(True)
+        #set up figure labels
+        self.ax.set_xlabel(x_label)
+        self.ax.set_ylabel(y_label)
+        self.ax.grid
+        ...
+
+    def on_running(self, xdata, ydata):
+        #update data (with the new _and_ the old points)
+        self.lines.set_xdata(xdata)
+        self.lines.set_ydata(ydata)
+        #need both of these in order to rescale
+        self.ax.relim()
+        self.ax.autoscale_view()
+        #we need to draw *and* flush
+        self.figure.canvas.draw()
+        self.figure.canvas.flush_events()
+        
+    def on_completion(self, fname, level, var1, var2, var3, var4, save_data = True):
+        #saves data to a .png file
+        from datetime import date
+        d = date.today()
+        self.figure.tight_layout
+        self.figure.savefig(F'{d.strftime("%Y_%m_%d")}_{fname}_{level}.png', dpi = 300, bbox_inches = 'tight')
+        #the data may already be on disk, ex. from a streamfile.StreamWriter
+        if not save_data:
+            return
+        np.savetxt(F'{d.strftime("%Y_%m_%d")}_{fname}_data_{level}.csv', np.c_[np.asarray(var1), np.asarray(var2)], delimiter = ',')
+        np.savetxt(F'{d.strftime("%Y_%m_%d")}_{fname}_vs_time_data.csv', np.c_[np.asarray(var3), np.asarray(var4)], delimiter = ',')
+
+class DynamicUpdateCV():
+    
+    def on_launch(self, x_label, y_label, min_x, max_x):
+        #set up plot
+        self.figure, self.ax = plt.subplots()
+        self.lines, = self.ax.plot([],[], 'o')
+        #set up axis which scale with data
+        self.ax.set_autoscaley_on(True)
+        self.ax.set_xlim(min_x, max_x)
+        #set up figure labels
+        self.ax.set_xlabel(x_label)
+        self.ax.set_ylabel(y_label)
+        self.ax.grid
+        ...
+
+    def on_running(self, xdata, ydata):
+        #update data (with the new _and_ the old points)
+        self.lines.set_xdata(xdata)
+        self.lines.set_ydata(ydata)
+        #need both of these in order to rescale
+        self.ax.relim()
+        self.ax.autoscale_view()
+        #we need to draw *and* flush
+        self.figure.canvas.draw()
+        self.figure.canvas.flush_events()
+        
+    def on_completion(self, fname, volt_range, scan, var1, var2):
+        #saves data to a .png file
+        from datetime import date
+        d = date.today()
+        self.figure.tight_layout
+        self.figure.savefig(F'{d.strftime("%Y_%m_%d")}_{fname}_{volt_range}_{scan}.png', dpi = 300, bbox_inches = 'tight')
+        np.savetxt(F'{d.strftime("%Y_%m_%d")}_cyclic_voltammetry_data_{volt_range}_{scan}.csv', np.c_[np.asarray(var1), np.asarray(var2)], delimiter = ',')
+
+class MinMaxDecimator():
+    '''
+    Keeps at most max_buckets buckets of consecutive points, each reduced to its lowest and highest point.
+    When the buckets fill up, neighbours are merged and the bucket size doubles,
+    so adding a point is O(1) and the output never exceeds 2*max_buckets points.
+    '''
+    
+    def __init__(self, max_buckets = 1000):
+        if max_buckets < 2:
+            raise(ValueError("Invalid max_buckets: {}".format(max_buckets)))
+        self.max_buckets = max_buckets
+        self.bucket_size = 1
+        self.n_buckets = 0
+        self.n_points = 0
+        # per bucket: x, y and index of the lowest point, then of the highest point
+        self.lo = np.zeros((max_buckets, 3))
+        self.hi = np.zeros((max_buckets, 3))
+        self.partial_lo = None
+        self.partial_hi = None
+        self.partial_count = 0
+    
+    def append(self, x, y):
+        point = (x, y, self.n_points)
+        self.n_points += 1
+        if self.partial_count == 0:
+            self.partial_lo = point
+            self.partial_hi = point
+        else:
+            if y < self.partial_lo[1]:
+                self.partial_lo = point
+            if y > self.partial_hi[1]:
+                self.partial_hi = point
+        self.partial_count += 1
+        
+        if self.partial_count == self.bucket_size:
+            self.lo[self.n_buckets] = self.partial_lo
+            self.hi[self.n_buckets] = self.partial_hi
+            self.n_buckets += 1
+            self.partial_count = 0
+            if self.n_buckets == self.max_buckets:
+                self._merge()
+    
+    def _merge(self):
+        half = self.n_buckets//2
+        for table, pick in ((self.lo, np.argmin), (self.hi, np.argmax)):
+            pairs = table[:2*half].reshape(half, 2, 3)
+            last = table[self.n_buckets - 1].copy()
+            table[:half] = pairs[np.arange(half), pick(pairs[:, :, 1], axis = 1)]
+            # an odd bucket out is carried over as it is, it pairs up at the next merge
+            if self.n_buckets % 2:
+                table[half] = last
+        self.n_buckets = half + self.n_buckets % 2
+        self.bucket_size *= 2
+    
+    def points(self):
+        '''
+        Returns the decimated points in the order they were taken.
+        
+        Returns
+        -------
+        x, y : numpy arrays
+        '''
+        lo = self.lo[:self.n_buckets]
+        hi = self.hi[:self.n_buckets]
+        if self.partial_count:
+            lo = np.vstack((lo, self.partial_lo))
+            hi = np.vstack((hi, self.partial_hi))
+        lo_first = (lo[:, 2] <= hi[:, 2])[:, None]
+        first = np.where(lo_first, lo, hi)
+        second = np.where(lo_first, hi, lo)
+        pairs = np.stack((first, second), axis = 1)
+        # a bucket whose lowest and highest point are the same point is drawn once
+        keep = np.ones(pairs.shape[:2], dtype = bool)
+        keep[:, 1] = first[:, 2] != second[:, 2]
+        out = pairs[keep]
+        return out[:, 0], out[:, 1]
+
+class LivePlot():
+    '''
+    Live plot whose update cost does not grow with the length of the run.
+    
+    New points are added with extend, on_running redraws only the data line (blitting)
+    and only rescales the axes when a point falls outside them, with a margin so that happens rarely.
+    The line is min/max decimated to about one bucket per pixel of axes width.
+    '''
+    
+    def on_launch(self, x_label, y_label, min_x = None, max_x = None, margin = 0.1):
+        #set up plot
+        self.figure, self.ax = plt.subplots()
+        self.lines, = self.ax.plot([],[], 'o', animated = True)
+        self.ax.set_xlabel(x_label)
+        self.ax.set_ylabel(y_label)
+        self.margin = margin
+        self.fixed_x = min_x is not None and max_x is not None
+        if self.fixed_x:
+            self.ax.set_xlim(min_x, max_x)
+        self.decimator = MinMaxDecimator(max(int(self.ax.bbox.width), 100))
+        self.data_lim = None
+        self.background = None
+        self.needs_rescale = False
+        self.blit = getattr(self.figure.canvas, "supports_blit", False)
+        # a full draw (first show, resize, rescale) grabs a fresh background without the line
+        self.figure.canvas.mpl_connect("draw_event", self._on_draw)
+        self.figure.canvas.draw()
+    
+    def _on_draw(self, event):
+        if self.blit:
+            self.background = self.figure.canvas.copy_from_bbox(self.ax.bbox)
+        self.ax.draw_artist(self.lines)
+    
+    def extend(self, xdata, ydata):
+        '''
+        adds new points, only the new ones
+        '''
+        xdata = np.asarray(xdata, dtype = float)
+        ydata = np.asarray(ydata, dtype = float)
+        if len(xdata) == 0:
+            return
+        for x, y in zip(xdata.tolist(), ydata.tolist()):
+            self.decimator.append(x, y)
+        
+        new_lim = (xdata.min(), xdata.max(), ydata.min(), ydata.max())
+        if self.data_lim is None:
+            self.data_lim = new_lim
+        else:
+            self.data_lim = (min(self.data_lim[0], new_lim[0]), max(self.data_lim[1], new_lim[1]),
+                             min(self.data_lim[2], new_lim[2]), max(self.data_lim[3], new_lim[3]))
+        
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        outside_y = self.data_lim[2] < y0 or self.data_lim[3] > y1
+        outside_x = not self.fixed_x and (self.data_lim[0] < x0 or self.data_lim[1] > x1)
+        if outside_x or outside_y or self.background is None:
+            self.needs_rescale = True
+    
+    def _rescale(self):
+        x_min, x_max, y_min, y_max = self.data_lim
+        if not self.fixed_x:
+            pad = self.margin*max(x_max - x_min, abs(x_max), 1e-12)
+            self.ax.set_xlim(x_min - pad, x_max + pad)
+        pad = self.margin*max(y_max - y_min, abs(y_max), 1e-12)
+        self.ax.set_ylim(y_min - pad, y_max + pad)
+        self.needs_rescale = False
+    
+    def on_running(self):
+        self.lines.set_data(*self.decimator.points())
+        canvas = self.figure.canvas
+        if self.needs_rescale and self.data_lim is not None:
+            self._rescale()
+            # draws everything, _on_draw puts the line on top
+            canvas.draw()
+        elif self.blit and self.background is not None:
+            canvas.restore_region(self.background)
+            self.ax.draw_artist(self.lines)
+            canvas.blit(self.ax.bbox)
+        else:
+            canvas.draw_idle()
+        canvas.flush_events()
+    
+    def finish(self):
+        '''
+        turns the live line into a normal one so it is included in saved figures
+        '''
+        self.lines.set_animated(False)
+        self.figure.canvas.draw()
+
+class LivePlotOG(LivePlot, DynamicUpdateOG):
+    
+    def on_completion(self, fname, level, var1, var2, var3, var4, save_data = True):
+        self.finish()
+        DynamicUpdateOG.on_completion(self, fname, level, var1, var2, var3, var4, save_data)
+
+class LivePlotCV(LivePlot, DynamicUpdateCV):
+    
+    def on_completion(self, fname, volt_range, scan, var1, var2):
+        self.finish()
+        DynamicUpdateCV.on_completion(self, fname, volt_range, scan, var1, var2)
@@ -0,0 +1,200 @@
+import time
+import threading
+import acquisition
+import cv_engine
+import Keithley2401_voltmeter_063023 as K2401
+import online_analysis
+
+# every step's readings go into one table, timestamps run on from the start of the protocol
+COLUMNS = ("timestamp", "Current (A)", "Voltage (V)", "step")
+
+# A protocol is a list of steps, each a dict with a "type" and its settings:
+#   "cv" - cyclic voltammetry on the SMU's clock, see cv_engine.CVEngine
+#          ex. {"type": "cv", "initial_voltage": 0, "final_voltage": 1, "scan_rate": 0.1, "step": 0.01, "cycles": 2}
+#   "constant_current" - hold a current and read the voltage every interval (s) for duration (s)
+#          ex. {"type": "constant_current", "level": 1e-3, "duration": 3600, "interval": 1, "voltage_cutoff": 4.2}
+#   "constant_voltage" - hold a voltage and read the current
+#          ex. {"type": "constant_voltage", "level": 0.5, "duration": 600, "interval": 1, "current_plateau": 1e-7}
+# STEP_KEYS lists the required and the optional settings of each type.
+STEP_KEYS = {
+    "cv": (("initial_voltage", "final_voltage", "scan_rate"),
+           ("step", "cycles", "NPLC", "V_range", "V_compliance", "I_compliance", "source_delay")),
+    "constant_current": (("level", "duration", "interval"),
+                         ("NPLC", "I_range", "V_compliance", "voltage_cutoff", "charge_target")),
+    "constant_voltage": (("level", "duration", "interval"),
+                         ("NPLC", "V_range", "V_compliance", "I_compliance", "charge_target", "current_plateau")),
+}
+CV_OPTIONS = ("NPLC", "V_range", "V_compliance", "I_compliance", "source_delay")
+HOLD_OPTIONS = ("NPLC", "I_range", "V_range", "V_compliance", "I_compliance")
+
+def validate(protocol):
+    '''
+    raises ValueError if a step has an unknown type, misses a setting or has one that does not belong to it,
+    or holds a level the SMU would refuse
+    '''
+    if len(protocol) == 0:
+        raise(ValueError("Empty protocol"))
+    for i, step in enumerate(protocol):
+        if step.get("type") not in STEP_KEYS:
+            raise(ValueError("Step {}: unknown type {}".format(i, step.get("type"))))
+        required, optional = STEP_KEYS[step["type"]]
+        missing = [key for key in required if key not in step]
+        unknown = [key for key in step if key != "type" and key not in required and key not in optional]
+        if missing or unknown:
+            raise(ValueError("Step {} ({}): missing {}, unknown {}".format(i, step["type"], missing, unknown)))
+        if step["type"] != "cv" and (step["interval"] <= 0 or step["duration"] < 0):
+            raise(ValueError("Step {} ({}): invalid interval or duration".format(i, step["type"])))
+        # the limits set_current_level and set_voltage_level apply, checked before anything is sourced
+        if step["type"] == "constant_current":
+            K2401.validate_levels([step["level"]], K2401.SMU_I_HARD_MAX, "level of step {} ({})".format(i, step["type"]))
+        elif step["type"] == "constant_voltage":
+            K2401.validate_levels([step["level"]], step.get("V_compliance", 5), "level of step {} ({})".format(i, step["type"]))
+
+class ProtocolRunner():
+    '''
+    Runs a protocol's steps back to back on one Keithley2401 session.
+
+    The output is turned on once, after the first step is set up, and stays on between steps.
+    Settings are cached by the driver, so a step only sends what differs from the step before.
+    Every reading goes to the write_row method of each sink as (timestamp, current, voltage, step),
+    the timestamp in seconds since the protocol started, the step its index in the protocol.
+
+    Everything is checked, and the CV waveforms prepared, before the SMU is touched,
+    so a mistake in the last step of an overnight protocol shows up at once.
+    The SMU should already have had initial_setup.
+    '''
+
+    def __init__(self, smu, protocol, sinks = (), on_step = None, keep_on = False):
+        validate(protocol)
+        self.smu = smu
+        self.protocol = [dict(step) for step in protocol]
+        self.sinks = list(sinks)
+        # called with (index, step) as each step starts
+        self.on_step = on_step
+        self.keep_on = keep_on
+        self.engines = {}
+        for i, step in enumerate(self.protocol):
+            if step["type"] == "cv":
+                engine = cv_engine.CVEngine(smu, **{key: step[key] for key in CV_OPTIONS if key in step})
+                engine.program(step["initial_voltage"], step["final_voltage"], step["scan_rate"], step = step.get("step", 0.01), cycles = step.get("cycles", 1))
+                self.engines[i] = engine
+        self.results = []
+        self.index = None
+        self.t_zero = None
+        self.offset = 0.0
+        self.output_on = False
+        self.acq = None
+        self.stop_event = threading.Event()
+
+    def write_row(self, row):
+        '''
+        takes a row of the current step (seconds since the step started, current, voltage) and passes it on
+        '''
+        out = (self.offset + row[0], row[1], row[2], self.index)
+        for sink in self.sinks:
+            sink.write_row(out)
+
+    def run(self):
+        '''
+        Runs every step, then turns the output off unless keep_on.
+
+        Returns
+        -------
+        results : list of dict
+            one per step run, keys: "index", "type", "t_start", "t_stop" (s since the protocol started),
+            "setup_time" (s), "n_readings", and for holds "charge" (C) and "stop_reason"
+        '''
+        self.t_zero = time.perf_counter()
+        self.results = []
+        try:
+            for i, step in enumerate(self.protocol):
+                if self.stop_event.is_set():
+                    break
+                self.index = i
+                if self.on_step is not None:
+                    self.on_step(i, step)
+                t_start = time.perf_counter() - self.t_zero
+                if step["type"] == "cv":
+                    result = self._run_cv(step)
+                else:
+                    result = self._run_hold(step)
+                result["index"] = i
+                result["type"] = step["type"]
+                result["t_start"] = t_start
+                result["t_stop"] = time.perf_counter() - self.t_zero
+                self.results.append(result)
+        finally:
+            if not self.keep_on:
+                self.smu.turn_off()
+                self.output_on = False
+        return self.results
+
+    def stop(self):
+        '''
+        Ends the protocol from another thread: a hold stops after its current reading,
+        a CV finishes its cycles, and no further step starts.
+        '''
+        self.stop_event.set()
+        if self.acq is not None:
+            self.acq.stop()
+
+    def _start_output(self):
+        if not self.output_on:
+            self.smu.turn_on()
+            self.output_on = True
+        # the step's time starts here
+        self.offset = time.perf_counter() - self.t_zero
+
+    def _run_hold(self, step):
+        options = {key: step[key] for key in HOLD_OPTIONS if key in step}
+        stop_conditions = []
+        t_setup = time.perf_counter()
+        if step["type"] == "constant_current":
+            self.smu.setup_single_Vmeas(current_level = step["level"], **options)
+            if step.get("voltage_cutoff") is not None:
+                stop_conditions.append(online_analysis.VoltageCutoff(step["voltage_cutoff"], "above" if step["level"] >= 0 else "below"))
+        else:
+            self.smu.setup_single_Imeas(voltage_level = step["level"], **options)
+            if step.get("current_plateau") is not None:
+                stop_conditions.append(online_analysis.Plateau("Current (A)", step["current_plateau"]))
+        if step.get("charge_target") is not None:
+            stop_conditions.append(online_analysis.ChargeTarget(step["charge_target"]))
+        setup_time = time.perf_counter() - t_setup
+        self._start_output()
+
+        analysis = online_analysis.OnlineAnalysis(stop_conditions)
+        self.acq = acquisition.AcquisitionThread(self.smu.arm, step["interval"], sinks = [self], finish = self.smu.fetch_data,
+                                                 analysis = analysis, duration = step["duration"])
+        self.acq.start()
+        try:
+            # joined in short steps so Ctrl-C still gets through
+            while self.acq.is_alive():
+                self.acq.join(0.5)
+            self.acq.check()
+        finally:
+            self.acq.stop()
+            self.acq.join()
+            # a reading armed when the run was interrupted
+            self.smu.wait_for_data()
+        n_readings = analysis.stats["Voltage (V)"].count
+        return {"setup_time": setup_time, "n_readings": n_readings, "charge": analysis.charge, "stop_reason": analysis.stop_reason}
+
+    def _run_cv(self, step):
+        engine = self.engines[self.index]
+        t_setup = time.perf_counter()
+        # moves to the starting voltage, from whatever the last step left
+        self.smu.setup_single_Imeas(NPLC = engine.NPLC, V_range = engine.V_range, V_compliance = engine.V_compliance, I_compliance = engine.I_compliance,
+                                    voltage_level = step["initial_voltage"])
+        setup_time = time.perf_counter() - t_setup
+        self._start_output()
+        # the points are timed by the SMU's clock, counted from the step's first point
+        first = None
+        n_readings = 0
+        for cycle_data in engine.run():
+            timestamps = cycle_data["timestamp"]
+            if first is None:
+                first = timestamps[0]
+            for row in zip(timestamps - first, cycle_data["Current (A)"], cycle_data["Voltage (V)"]):
+                self.write_row(row)
+            n_readings += len(timestamps)
+        return {"setup_time": setup_time, "n_readings": n_readings}
@@ -0,0 +1,58 @@
+#runs a list of CV, constant current and constant voltage steps back to back, into one data file
+
+#initial stetup
+import sys
+sys.path.append(r'Desktop\SMU_files\\')
+import Keithley2401_voltmeter_063023 as K2401
+import protocol
+import streamfile
+import session_recorder
+import shm_ring
+import live_viewer
+import datetime
+
+#set SMU_RECORD=FILE to record the session, see session_recorder.py
+SMU_RM = session_recorder.open_resource('GPIB0::3::INSTR')
+SMU = K2401.Keithley2401(SMU_RM)
+SMU.initial_setup()
+
+#CHANGE THESE VALUES BEFORE RUNNING THE SCRIPT
+#each step is a dict, see protocol.py for the settings of each type
+steps = [
+    {"type": "cv", "initial_voltage": 0, "final_voltage": 1, "scan_rate": 0.1, "step": 0.01, "cycles": 2, "V_range": 20, "V_compliance": 11},
+    {"type": "constant_current", "level": 1e-3, "duration": 600, "interval": 1, "V_compliance": 5, "voltage_cutoff": 4.2},
+    {"type": "constant_voltage", "level": 0, "duration": 300, "interval": 1, "V_range": 20, "V_compliance": 11, "current_plateau": 1e-7},
+    {"type": "cv", "initial_voltage": 0, "final_voltage": 1, "scan_rate": 0.1, "step": 0.01, "cycles": 2, "V_range": 20, "V_compliance": 11},
+]
+name = "protocol" # goes in the file names
+frame_rate = 10 # plot updates per second
+export_csv = True # also write the data as CSV once the run is over
+headless = False # only stream the data to disk: no plot windows, matplotlib is never loaded and no display is needed
+
+#every step is checked before the output is turned on, and before any file or window is opened
+runner = protocol.ProtocolRunner(SMU, steps, on_step = lambda index, step: print(F'step {index}: {step["type"]}'))
+data_file = F'{datetime.date.today().strftime("%Y_%m_%d")}_{name}.smu'
+writer = streamfile.StreamWriter(data_file, columns = protocol.COLUMNS, metadata = dict(SMU.get_info(), steps = steps))
+runner.sinks.append(writer)
+shared = None
+if not headless:
+    shared = shm_ring.SharedRingBuffer(columns = protocol.COLUMNS)
+    print(F'live readings in shared memory {shared.name}')
+    viewers = [live_viewer.launch(shared.name, [("timestamp", "Voltage (V)"), ("timestamp", "Current (A)")], frame_rate = frame_rate)]
+    runner.sinks.append(shared)
+
+#the output stays on from the first step to the last, each step only sends the settings that change
+try:
+    results = runner.run()
+finally:
+    writer.close()
+    if shared is not None:
+        live_viewer.release(shared, viewers)
+
+for result in results:
+    line = F'step {result["index"]} {result["type"]}: {result["n_readings"]} readings, {result["t_stop"] - result["t_start"]:.1f} s, setup {result["setup_time"]*1000:.1f} ms'
+    if result.get("stop_reason"):
+        line += F', stopped on {result["stop_reason"]}'
+    print(line)
+if export_csv:
+    streamfile.export_csv(data_file)
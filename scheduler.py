@@ -0,0 +1,117 @@
+import time
+import math
+
+class DeadlineScheduler():
+    '''
+    Paces a loop on absolute deadlines: tick n is due at start + n*interval on time.monotonic().
+    A slow iteration does not push the later ticks back, so the sample rate holds over long runs.
+
+    policy decides what happens after an overrun:
+        "catch_up" - the missed ticks fire straight away until the loop is back on schedule
+        "skip" - the missed ticks are dropped and counted, the loop resumes at the next deadline
+    '''
+
+    def __init__(self, interval, policy = "catch_up", clock = time.monotonic, sleep = time.sleep):
+        if interval <= 0:
+            raise(ValueError("Invalid interval: {}".format(interval)))
+        if policy not in ("catch_up", "skip"):
+            raise(ValueError("Invalid policy: {}".format(policy)))
+        self.interval = interval
+        self.policy = policy
+        self.clock = clock
+        self.sleep = sleep
+        self.t0 = None
+        self.deadline = None
+        self.tick = 0
+        # lateness statistics (Welford), in seconds
+        self.jitter_mean = 0.0
+        self.jitter_m2 = 0.0
+        self.jitter_max = 0.0
+        self.overruns = 0
+        self.skipped = 0
+
+    def start(self):
+        '''
+        starts the timebase now, the first wait returns immediately
+        '''
+        self.t0 = self.clock()
+        self.deadline = self.t0
+        self.tick = 0
+
+    def elapsed(self):
+        '''
+        seconds since start
+        '''
+        return self.clock() - self.t0
+
+    def set_interval(self, interval):
+        '''
+        changes the interval from the next deadline on, ex. for adaptive sampling
+        '''
+        if interval <= 0:
+            raise(ValueError("Invalid interval: {}".format(interval)))
+        if self.deadline is not None:
+            self.deadline += interval - self.interval
+        self.interval = interval
+
+    def remaining(self):
+        '''
+        seconds until the next deadline, 0 or less once it is due; does not wait or count a tick
+        '''
+        if self.t0 is None:
+            self.start()
+        return self.deadline - self.clock()
+
+    def wait(self):
+        '''
+        Sleeps until the next deadline.
+
+        Returns
+        -------
+        scheduled : float
+            time the tick was due, in seconds since start
+        '''
+        if self.t0 is None:
+            self.start()
+
+        now = self.clock()
+        if now < self.deadline:
+            self.sleep(self.deadline - now)
+            now = self.clock()
+        elif self.policy == "skip" and now - self.deadline >= self.interval:
+            # fire for the latest deadline that has passed, drop the ones before it
+            missed = math.floor((now - self.deadline)/self.interval)
+            self.deadline += missed*self.interval
+            self.skipped += missed
+            self.overruns += 1
+
+        lateness = now - self.deadline
+        self.tick += 1
+        delta = lateness - self.jitter_mean
+        self.jitter_mean += delta/self.tick
+        self.jitter_m2 += delta*(lateness - self.jitter_mean)
+        self.jitter_max = max(self.jitter_max, lateness)
+        if lateness >= self.interval:
+            self.overruns += 1
+
+        scheduled = self.deadline - self.t0
+        self.deadline += self.interval
+        return scheduled
+
+    def stats(self):
+        '''
+        Returns timing statistics of the ticks so far.
+
+        Returns
+        -------
+        stats : dict
+            keys: "ticks", "jitter_mean", "jitter_std", "jitter_max" (seconds), "overruns", "skipped"
+        '''
+        out = {}
+        out["ticks"] = self.tick
+        out["jitter_mean"] = self.jitter_mean
+        out["jitter_std"] = math.sqrt(self.jitter_m2/(self.tick - 1)) if self.tick > 1 else 0.0
+        out["jitter_max"] = self.jitter_max
+        out["overruns"] = self.overruns
+        out["skipped"] = self.skipped
+        return out
@@ -0,0 +1,279 @@
+#records the SCPI traffic of a session and plays it back without the instrument
+#python session_recorder.py summary FILE
+#python session_recorder.py replay FILE SCRIPT [--scale S]
+
+import os
+import sys
+import json
+import time
+import struct
+import runpy
+import argparse
+import datetime
+
+# file layout:
+#   MAGIC, header length (uint32), JSON header
+#   then one record per bus transaction: RECORD (operation, start time and duration in seconds
+#   since the recording started, bytes written, bytes read), the bytes written, the bytes read
+MAGIC = b"SMUREC01"
+RECORD = struct.Struct("<1sddII")
+# operations
+WRITE = b"W"
+READ = b"R"
+READ_RAW = b"r"
+READ_BYTES = b"B"
+QUERY = b"Q"
+READ_STB = b"S"
+WAIT_ON_EVENT = b"E"
+
+class ReplayError(RuntimeError):
+    '''
+    the driver sent something other than what was recorded
+    '''
+
+class RecordingResource():
+    '''
+    Wraps the pyvisa resource passed to Keithley2401 and logs every transaction to path,
+    with its timing and payloads. Anything else is passed through to the resource.
+    '''
+
+    def __init__(self, resource, path):
+        # set without __setattr__, which forwards to the resource
+        self.__dict__["resource"] = resource
+        self.__dict__["t_zero"] = time.perf_counter()
+        header = {"resource_name": getattr(resource, "resource_name", ""), "created": datetime.datetime.now().isoformat()}
+        header = json.dumps(header).encode()
+        f = open(path, "wb")
+        f.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self.__dict__["file"] = f
+
+    def __getattr__(self, name):
+        return getattr(self.resource, name)
+
+    def __setattr__(self, name, value):
+        # ex. timeout
+        setattr(self.resource, name, value)
+
+    def _record(self, operation, t_start, sent = b"", received = b""):
+        t_stop = time.perf_counter()
+        if isinstance(sent, str):
+            sent = sent.encode()
+        if isinstance(received, str):
+            received = received.encode()
+        self.file.write(RECORD.pack(operation, t_start - self.t_zero, t_stop - t_start, len(sent), len(received)) + sent + received)
+        # the bus is far slower than this, and a crash keeps everything up to the last transaction
+        self.file.flush()
+
+    def write(self, txt):
+        t_start = time.perf_counter()
+        out = self.resource.write(txt)
+        self._record(WRITE, t_start, txt)
+        return out
+
+    def read(self):
+        t_start = time.perf_counter()
+        response = self.resource.read()
+        self._record(READ, t_start, received = response)
+        return response
+
+    def read_raw(self):
+        t_start = time.perf_counter()
+        response = self.resource.read_raw()
+        self._record(READ_RAW, t_start, received = response)
+        return response
+
+    def read_bytes(self, count):
+        t_start = time.perf_counter()
+        response = self.resource.read_bytes(count)
+        self._record(READ_BYTES, t_start, str(count), response)
+        return response
+
+    def query(self, txt):
+        t_start = time.perf_counter()
+        response = self.resource.query(txt)
+        self._record(QUERY, t_start, txt, response)
+        return response
+
+    def read_stb(self):
+        t_start = time.perf_counter()
+        stb = self.resource.read_stb()
+        self._record(READ_STB, t_start, received = str(stb))
+        return stb
+
+    def wait_on_event(self, event_type, timeout):
+        t_start = time.perf_counter()
+        out = self.resource.wait_on_event(event_type, timeout)
+        self._record(WAIT_ON_EVENT, t_start)
+        return out
+
+    def close(self):
+        self.file.close()
+        self.resource.close()
+
+def read_session(path):
+    '''
+    Returns the recording in path.
+
+    Returns
+    -------
+    header : dict
+    records : list of (operation, start, duration, sent, received)
+        operation is one of the bytes constants above, sent and received are bytes
+    '''
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise(ValueError("{} is not an SMU session recording".format(path)))
+    position = len(MAGIC)
+    header_length = struct.unpack_from("<I", data, position)[0]
+    position += 4
+    header = json.loads(data[position:position + header_length])
+    position += header_length
+    records = []
+    # a record cut short by a crash is left out
+    while position + RECORD.size <= len(data):
+        operation, t_start, duration, n_sent, n_received = RECORD.unpack_from(data, position)
+        position += RECORD.size
+        if position + n_sent + n_received > len(data):
+            break
+        sent = data[position:position + n_sent]
+        received = data[position + n_sent:position + n_sent + n_received]
+        position += n_sent + n_received
+        records.append((operation, t_start, duration, sent, received))
+    return header, records
+
+class ReplayResource():
+    '''
+    Stands in for the pyvisa resource and answers from a recording, so a session can be re-run
+    without the instrument, ex. to time a new driver version on real traffic.
+
+    Each transaction takes its recorded duration times latency_scale: 1 for the original timing,
+    0 to run as fast as the driver can. Writes must match the recording, or ReplayError is raised.
+    Status byte polls are matched loosely, since their number depends on timing.
+    '''
+
+    def __init__(self, path, latency_scale = 1.0):
+        self.header, self.records = read_session(path)
+        self.resource_name = self.header.get("resource_name", "REPLAY")
+        self.latency_scale = latency_scale
+        self.timeout = 2000
+        self.position = 0
+        self.last_stb = 0
+        # seconds of recorded latency played back
+        self.replayed_latency = 0.0
+
+    def _next(self, operation, sent = None):
+        # polls the driver did not repeat this time are skipped
+        while operation != READ_STB and self.position < len(self.records) and self.records[self.position][0] == READ_STB:
+            self.position += 1
+        if self.position >= len(self.records):
+            raise(ReplayError("Recording ended, the driver sent another {}".format(operation.decode())))
+        record_operation, t_start, duration, record_sent, received = self.records[self.position]
+        if record_operation != operation or (sent is not None and record_sent != sent):
+            raise(ReplayError("Transaction {}: recorded {} {!r}, the driver sent {} {!r}".format(
+                self.position, record_operation.decode(), record_sent, operation.decode(), sent)))
+        self.position += 1
+        self._sleep(duration)
+        return received
+
+    def _sleep(self, duration):
+        if self.latency_scale:
+            time.sleep(duration*self.latency_scale)
+            self.replayed_latency += duration*self.latency_scale
+
+    def write(self, txt):
+        self._next(WRITE, txt.encode())
+
+    def read(self):
+        return self._next(READ).decode()
+
+    def read_raw(self):
+        return self._next(READ_RAW)
+
+    def read_bytes(self, count):
+        return self._next(READ_BYTES, str(count).encode())
+
+    def query(self, txt):
+        return self._next(QUERY, txt.encode()).decode()
+
+    def read_stb(self):
+        # more polls than recorded: the measurement is done by now
+        if self.position < len(self.records) and self.records[self.position][0] == READ_STB:
+            self.last_stb = int(self._next(READ_STB))
+        return self.last_stb
+
+    def enable_event(self, event_type, mechanism):
+        # local to the VISA session, nothing went over the bus
+        pass
+
+    def discard_events(self, event_type, mechanism):
+        pass
+
+    def wait_on_event(self, event_type, timeout):
+        self._next(WAIT_ON_EVENT)
+
+    def remaining(self):
+        '''
+        number of recorded transactions not played back yet
+        '''
+        return len(self.records) - self.position
+
+    def close(self):
+        pass
+
+def open_resource(address):
+    '''
+    Opens the SMU for a script. Set the environment variable SMU_RECORD to a file name to record the session,
+    or SMU_REPLAY to play one back instead of using the instrument (SMU_REPLAY_SCALE scales its latency).
+    '''
+    if os.environ.get("SMU_REPLAY"):
+        return ReplayResource(os.environ["SMU_REPLAY"], float(os.environ.get("SMU_REPLAY_SCALE", 1.0)))
+    import pyvisa
+    rm = pyvisa.ResourceManager()
+    resource = rm.open_resource(address)
+    if os.environ.get("SMU_RECORD"):
+        return RecordingResource(resource, os.environ["SMU_RECORD"])
+    return resource
+
+def summary(path):
+    '''
+    Returns {operation: {"count", "time", "bytes"}} and the length of the session in seconds.
+    '''
+    header, records = read_session(path)
+    out = {}
+    for operation, t_start, duration, sent, received in records:
+        name = operation.decode()
+        if name not in out:
+            out[name] = {"count": 0, "time": 0.0, "bytes": 0}
+        out[name]["count"] += 1
+        out[name]["time"] += duration
+        out[name]["bytes"] += len(sent) + len(received)
+    length = records[-1][1] + records[-1][2] if records else 0.0
+    return out, length
+
+#%%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Inspects or replays a recorded SMU session")
+    parser.add_argument("action", choices = ["summary", "replay"])
+    parser.add_argument("file")
+    parser.add_argument("script", nargs = "?", help = "script to re-run against the recording, for replay")
+    parser.add_argument("--scale", type = float, default = 1.0, help = "recorded latency scale for replay, 0 for none")
+    args = parser.parse_args()
+
+    if args.action == "summary":
+        operations, length = summary(args.file)
+        bus_time = sum(o["time"] for o in operations.values())
+        print("{:.3f} s session, {:.3f} s in transactions".format(length, bus_time))
+        for name, o in operations.items():
+            print("{}  {:7d} calls {:10.3f} s {:10d} bytes".format(name, o["count"], o["time"], o["bytes"]))
+    else:
+        if args.script is None:
+            parser.error("replay needs the script that made the recording")
+        os.environ["SMU_REPLAY"] = args.file
+        os.environ["SMU_REPLAY_SCALE"] = str(args.scale)
+        os.environ.setdefault("MPLBACKEND", "Agg")
+        t_start = time.perf_counter()
+        runpy.run_path(args.script, run_name = "__main__")
+        duration = time.perf_counter() - t_start
+        operations, length = summary(args.file)
+        print("recorded {:.3f} s, replayed in {:.3f} s with latency scale {}".format(length, duration, args.scale), file = sys.stderr)
@@ -0,0 +1,157 @@
+import os
+import sys
+import json
+import time
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# block layout: HEADER int64 fields, the JSON description (columns and any metadata) up to DATA_OFFSET,
+# then capacity rows of float64, one value per column
+HEADER_FIELDS = 8
+WRITTEN = 0     # total rows ever written, the sequence counter readers check
+CAPACITY = 1
+N_COLUMNS = 2
+FINISHED = 3    # set once the writer is done, readers then stop after the last row
+ATTACHED = 4    # readers that attached so far, a hint for SharedRingBuffer.wait_for_readers
+DESCRIPTION_LENGTH = 5
+WRITING = 6     # rows written once the write in progress is done, published before the data is touched
+DATA_OFFSET = 4096
+
+class SharedRingBuffer():
+    '''
+    Ring buffer of readings in shared memory, written by the acquisition and read by any number of
+    other processes, ex. live_viewer.py, which attach by name while the run goes on.
+
+    Like acquisition.RingBuffer the writer announces how far it is about to write, fills the rows and
+    only then advances the sequence counter, but it never waits for a reader: each reader keeps its
+    own position, and one that falls a whole buffer behind skips ahead and counts what it missed.
+    A reader can only cost itself readings.
+    Has write_row / write_rows, so it can be one of AcquisitionThread's sinks.
+    '''
+
+    def __init__(self, capacity = 65536, columns = ("timestamp", "Current (A)", "Voltage (V)"), metadata = None, name = None):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        description = json.dumps({"columns": self.columns, "metadata": metadata or {}}).encode()
+        if 8*HEADER_FIELDS + len(description) > DATA_OFFSET:
+            raise(ValueError("Column names and metadata too long for the shared memory header"))
+        self.shm = shared_memory.SharedMemory(name = name, create = True, size = DATA_OFFSET + 8*capacity*len(self.columns))
+        self.name = self.shm.name
+        self.header = np.ndarray(HEADER_FIELDS, dtype = np.int64, buffer = self.shm.buf)
+        self.header[:] = 0
+        self.header[CAPACITY] = capacity
+        self.header[N_COLUMNS] = len(self.columns)
+        self.header[DESCRIPTION_LENGTH] = len(description)
+        self.shm.buf[8*HEADER_FIELDS:8*HEADER_FIELDS + len(description)] = description
+        self.data = np.ndarray((capacity, len(self.columns)), dtype = np.float64, buffer = self.shm.buf, offset = DATA_OFFSET)
+        self.written = 0
+
+    def write_row(self, row):
+        '''
+        adds one reading, row holds one value per column
+        '''
+        # announced before the row is touched, readers drop anything it may be overwriting
+        self.header[WRITING] = self.written + 1
+        self.data[self.written % self.capacity] = row
+        self.written += 1
+        # published after the row, a reader never sees a counter ahead of its data
+        self.header[WRITTEN] = self.written
+
+    def write_rows(self, rows):
+        rows = np.asarray(rows, dtype = np.float64)
+        n = len(rows)
+        if n > self.capacity:
+            self.written += n - self.capacity
+            rows = rows[-self.capacity:]
+            n = self.capacity
+        self.header[WRITING] = self.written + n
+        start = self.written % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        self.data[:n - first] = rows[first:]
+        self.written += n
+        self.header[WRITTEN] = self.written
+
+    def wait_for_readers(self, n, timeout = 10.0):
+        '''
+        waits until n readers have attached or timeout (s) passes, returns the number attached
+        '''
+        t_end = time.perf_counter() + timeout
+        while self.header[ATTACHED] < n and time.perf_counter() < t_end:
+            time.sleep(0.05)
+        return int(self.header[ATTACHED])
+
+    def close(self):
+        '''
+        Marks the run finished and releases the block. Readers that are attached keep their copy
+        of the mapping and read to the end, new ones can no longer attach.
+        '''
+        self.header[FINISHED] = 1
+        del self.header, self.data
+        self.shm.close()
+        self.shm.unlink()
+
+class SharedRingReader():
+    '''
+    Attaches to the SharedRingBuffer called name, from any process. Detaching (close, or the process
+    exiting) does not affect the writer or the other readers.
+
+    A new reader starts from the oldest row still in the buffer.
+    '''
+
+    def __init__(self, name):
+        # the resource tracker would unlink the block when this process exits, under the writer's feet
+        if sys.version_info >= (3, 13):
+            self.shm = shared_memory.SharedMemory(name = name, track = False)
+        else:
+            self.shm = shared_memory.SharedMemory(name = name)
+            # only POSIX registers shared memory with it, on Windows the tracker cannot even start
+            if os.name == "posix":
+                resource_tracker.unregister(self.shm._name, "shared_memory")
+        self.name = name
+        self.header = np.ndarray(HEADER_FIELDS, dtype = np.int64, buffer = self.shm.buf)
+        self.capacity = int(self.header[CAPACITY])
+        length = int(self.header[DESCRIPTION_LENGTH])
+        description = json.loads(bytes(self.shm.buf[8*HEADER_FIELDS:8*HEADER_FIELDS + length]))
+        self.columns = tuple(description["columns"])
+        self.metadata = description["metadata"]
+        self.data = np.ndarray((self.capacity, len(self.columns)), dtype = np.float64, buffer = self.shm.buf, offset = DATA_OFFSET)
+        self.consumed = max(0, int(self.header[WRITTEN]) - self.capacity)
+        self.dropped = 0
+        self.header[ATTACHED] += 1
+
+    @property
+    def finished(self):
+        return bool(self.header[FINISHED])
+
+    def read_new(self):
+        '''
+        Returns the readings added since the last call.
+
+        Returns
+        -------
+        rows : numpy array
+            one row per reading, a copy that stays valid
+        '''
+        end = int(self.header[WRITTEN])
+        start = max(self.consumed, end - self.capacity)
+        index = np.arange(start, end) % self.capacity
+        rows = self.data[index]
+        # rows the writer was overwriting, or had started to, while we were copying are not trustworthy
+        oldest_valid = int(self.header[WRITING]) - self.capacity
+        if oldest_valid > start:
+            rows = rows[oldest_valid - start:]
+            start = oldest_valid
+        self.dropped += start - self.consumed
+        self.consumed = end
+        return rows
+
+    def pending(self):
+        '''
+        number of readings waiting for read_new
+        '''
+        return min(int(self.header[WRITTEN]) - self.consumed, self.capacity)
+
+    def close(self):
+        del self.header, self.data
+        self.shm.close()
@@ -0,0 +1,450 @@
+import time
+import collections
+import numpy as np
+import pyvisa
+
+# long SCPI node names the driver uses, mapped to their short form
+SHORT_FORMS = {"SOURCE": "SOUR", "SENSE": "SENS", "SYSTEM": "SYST", "TRIGGER": "TRIG", "FORMAT": "FORM", "OUTPUT": "OUTP",
+               "VOLTAGE": "VOLT", "CURRENT": "CURR", "FUNCTION": "FUNC", "PROTECTION": "PROT", "RANGE": "RANG",
+               "LEVEL": "LEV", "APPEND": "APP", "COUNT": "COUN", "DELAY": "DEL", "TIMER": "TIM", "CLEAR": "CLE",
+               "ELEMENTS": "ELEM", "BORDER": "BORD", "IMMEDIATE": "IMM", "RESET": "RES", "INITIATE": "INIT",
+               "FETCH": "FETC", "ABORT": "ABOR", "ERROR": "ERR", "DISPLAY": "DISP", "ENABLE": "ENAB", "AZERO": "AZER",
+               "NPLCYCLES": "NPLC", "RSENSE": "RSEN", "BEEPER": "BEEP", "STATE": "STAT", "TRACE": "TRAC",
+               "POINTS": "POIN", "ACTUAL": "ACT", "CONTROL": "CONT", "ASCII": "ASC", "SREAL": "SRE", "SWAPPED": "SWAP",
+               "NORMAL": "NORM", "FIXED": "FIX", "AUTO": "AUTO", "NEVER": "NEV", "SENSE1": "SENS", "DATA": "DATA"}
+
+# settings after *RST, keyed by short form header
+RESET_STATE = {"SOUR:FUNC": "VOLT", "SOUR:VOLT:MODE": "FIX", "SOUR:CURR:MODE": "FIX", "SOUR:VOLT:LEV": "0", "SOUR:CURR:LEV": "0",
+               "SOUR:VOLT:RANG": "21", "SOUR:CURR:RANG": "1.05E-4", "SENS:VOLT:PROT": "21", "SENS:CURR:PROT": "1.05E-4",
+               "SENS:VOLT:PROT:RSYN": "0", "SENS:CURR:PROT:RSYN": "0", "SENS:VOLT:NPLC": "1", "SENS:CURR:NPLC": "1",
+               "SOUR:DEL": "0", "TRIG:DEL": "0", "TRIG:COUN": "1", "ARM:COUN": "1", "ARM:SOUR": "IMM", "ARM:TIM": "0.1",
+               "FORM:DATA": "ASC", "FORM:BORD": "NORM", "FORM:ELEM": "VOLT,CURR,RES,TIME,STAT", "OUTP": "0",
+               "SYST:AZER": "1", "DISP:ENAB": "1", "TRAC:FEED": "SENS", "TRAC:POIN": "100", "TRAC:FEED:CONT": "NEV"}
+
+ELEMENTS = ("VOLT", "CURR", "RES", "TIME", "STAT")
+
+class SimulatedKeithley2401():
+    '''
+    Stands in for the pyvisa resource passed to Keithley2401, so the driver can be run and timed without an instrument.
+
+    It understands the SCPI subset the driver sends (*RST, :SOUR, :SENS, :SOUR:LIST, :TRIG/:ARM counts and timer,
+    :FORM, :READ?, :INIT/:FETC? with *OPC and the status byte, :TRAC, :OUTP, :SYST:TIME:RES, :SYST:ERR)
+    and answers from a model cell:
+        "resistor" - resistance R (ohm)
+        "rc" - R in series with a capacitor C (F), which charges as current flows
+    Other commands with arguments are stored and can be queried back.
+
+    latency (s) is added to every bus transaction. A sweep takes as long as the real SMU would
+    (timer interval, or 2 integrations of NPLC line cycles plus delays per point); with realtime False
+    its timestamps advance by that much but the call returns at once, which keeps benchmarks fast.
+    '''
+
+    def __init__(self, resource_name = "SIM::2401::INSTR", model = "resistor", resistance = 1e3, capacitance = 1e-3,
+                 latency = 0.0, realtime = False, noise = 0.0, line_frequency = 60, seed = 0):
+        self.resource_name = resource_name
+        self.model = model
+        self.resistance = resistance
+        self.capacitance = capacitance
+        self.latency = latency
+        self.realtime = realtime
+        self.noise = noise
+        self.line_frequency = line_frequency
+        self.rng = np.random.default_rng(seed)
+        self.timeout = 2000
+        self.output = collections.deque()
+        self.n_writes = 0
+        self.n_reads = 0
+        # set by enable_event, a setting of the VISA session rather than the instrument, so reset keeps it
+        self.srq_enabled = False
+        self.reset()
+
+    def reset(self):
+        self.state = dict(RESET_STATE)
+        self.lists = {"VOLT": [], "CURR": []}
+        self.errors = []
+        self.charge = 0.0
+        # instrument time the cell was last brought up to date
+        self.cell_time = 0.0
+        self.t_zero = time.monotonic()
+        self.virtual_time = 0.0
+        # status registers and the readings of the last :INIT
+        self.esr = 0
+        self.ese = 0
+        self.sre = 0
+        self.opc_pending = False
+        self.done_time = 0.0
+        self.sample_buffer = None
+        self.trace = np.zeros((0, len(ELEMENTS)))
+
+    # ---- bus side ----
+
+    def _wait(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+    def write(self, txt):
+        self._wait()
+        self.n_writes += 1
+        for command in txt.strip().split(";"):
+            if command.strip():
+                self._execute(command.strip())
+
+    def read(self):
+        return self.read_raw().decode().rstrip("\n")
+
+    def read_raw(self):
+        self._wait()
+        self.n_reads += 1
+        if not self.output:
+            raise(pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout))
+        return self.output.popleft()
+
+    def read_bytes(self, count):
+        out = b""
+        while len(out) < count:
+            if not self.output:
+                raise(pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout))
+            message = self.output.popleft()
+            take = count - len(out)
+            out += message[:take]
+            if len(message) > take:
+                self.output.appendleft(message[take:])
+        self._wait()
+        self.n_reads += 1
+        return out
+
+    def query(self, txt):
+        self.write(txt)
+        return self.read()
+
+    def read_stb(self):
+        '''
+        serial poll: MAV (16), ESB (32) and RQS (64) bits
+        '''
+        self._wait()
+        self._update_status()
+        stb = 16 if self.output else 0
+        if self.esr & self.ese:
+            stb |= 32
+        if stb & self.sre:
+            stb |= 64
+        return stb
+
+    def enable_event(self, event_type, mechanism):
+        self.srq_enabled = True
+
+    def discard_events(self, event_type, mechanism):
+        # the request is read from the status byte, there is no queue to empty
+        pass
+
+    def wait_on_event(self, event_type, timeout):
+        '''
+        waits for a service request, timeout in ms
+        '''
+        if not self.srq_enabled:
+            raise(pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_not_enabled))
+        t_stop = time.monotonic() + timeout/1000
+        while not self.read_stb() & 64:
+            if time.monotonic() > t_stop:
+                raise(pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout))
+            time.sleep(1e-4)
+
+    def close(self):
+        pass
+
+    # ---- instrument side ----
+
+    def now(self):
+        return time.monotonic() - self.t_zero + self.virtual_time
+
+    def _update_status(self):
+        if self.opc_pending and self.now() >= self.done_time:
+            self.esr |= 1
+            self.opc_pending = False
+
+    def _respond(self, text):
+        if isinstance(text, str):
+            text = text.encode()
+        self.output.append(text + b"\n")
+
+    def _error(self, code, message):
+        self.errors.append('{},"{}"'.format(code, message))
+
+    def _normalize(self, header):
+        nodes = []
+        for node in header.lstrip(":").upper().split(":"):
+            nodes.append(SHORT_FORMS.get(node, node))
+        # optional trailing nodes
+        while len(nodes) > 1 and nodes[-1] in ("LEV", "IMM", "AMPL") and nodes[-2] in ("PROT", "LEV", "IMM"):
+            nodes.pop()
+        return ":".join(nodes)
+
+    def _execute(self, command):
+        header, _, argument = command.partition(" ")
+        query = header.endswith("?")
+        header = self._normalize(header.rstrip("?"))
+        argument = argument.strip()
+        handler = getattr(self, "_cmd_" + header.replace("*", "STAR_").replace(":", "_"), None)
+        if handler is not None:
+            handler(argument, query)
+        elif query:
+            if header in self.state:
+                self._respond(self.state[header])
+            else:
+                self._error(-113, "Undefined header")
+                self._respond("0")
+        else:
+            self.state[header] = SHORT_FORMS.get(argument.upper(), argument.upper())
+
+    def _cmd_STAR_RST(self, argument, query):
+        self.reset()
+
+    def _cmd_STAR_CLS(self, argument, query):
+        self.errors = []
+        self.esr = 0
+
+    def _cmd_STAR_IDN(self, argument, query):
+        self._respond("KEITHLEY INSTRUMENTS INC.,MODEL 2401,SIMULATED,A01")
+
+    def _cmd_STAR_OPC(self, argument, query):
+        if query:
+            self._wait_done()
+            self._respond("1")
+        else:
+            self.opc_pending = True
+            self._update_status()
+
+    def _cmd_STAR_ESE(self, argument, query):
+        if query:
+            self._respond(str(self.ese))
+        else:
+            self.ese = int(argument)
+
+    def _cmd_STAR_SRE(self, argument, query):
+        if query:
+            self._respond(str(self.sre))
+        else:
+            self.sre = int(argument)
+
+    def _cmd_STAR_ESR(self, argument, query):
+        self._update_status()
+        self._respond(str(self.esr))
+        self.esr = 0
+
+    def _cmd_SYST_TIME_RES(self, argument, query):
+        self.t_zero = time.monotonic()
+        self.virtual_time = 0.0
+
+    def _cmd_SYST_ERR(self, argument, query):
+        self._respond(self.errors.pop(0) if self.errors else '0,"No error"')
+
+    def _cmd_SYST_ERR_ALL(self, argument, query):
+        self._respond(",".join(self.errors + ['0,"No error"']))
+        self.errors = []
+
+    def _cmd_OUTP(self, argument, query):
+        if query:
+            self._respond(self.state["OUTP"])
+        else:
+            self.state["OUTP"] = "1" if argument.upper() in ("ON", "1") else "0"
+
+    def _cmd_SYST_AZER(self, argument, query):
+        if query:
+            self._respond(self.state["SYST:AZER"])
+        else:
+            # ONCE autozeroes now and leaves autozero off
+            self.state["SYST:AZER"] = "1" if argument.upper() in ("ON", "1") else "0"
+
+    def _cmd_SOUR_VOLT_LEV(self, argument, query):
+        self._level("VOLT", argument, query)
+
+    def _cmd_SOUR_CURR_LEV(self, argument, query):
+        self._level("CURR", argument, query)
+
+    def _level(self, function, argument, query):
+        header = "SOUR:{}:LEV".format(function)
+        if query:
+            self._respond(self.state[header])
+            return
+        # the cell followed the old level up to now, ex. in the gap between two lists
+        if self.state["SOUR:FUNC"] == function and self.now() > self.cell_time:
+            self._relax_cell(function, self.now())
+        self.state[header] = argument.upper()
+
+    def _cmd_SOUR_LIST_VOLT(self, argument, query):
+        self._list("VOLT", argument, query, append = False)
+
+    def _cmd_SOUR_LIST_CURR(self, argument, query):
+        self._list("CURR", argument, query, append = False)
+
+    def _cmd_SOUR_LIST_VOLT_APP(self, argument, query):
+        self._list("VOLT", argument, query, append = True)
+
+    def _cmd_SOUR_LIST_CURR_APP(self, argument, query):
+        self._list("CURR", argument, query, append = True)
+
+    def _list(self, function, argument, query, append):
+        if query:
+            self._respond(",".join("{:+.6E}".format(v) for v in self.lists[function]))
+            return
+        values = [float(v) for v in argument.split(",")]
+        if append:
+            self.lists[function].extend(values)
+        else:
+            self.lists[function] = values
+        if len(self.lists[function]) > 2500:
+            self._error(-223, "Too much data")
+            self.lists[function] = self.lists[function][:2500]
+
+    def _cmd_READ(self, argument, query):
+        readings = self._sweep()
+        self._feed_trace(readings)
+        self._respond(self._format(readings))
+
+    def _cmd_INIT(self, argument, query):
+        # the sweep is worked out now, its readings become available at done_time
+        self.sample_buffer = self._sweep(wait = False)
+        self._feed_trace(self.sample_buffer)
+
+    def _cmd_ABOR(self, argument, query):
+        # the readings not taken yet are dropped
+        if self.sample_buffer is not None and self.now() < self.done_time:
+            self.sample_buffer = None
+            self.done_time = self.now()
+            self.opc_pending = False
+
+    def _feed_trace(self, readings):
+        if self.state["TRAC:FEED:CONT"] != "NEXT":
+            return
+        size = int(float(self.state["TRAC:POIN"]))
+        self.trace = np.vstack((self.trace, readings))[:size]
+        if len(self.trace) == size:
+            self.state["TRAC:FEED:CONT"] = "NEV"
+
+    def _cmd_TRAC_CLE(self, argument, query):
+        self.trace = self.trace[:0]
+
+    def _cmd_TRAC_POIN_ACT(self, argument, query):
+        self._respond(str(len(self.trace)))
+
+    def _cmd_TRAC_DATA(self, argument, query):
+        self._wait_done()
+        if len(self.trace) == 0:
+            self._error(-230, "Data corrupt or stale")
+        self._respond(self._format(self.trace))
+
+    def _cmd_FETC(self, argument, query):
+        if self.sample_buffer is None:
+            self._error(-230, "Data corrupt or stale")
+            self._respond("")
+            return
+        self._wait_done()
+        self._respond(self._format(self.sample_buffer))
+
+    def _wait_done(self):
+        if self.realtime:
+            time.sleep(max(self.done_time - self.now(), 0))
+
+    # ---- measurement model ----
+
+    def point_time(self):
+        '''
+        seconds the SMU spends on one source-measure point
+        '''
+        nplc = float(self.state["SENS:VOLT:NPLC"]) + float(self.state["SENS:CURR:NPLC"])
+        busy = nplc/self.line_frequency + float(self.state["SOUR:DEL"]) + float(self.state["TRIG:DEL"])
+        if self.state["ARM:SOUR"] == "TIM":
+            return max(busy, float(self.state["ARM:TIM"]))
+        return busy
+
+    def _sweep(self, wait = True):
+        n_points = int(float(self.state["ARM:COUN"]))*int(float(self.state["TRIG:COUN"]))
+        function = self.state["SOUR:FUNC"]
+        if self.state.get("SOUR:{}:MODE".format(function)) == "LIST":
+            levels = self.lists[function]
+            if len(levels) < n_points:
+                self._error(-221, "Settings conflict")
+                levels = (levels*n_points)[:n_points] if levels else [0.0]*n_points
+            levels = np.array(levels[:n_points])
+        else:
+            levels = np.full(n_points, float(self.state["SOUR:{}:LEV".format(function)]))
+
+        dt = self.point_time()
+        t_start = self.now()
+        times = t_start + dt*np.arange(1, n_points + 1)
+        self._relax_cell(function, t_start)
+        volts, currents = self._respond_cell(function, levels, dt)
+        self.done_time = t_start + n_points*dt
+        self.cell_time = self.done_time
+        if not self.realtime:
+            self.virtual_time += self.done_time - t_start
+        elif wait:
+            self._wait_done()
+
+        readings = np.zeros((n_points, len(ELEMENTS)))
+        readings[:, 0] = volts
+        readings[:, 1] = currents
+        with np.errstate(divide = "ignore", invalid = "ignore"):
+            readings[:, 2] = np.where(currents != 0, volts/currents, 9.91e37)
+        readings[:, 3] = times
+        return readings
+
+    def _relax_cell(self, function, t):
+        # the output keeps sourcing its fixed level between sweeps, the capacitor follows
+        gap = t - self.cell_time
+        self.cell_time = t
+        if self.model != "rc" or self.state["OUTP"] != "1" or gap <= 0:
+            return
+        level = float(self.state["SOUR:{}:LEV".format(function)])
+        if function == "VOLT":
+            v_cap = self.charge/self.capacitance
+            v_cap = level - (level - v_cap)*np.exp(-gap/(self.resistance*self.capacitance))
+            self.charge = v_cap*self.capacitance
+        else:
+            self.charge += level*gap
+
+    def _respond_cell(self, function, levels, dt):
+        I_limit = float(self.state["SENS:CURR:PROT"])
+        V_limit = float(self.state["SENS:VOLT:PROT"])
+        R = self.resistance
+        if self.state["OUTP"] != "1":
+            volts = np.zeros(len(levels))
+            currents = np.zeros(len(levels))
+        elif self.model == "rc":
+            volts = np.zeros(len(levels))
+            currents = np.zeros(len(levels))
+            tau = R*self.capacitance
+            decay = np.exp(-dt/tau)
+            for i, level in enumerate(levels):
+                if function == "VOLT":
+                    # the capacitor relaxes towards the applied voltage through R
+                    v_cap = self.charge/self.capacitance
+                    I = np.clip((level - v_cap)/R, -I_limit, I_limit)
+                    v_cap = level - (level - v_cap)*decay if abs(I) < I_limit else v_cap + I*dt/self.capacitance
+                    self.charge = v_cap*self.capacitance
+                    volts[i], currents[i] = level, I
+                else:
+                    self.charge += level*dt
+                    volts[i] = np.clip(level*R + self.charge/self.capacitance, -V_limit, V_limit)
+                    currents[i] = level
+        elif function == "VOLT":
+            volts = levels
+            currents = np.clip(levels/R, -I_limit, I_limit)
+        else:
+            currents = levels
+            volts = np.clip(levels*R, -V_limit, V_limit)
+        if self.noise:
+            volts = volts + self.noise*self.rng.standard_normal(len(volts))
+            currents = currents + self.noise/R*self.rng.standard_normal(len(currents))
+        return volts, currents
+
+    def _format(self, readings):
+        elements = self.state["FORM:ELEM"].split(",")
+        columns = [ELEMENTS.index(SHORT_FORMS.get(e, e)) for e in elements]
+        values = readings[:, columns].ravel()
+        data_format = self.state["FORM:DATA"]
+        if data_format in ("ASC", "ASCII"):
+            return ",".join("{:+.6E}".format(v) for v in values)
+        byte_order = "<" if self.state["FORM:BORD"] == "SWAP" else ">"
+        dtype = byte_order + ("f8" if data_format.startswith("REAL") else "f4")
+        return b"#0" + values.astype(dtype).tobytes()
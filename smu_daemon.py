@@ -0,0 +1,222 @@
+#keeps one SMU session open between runs, experiments are sent to it as jobs over a local socket
+#python smu_daemon.py [--address GPIB0::3::INSTR | --simulate] [--port 5025]
+
+import json
+import time
+import socket
+import argparse
+import threading
+import socketserver
+import pyvisa
+import Keithley2401_voltmeter_063023 as K2401
+import acquisition
+import cv_engine
+import protocol
+
+DEFAULT_PORT = 5025
+
+# Jobs and replies are JSON objects, one per line. A job has a "type":
+#   "hold" - constant current or voltage, ex. {"type": "hold", "source": "current", "level": 1e-3, "interval": 0.5, "num_readings": 40}
+#            optional keys are the setup_single_Vmeas / setup_single_Imeas arguments (NPLC, I_range, V_range, V_compliance, I_compliance)
+#   "cv" - cyclic voltammetry, ex. {"type": "cv", "initial_voltage": 0, "final_voltage": 1, "scan_rate": 0.1, "step": 0.01, "cycles": 2}
+#          optional keys are the cv_engine.CVEngine arguments (NPLC, V_range, V_compliance, I_compliance, source_delay)
+#   "protocol" - steps run back to back with the output left on in between, "steps" is a list as in protocol.py
+#                ex. {"type": "protocol", "steps": [{"type": "cv", ...}, {"type": "constant_current", ...}]}
+#   "info" - the SMU's identity and the cached settings
+#   "errors" - drains the SMU's error queue
+#   "shutdown" - turns the output off and stops the daemon
+# Replies, each with a "type":
+#   "start" - the job is set up, "setup_time" is how long that took (s)
+#   "row" - one reading, "row" is [timestamp, current, voltage], with the step index after them for a protocol
+#   "step" - a protocol step is starting, "index" is its place in the protocol
+#   "cycle" - one CV cycle, "cycle" is its number and "data" maps column names to lists
+#   "info", "errors" - answers to those jobs
+#   "done" - the job is over, "stats" holds its timing statistics if any, "steps" the results of a protocol
+#   "error" - the job failed, "message" says why
+
+HOLD_OPTIONS = ("NPLC", "I_range", "V_range", "V_compliance", "I_compliance")
+CV_OPTIONS = ("NPLC", "V_range", "V_compliance", "I_compliance", "source_delay")
+
+class RowSender():
+    '''
+    sink for acquisition.AcquisitionThread that sends each row to the client
+    '''
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def write_row(self, row):
+        self.handler.send({"type": "row", "row": [float(x) for x in row]})
+
+class JobHandler(socketserver.StreamRequestHandler):
+    '''
+    Runs the jobs of one client connection in turn. Jobs from different clients wait for each other.
+    '''
+
+    def send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+                run = getattr(self, "job_{}".format(job.get("type")), None)
+                if run is None:
+                    raise(ValueError("Unknown job type: {}".format(job.get("type"))))
+                with self.server.smu_lock:
+                    run(job)
+            except ConnectionError:
+                return
+            except Exception as e:
+                self.send({"type": "error", "message": "{}: {}".format(type(e).__name__, e)})
+
+    def job_hold(self, job):
+        smu = self.server.smu
+        options = {key: job[key] for key in HOLD_OPTIONS if key in job}
+        t_start = time.perf_counter()
+        # the settings are cached, only those that differ from the last job are sent
+        if job.get("source", "current") == "current":
+            options.pop("V_range", None)
+            options.pop("I_compliance", None)
+            smu.setup_single_Vmeas(current_level = job["level"], **options)
+        else:
+            options.pop("I_range", None)
+            smu.setup_single_Imeas(voltage_level = job["level"], **options)
+        smu.turn_on()
+        self.send({"type": "start", "setup_time": time.perf_counter() - t_start})
+
+        acq = acquisition.AcquisitionThread(smu.arm, job["interval"], num_readings = job["num_readings"],
+                                            sinks = [RowSender(self)], finish = smu.fetch_data)
+        acq.start()
+        try:
+            acq.join()
+            acq.check()
+        finally:
+            acq.stop()
+            acq.join()
+            # a client that went away mid-reading leaves the SMU armed
+            smu.wait_for_data()
+            if not job.get("keep_on", False):
+                smu.turn_off()
+        self.send({"type": "done", "stats": acq.clock.stats()})
+
+    def job_cv(self, job):
+        smu = self.server.smu
+        options = {key: job[key] for key in CV_OPTIONS if key in job}
+        t_start = time.perf_counter()
+        cv = cv_engine.CVEngine(smu, **options)
+        cv.program(job["initial_voltage"], job["final_voltage"], job["scan_rate"], step = job.get("step", 0.01), cycles = job.get("cycles", 1))
+        smu.setup_single_Imeas(NPLC = cv.NPLC, V_range = cv.V_range, V_compliance = cv.V_compliance, I_compliance = cv.I_compliance,
+                               voltage_level = job["initial_voltage"])
+        smu.turn_on()
+        self.send({"type": "start", "setup_time": time.perf_counter() - t_start, "interval": cv.interval})
+        try:
+            for cycle_data in cv.run():
+                data = {key: value.tolist() for key, value in cycle_data.items() if key != "cycle"}
+                self.send({"type": "cycle", "cycle": cycle_data["cycle"], "data": data})
+        finally:
+            if not job.get("keep_on", False):
+                smu.turn_off()
+        self.send({"type": "done"})
+
+    def job_protocol(self, job):
+        t_start = time.perf_counter()
+        runner = protocol.ProtocolRunner(self.server.smu, job["steps"], sinks = [RowSender(self)], keep_on = job.get("keep_on", False),
+                                         on_step = lambda index, step: self.send({"type": "step", "index": index, "step": step}))
+        self.send({"type": "start", "setup_time": time.perf_counter() - t_start})
+        results = runner.run()
+        self.send({"type": "done", "steps": results})
+
+    def job_info(self, job):
+        self.send({"type": "info", "info": self.server.smu.info_dict, "state": self.server.smu.state})
+
+    def job_errors(self, job):
+        self.send({"type": "errors", "errors": self.server.smu.get_errors()})
+
+    def job_shutdown(self, job):
+        self.server.smu.turn_off()
+        self.send({"type": "done"})
+        # shutdown waits for serve_forever, which runs in another thread
+        threading.Thread(target = self.server.shutdown).start()
+
+class SMUDaemon(socketserver.ThreadingTCPServer):
+    '''
+    Holds one Keithley2401 session open and runs jobs sent to it on localhost.
+    initial_setup runs once when the daemon starts, so a job only pays for the settings it changes.
+    '''
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, smu, port = DEFAULT_PORT, host = "127.0.0.1"):
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), JobHandler)
+        self.smu = smu
+        self.smu_lock = threading.Lock()
+
+class DaemonClient():
+    '''
+    Connection to a running SMUDaemon.
+
+        client = DaemonClient()
+        for message in client.submit({"type": "hold", "source": "current", "level": 1e-3, "interval": 0.5, "num_readings": 40}):
+            if message["type"] == "row":
+                print(message["row"])
+    '''
+
+    def __init__(self, port = DEFAULT_PORT, host = "127.0.0.1", timeout = None):
+        self.socket = socket.create_connection((host, port), timeout = timeout)
+        self.file = self.socket.makefile("rwb")
+
+    def submit(self, job):
+        '''
+        Sends a job and yields the replies as they arrive, up to and including "done".
+        Raises RuntimeError if the daemon reports an error.
+        '''
+        self.file.write((json.dumps(job) + "\n").encode())
+        self.file.flush()
+        for line in self.file:
+            message = json.loads(line)
+            if message["type"] == "error":
+                raise(RuntimeError(message["message"]))
+            yield message
+            if message["type"] in ("done", "info", "errors"):
+                return
+        raise(ConnectionError("SMU daemon closed the connection"))
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+#%%
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Keeps an SMU session open and runs jobs sent over a local socket")
+    parser.add_argument("--address", default = "GPIB0::3::INSTR", help = "VISA address of the SMU")
+    parser.add_argument("--simulate", action = "store_true", help = "use simulated_smu instead of an instrument")
+    parser.add_argument("--port", type = int, default = DEFAULT_PORT)
+    args = parser.parse_args()
+
+    if args.simulate:
+        import simulated_smu
+        resource = simulated_smu.SimulatedKeithley2401(realtime = True)
+    else:
+        rm = pyvisa.ResourceManager()
+        resource = rm.open_resource(args.address)
+    SMU = K2401.Keithley2401(resource)
+    SMU.initial_setup()
+    SMU.get_info()
+
+    server = SMUDaemon(SMU, args.port)
+    print("SMU daemon on port {}".format(args.port))
+    try:
+        server.serve_forever()
+    finally:
+        SMU.turn_off()
+        server.server_close()
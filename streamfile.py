@@ -0,0 +1,172 @@
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import datetime
+import numpy as np
+
+# file layout:
+#   MAGIC, header length (uint32), JSON header
+#   then chunks: CHUNK_MAGIC, number of rows (uint32), crc32 of the payload (uint32), rows as little-endian float64
+MAGIC = b"SMUSTRM1"
+CHUNK_MAGIC = b"CHNK"
+CHUNK_HEADER = struct.Struct("<4sII")
+DTYPE = np.dtype("<f8")
+
+class StreamWriter():
+    '''
+    Appends readings to a binary file as they come in, so a crash or Ctrl-C loses at most
+    the last few seconds of a run instead of all of it.
+
+    Rows are collected into chunks of chunk_rows readings. A full chunk is written at once;
+    every fsync_interval seconds the partial chunk is written too and the file is synced to disk.
+    '''
+
+    def __init__(self, path, columns = ("timestamp", "Current (A)", "Voltage (V)"), metadata = None, chunk_rows = 256, fsync_interval = 5.0):
+        self.path = path
+        self.columns = tuple(columns)
+        self.chunk_rows = chunk_rows
+        self.fsync_interval = fsync_interval
+        self.chunk = np.zeros((chunk_rows, len(self.columns)), dtype = DTYPE)
+        self.n_chunk = 0
+        self.rows_written = 0
+
+        header = {}
+        header["columns"] = list(self.columns)
+        header["dtype"] = DTYPE.str
+        header["created"] = datetime.datetime.now().isoformat()
+        header["metadata"] = metadata if metadata is not None else {}
+        header = json.dumps(header, default = str).encode()
+
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + struct.pack("<I", len(header)) + header)
+        self._sync()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write_row(self, row):
+        '''
+        adds one reading, row holds one value per column
+        '''
+        self.chunk[self.n_chunk] = row
+        self.n_chunk += 1
+        if self.n_chunk == self.chunk_rows:
+            self._write_chunk()
+        if time.monotonic() - self.last_sync > self.fsync_interval:
+            self.flush()
+
+    def write_rows(self, rows):
+        '''
+        adds several readings, one row per reading
+        '''
+        for row in np.asarray(rows, dtype = DTYPE):
+            self.write_row(row)
+
+    def _write_chunk(self):
+        if self.n_chunk == 0:
+            return
+        payload = self.chunk[:self.n_chunk].tobytes()
+        self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, self.n_chunk, zlib.crc32(payload)) + payload)
+        self.rows_written += self.n_chunk
+        self.n_chunk = 0
+
+    def _sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.last_sync = time.monotonic()
+
+    def flush(self):
+        '''
+        writes the partial chunk and syncs the file to disk
+        '''
+        self._write_chunk()
+        self._sync()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+def read_stream(path):
+    '''
+    Reads a file written by StreamWriter, stopping at the first damaged or incomplete chunk.
+
+    Returns
+    -------
+    header : dict
+        "columns", "dtype", "created" and "metadata"
+    data : numpy array
+        one row per reading
+    end : int
+        byte offset just past the last good chunk
+    '''
+    with open(path, "rb") as f:
+        raw = f.read()
+    if raw[:len(MAGIC)] != MAGIC:
+        raise(ValueError("{} is not a stream file".format(path)))
+    pos = len(MAGIC)
+    header_length, = struct.unpack_from("<I", raw, pos)
+    pos += 4
+    header = json.loads(raw[pos:pos + header_length].decode())
+    pos += header_length
+    n_columns = len(header["columns"])
+
+    chunks = []
+    while pos + CHUNK_HEADER.size <= len(raw):
+        magic, n_rows, crc = CHUNK_HEADER.unpack_from(raw, pos)
+        start = pos + CHUNK_HEADER.size
+        stop = start + n_rows*n_columns*DTYPE.itemsize
+        if magic != CHUNK_MAGIC or stop > len(raw) or zlib.crc32(raw[start:stop]) != crc:
+            break
+        chunks.append(np.frombuffer(raw, dtype = DTYPE, count = n_rows*n_columns, offset = start))
+        pos = stop
+
+    data = np.concatenate(chunks) if chunks else np.zeros(0, dtype = DTYPE)
+    return header, data.reshape(-1, n_columns), pos
+
+def recover(path):
+    '''
+    Cuts a truncated or damaged file back to its last good chunk so it reads cleanly.
+
+    Returns
+    -------
+    n_rows : int
+        readings kept
+    '''
+    header, data, end = read_stream(path)
+    if end < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(end)
+    return len(data)
+
+def export_csv(path, csv_path = None):
+    '''
+    Writes a stream file out as CSV in one go, with the column names as the first line.
+
+    Returns
+    -------
+    csv_path : str
+    '''
+    if csv_path is None:
+        csv_path = os.path.splitext(path)[0] + ".csv"
+    header, data, end = read_stream(path)
+    np.savetxt(csv_path, data, delimiter = ",", header = ",".join(header["columns"]), comments = "")
+    return csv_path
+
+#%%
+if __name__ == "__main__":
+    # python streamfile.py recover|export FILE...
+    command = sys.argv[1]
+    for path in sys.argv[2:]:
+        if command == "recover":
+            print(path, recover(path), "readings")
+        elif command == "export":
+            print(export_csv(path))
+        else:
+            raise(ValueError("Unknown command: {}".format(command)))
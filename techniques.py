@@ -0,0 +1,226 @@
+import numpy as np
+import Keithley2401_voltmeter_063023 as K2401
+from cv_engine import ListSweep
+
+class StepTechnique(ListSweep):
+    '''
+    Source steps and pulses run from the SMU's source list, each point started by the arm layer timer,
+    so an edge lands on the SMU's clock and the points after it are interval apart, however slow the host is.
+
+    A program is a list of steps, each a level held for a duration and sampled every interval.
+    Consecutive steps with the same interval and source delay share one list, up to SMU_LIST_MAX_LENGTH points,
+    and run without the host; a pulse/rest train that fits runs whole on the SMU. A change of interval or
+    source delay, or a longer program, starts a new list, which adds a bus round trip to the step before it.
+    In that gap the output is already at the next list's first level (see ListSweep), so a step that starts
+    a list begins when the list before ends and the step before it is that much shorter; keep a step whose
+    length matters within one list.
+
+    Every reading gets the time since the edge of its step, from the SMU's timestamps: the edge is
+    the first point at the new level, source_delay before that point was measured, or for a step that
+    starts a list after another, the last reading of the list before.
+    '''
+
+    def __init__(self, smu, source = "voltage", NPLC = 0.01, V_range = 20, I_range = 10e-3, V_compliance = 5, I_compliance = 1e-1):
+        if source not in ("voltage", "current"):
+            raise(ValueError("Invalid source: {}".format(source)))
+        ListSweep.__init__(self, smu, NPLC, V_range, V_compliance, I_compliance)
+        self.source = source
+        self.measured = "CURR" if source == "voltage" else "VOLT"
+        self.I_range = I_range
+        self.level_name = "Set voltage (V)" if source == "voltage" else "Set current (A)"
+
+    def program(self, steps, interval = 5e-3, source_delay = 0):
+        '''
+        prepares the steps
+
+        Parameters
+        ----------
+        steps : list of dict
+            keys "level" (V or A) and "duration" (s), optionally "interval" and "source_delay" for that step
+        interval : float
+            default time between points (s)
+        source_delay : float
+            default time between applying a level and measuring (s)
+
+        Returns
+        -------
+        n_points : int
+            readings the program takes
+        '''
+        if len(steps) == 0:
+            raise(ValueError("Empty step program"))
+        limit = self.V_compliance if self.source == "voltage" else K2401.SMU_I_HARD_MAX
+        K2401.validate_levels([step["level"] for step in steps], limit, "step levels")
+
+        # (interval, source_delay) and the points of each list
+        segments = []
+        for index, step in enumerate(steps):
+            step_interval = step.get("interval", interval)
+            step_delay = step.get("source_delay", source_delay)
+            if step_interval < self.min_interval(step_delay):
+                raise(ValueError("Step {}: {:.3g} s between points, the SMU needs at least {:.3g} s at NPLC {}".format(
+                    index, step_interval, self.min_interval(step_delay), self.NPLC)))
+            n = int(round(step["duration"]/step_interval))
+            if n < 1:
+                raise(ValueError("Step {}: duration {} is shorter than one point of {} s".format(index, step["duration"], step_interval)))
+            while n > 0:
+                if not segments or segments[-1]["settings"] != (step_interval, step_delay) or len(segments[-1]["levels"]) == K2401.SMU_LIST_MAX_LENGTH:
+                    segments.append({"settings": (step_interval, step_delay), "levels": [], "step": []})
+                take = min(n, K2401.SMU_LIST_MAX_LENGTH - len(segments[-1]["levels"]))
+                segments[-1]["levels"] += [float(step["level"])]*take
+                segments[-1]["step"] += [index]*take
+                n -= take
+
+        self.segments = []
+        for segment in segments:
+            interval, source_delay = segment["settings"]
+            self.segments.append({"interval": interval, "source_delay": source_delay,
+                                  "levels": np.array(segment["levels"]), "step": np.array(segment["step"])})
+        return sum(len(segment["levels"]) for segment in self.segments)
+
+    def _start_segment(self, segment, level_after):
+        if self.source == "voltage":
+            self.smu.setup_timeseries_Imeas(NPLC = self.NPLC, V_range = self.V_range, V_compliance = self.V_compliance, I_compliance = self.I_compliance,
+                                            voltage_list = segment["levels"], interval = segment["interval"], source_delay = segment["source_delay"])
+        else:
+            self.smu.setup_timeseries_Vmeas(NPLC = self.NPLC, I_range = self.I_range, V_compliance = self.V_compliance,
+                                            current_list = segment["levels"], interval = segment["interval"], source_delay = segment["source_delay"])
+        self.smu.initiate_list(level_after)
+
+    def _final_level(self):
+        # holds the last level once the program is over
+        return self.segments[-1]["levels"][-1]
+
+    def _finish(self):
+        level = self._final_level()
+        if self.source == "voltage":
+            self.smu.setup_single_Imeas(NPLC = self.NPLC, V_range = self.V_range, V_compliance = self.V_compliance, I_compliance = self.I_compliance,
+                                        voltage_level = level)
+        else:
+            self.smu.setup_single_Vmeas(NPLC = self.NPLC, I_range = self.I_range, V_compliance = self.V_compliance, current_level = level)
+
+    def run(self):
+        '''
+        Runs the program. Call turn_on first; the output holds its fixed level until the first list starts.
+
+        Yields
+        ------
+        data : dict
+            one per list, keys: "step", "timestamp", "time since edge (s)", "Set voltage (V)" or "Set current (A)",
+            "Voltage (V)", "Current (A)". Values are numpy arrays, timestamps are from the SMU clock.
+
+        The SMU is already running the next list when a list is yielded,
+        so do not talk to it until the generator is exhausted.
+        '''
+        if not self.segments:
+            raise(RuntimeError("Call program before run"))
+
+        last_step = None
+        edge = None
+        last_reading = None
+        for segment, data in self._run_segments(self.segments):
+            timestamps = np.asarray(data["timestamp"], dtype = np.float64)
+            step = segment["step"]
+            starts = np.ones(len(step), dtype = bool)
+            starts[1:] = step[1:] != step[:-1]
+            starts[0] = step[0] != last_step
+            # each point takes the edge of the last step start at or before it, a step carried over from the last list keeps its edge
+            edges = np.where(starts, timestamps - segment["source_delay"], np.nan)
+            if not starts[0]:
+                edges[0] = edge
+            elif last_reading is not None:
+                # the output moved to this step when the list before ended
+                edges[0] = last_reading
+            edges = edges[np.maximum.accumulate(np.where(~np.isnan(edges), np.arange(len(edges)), 0))]
+            last_step = step[-1]
+            edge = edges[-1]
+            last_reading = timestamps[-1]
+
+            out = {}
+            out["step"] = step
+            out["timestamp"] = timestamps
+            out["time since edge (s)"] = timestamps - edges
+            out[self.level_name] = segment["levels"]
+            out["Voltage (V)"] = np.asarray(data["Voltage (V)"], dtype = np.float64)
+            out["Current (A)"] = np.asarray(data["Current (A)"], dtype = np.float64)
+            yield out
+
+def collect(technique):
+    '''
+    Runs technique and returns everything it yields joined into one dict of numpy arrays.
+    '''
+    parts = list(technique.run())
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+def chronoamperometry(smu, step_voltage, step_time, initial_voltage = 0, initial_time = 0.1, final_voltage = None, final_time = 0,
+                      interval = 5e-3, source_delay = 0, **options):
+    '''
+    Potential step: initial_voltage for initial_time, step_voltage for step_time, then final_voltage for final_time
+    if given (a double step). The current transient is read every interval (s) from the edge on.
+    options are the StepTechnique settings (NPLC, V_range, V_compliance, I_compliance).
+
+    Returns
+    -------
+    technique : StepTechnique
+        programmed, call turn_on then run
+    '''
+    steps = [{"level": initial_voltage, "duration": initial_time}, {"level": step_voltage, "duration": step_time}]
+    if final_voltage is not None and final_time > 0:
+        steps.append({"level": final_voltage, "duration": final_time})
+    technique = StepTechnique(smu, "voltage", **options)
+    technique.program(steps, interval, source_delay)
+    return technique
+
+def chronopotentiometry(smu, step_current, step_time, initial_current = 0, initial_time = 0.1, final_current = None, final_time = 0,
+                        interval = 5e-3, source_delay = 0, **options):
+    '''
+    Current step: initial_current for initial_time, step_current for step_time, then final_current for final_time
+    if given (ex. current reversal). The voltage transient is read every interval (s) from the edge on.
+    options are the StepTechnique settings (NPLC, I_range, V_compliance).
+
+    Returns
+    -------
+    technique : StepTechnique
+        programmed, call turn_on then run
+    '''
+    steps = [{"level": initial_current, "duration": initial_time}, {"level": step_current, "duration": step_time}]
+    if final_current is not None and final_time > 0:
+        steps.append({"level": final_current, "duration": final_time})
+    technique = StepTechnique(smu, "current", **options)
+    technique.program(steps, interval, source_delay)
+    return technique
+
+def pulse_train(smu, pulse_level, pulse_time, rest_time, count, base = 0, source = "current", interval = 5e-3, rest_interval = None,
+                source_delay = 0, **options):
+    '''
+    count repetitions of pulse_level for pulse_time then base for rest_time.
+    With rest_interval the rests are sampled more slowly than the pulses, each pulse and rest is then its own list.
+
+    Returns
+    -------
+    technique : StepTechnique
+        programmed, call turn_on then run
+    '''
+    if count < 1:
+        raise(ValueError("Invalid pulse count: {}".format(count)))
+    rest = {"level": base, "duration": rest_time}
+    if rest_interval is not None:
+        rest["interval"] = rest_interval
+    steps = [{"level": pulse_level, "duration": pulse_time}, rest]*count
+    technique = StepTechnique(smu, source, **options)
+    technique.program(steps, interval, source_delay)
+    return technique
+
+def gitt(smu, current, pulse_time, rest_time, count, interval = 5e-3, rest_interval = None, source_delay = 0, **options):
+    '''
+    Galvanostatic intermittent titration: count current pulses, each followed by a rest at zero current.
+    The voltage is read every interval (s), and every rest_interval during the rests if given,
+    so the IR drop at each edge and the relaxation after it are both on the SMU's clock.
+
+    Returns
+    -------
+    technique : StepTechnique
+        programmed, call turn_on then run
+    '''
+    return pulse_train(smu, current, pulse_time, rest_time, count, base = 0, source = "current", interval = interval,
+                       rest_interval = rest_interval, source_delay = source_delay, **options)
@@ -0,0 +1,42 @@
+import os
+import sys
+import pytest
+
+# the modules sit at the top of the repository, as the scripts expect
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# plotting imports pyplot, no display is needed for the decimation
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import Keithley2401_voltmeter_063023 as K2401
+import simulated_smu
+
+class WriteLog():
+    '''
+    stands in for the pyvisa resource and keeps everything written to it
+    '''
+
+    def __init__(self):
+        self.resource_name = "LOG::INSTR"
+        self.timeout = 2000
+        self.writes = []
+
+    def write(self, txt):
+        self.writes.append(txt)
+
+@pytest.fixture
+def log():
+    return WriteLog()
+
+@pytest.fixture
+def logged_smu(log):
+    return K2401.Keithley2401(log)
+
+@pytest.fixture
+def sim():
+    return simulated_smu.SimulatedKeithley2401(resistance = 1e3)
+
+@pytest.fixture
+def smu(sim):
+    smu = K2401.Keithley2401(sim)
+    smu.initial_setup()
+    return smu
@@ -0,0 +1,65 @@
+import pytest
+import acquisition
+
+class ListSink():
+
+    def __init__(self):
+        self.rows = []
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+def test_rows_reach_sinks_when_measure_fails():
+    starts = []
+    def measure():
+        # the third reading cannot be started, ex. a bus timeout
+        if len(starts) == 2:
+            raise(RuntimeError("timeout"))
+        starts.append(len(starts))
+    sink = ListSink()
+    acq = acquisition.AcquisitionThread(measure, 1e-3, num_readings = 5, sinks = [sink], finish = lambda: (1e-3, float(len(starts))))
+    acq.start()
+    acq.join()
+    with pytest.raises(RuntimeError):
+        acq.check()
+    # the second row was still waiting for the next reading's integration
+    assert [row[1:] for row in sink.rows] == [(1e-3, 1.0), (1e-3, 2.0)]
+
+def test_sampler_backs_off_while_flat():
+    sampler = acquisition.AdaptiveSampler(0.01, 0.1, dV_dt = 1.0, backoff = 2)
+    intervals = [sampler.update((0.01*i, 1e-3, 1.0)) for i in range(8)]
+    # doubles from the second reading on, up to max_interval
+    assert intervals[:6] == pytest.approx([0.01, 0.02, 0.04, 0.08, 0.1, 0.1])
+
+def test_sampler_speeds_up_on_change():
+    sampler = acquisition.AdaptiveSampler(0.01, 1.0, dV_dt = 1.0, backoff = 2)
+    sampler.interval = 0.5
+    sampler.update((0.0, 0, 1.0))
+    # 5 V/s is five times the threshold
+    assert sampler.update((0.5, 0, 3.5)) == pytest.approx(0.1)
+    # a jump far over the threshold stops at min_interval
+    assert sampler.update((0.6, 0, 13.5)) == pytest.approx(0.01)
+    assert sampler.n_faster == 2
+
+def test_sampler_residual_catches_a_change_of_slope():
+    # a steady ramp just under the rate threshold, then it turns
+    sampler = acquisition.AdaptiveSampler(1e-3, 1.0, dV_dt = 1.0, V_residual = 0.01, backoff = 2)
+    sampler.interval = 0.1
+    for t, V in ((0.0, 0.0), (0.1, 0.09), (0.2, 0.18)):
+        assert sampler.update((t, 0, V)) == 0.1
+    # 0.18 V off the line, the rate alone would keep the interval
+    assert sampler.update((0.3, 0, 0.09)) == pytest.approx(0.1/18)
+
+def test_adaptive_run_on_simulated_smu(smu):
+    smu.setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+    smu.turn_on()
+    sampler = acquisition.AdaptiveSampler(0.005, 0.04, dV_dt = 1.0, backoff = 2)
+    sink = ListSink()
+    acq = acquisition.AcquisitionThread(smu.single_Vmeas, 0.005, sinks = [sink], sampler = sampler, duration = 0.3)
+    acq.start()
+    acq.join(timeout = 10)
+    acq.check()
+    # a resistor does not change, most of the run is at max_interval
+    assert sampler.interval == 0.04
+    assert len(sink.rows) < 0.3/0.005/2
+    assert all(row[2] == pytest.approx(1.0) for row in sink.rows)
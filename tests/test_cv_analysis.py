@@ -0,0 +1,62 @@
+import os
+import numpy as np
+import pytest
+import cv_analysis
+import waveforms
+
+def synthetic_cv(cycles = 2):
+    # 0 -> 1 -> 0 V, an oxidation peak at 0.6 V going up and a reduction peak at 0.4 V coming down
+    cycle, step = waveforms.triangle_cycle(0, 1, 0.005)
+    voltages = np.tile(cycle, cycles)
+    rising = np.concatenate(([True], np.diff(voltages) > 0))
+    currents = np.where(rising, 1e-3*np.exp(-((voltages - 0.6)/0.05)**2), -1e-3*np.exp(-((voltages - 0.4)/0.05)**2))
+    return voltages, currents
+
+def write_cv(path, voltages, currents):
+    np.savetxt(path, np.c_[voltages, currents], delimiter = ",")
+
+def test_peaks_and_charge():
+    voltages, currents = synthetic_cv()
+    rows = cv_analysis.analyze_cycles(voltages, currents, scan_rate = 0.1, smooth_window = 1)
+    assert len(rows) == 2
+    for row in rows:
+        assert row["Epa"] == pytest.approx(0.6, abs = 0.005)
+        assert row["Epc"] == pytest.approx(0.4, abs = 0.005)
+        assert row["dEp"] == pytest.approx(0.2, abs = 0.01)
+        # the two peaks hold the same charge, sqrt(pi)*width*height/scan_rate
+        assert row["anodic_charge"] == pytest.approx(np.sqrt(np.pi)*0.05*1e-3/0.1, rel = 0.01)
+        assert row["charge"] == pytest.approx(0, abs = 1e-6)
+
+def test_vertex_is_not_a_peak():
+    # a current that only grows with the voltage peaks at the vertex
+    cycle, step = waveforms.triangle_cycle(0, 1, 0.01)
+    row, = cv_analysis.analyze_cycles(cycle, cycle*1e-3)
+    assert np.isnan(row["Epa"])
+
+def test_archive_reanalyzes_only_changed_files(tmp_path):
+    archive = tmp_path/"archive"
+    archive.mkdir()
+    voltages, currents = synthetic_cv()
+    paths = []
+    for name in ("a", "b"):
+        path = str(archive/"2023_06_30_cyclic_voltammetry_data_0-1_v_0.1_v_per_s_{}.csv".format(name))
+        write_cv(path, voltages, currents)
+        paths.append(path)
+    broken = str(archive/"2023_06_30_cyclic_voltammetry_data_broken.csv")
+    with open(broken, "w") as f:
+        f.write("not,a,number\n")
+    paths.append(broken)
+    out = str(tmp_path/"out")
+
+    index = cv_analysis.analyze_archive(paths, out, workers = 2)
+    assert index[os.path.abspath(broken)]["error"] is not None
+    rows = cv_analysis.lookup(out, os.path.basename(paths[0]))
+    assert [row["cycle"] for row in rows] == ["1", "2"]
+    assert float(rows[0]["scan_rate"]) == 0.1
+
+    # one cycle less in a, b untouched
+    write_cv(paths[0], voltages[:len(voltages)//2], currents[:len(currents)//2])
+    os.utime(paths[0], (1, 1))
+    index = cv_analysis.analyze_archive(paths, out, workers = 2)
+    assert len(cv_analysis.lookup(out, os.path.basename(paths[0]))) == 1
+    assert len(cv_analysis.lookup(out, os.path.basename(paths[1]))) == 2
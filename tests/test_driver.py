@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+import Keithley2401_voltmeter_063023 as K2401
+
+def test_parse_binary_block_indefinite_length():
+    values = np.array([1.5, -2.25, 3e-6], dtype = "<f4")
+    # the 2400 sends "#0", then the data and the terminator
+    nums = K2401.parse_binary_block(b"#0" + values.tobytes() + b"\n", "<f4")
+    assert np.array_equal(nums, values)
+
+def test_parse_binary_block_definite_length():
+    values = np.arange(5, dtype = "<f8")
+    payload = values.tobytes()
+    raw = "#2{}".format(len(payload)).encode() + payload + b"\n"
+    assert np.array_equal(K2401.parse_binary_block(raw, "<f8"), values)
+
+def test_parse_binary_block_rejects_ascii():
+    with pytest.raises(ValueError):
+        K2401.parse_binary_block(b"+1.000E+00,+2.000E+00\n", "<f4")
+
+def test_upload_list_chunks_fit_input_buffer(logged_smu, log):
+    values = np.linspace(-1.2345678, 1.2345678, 750)
+    logged_smu.upload_list(":SOUR:LIST:VOLT", values)
+    assert len(log.writes) > 1
+    assert log.writes[0].startswith(":SOUR:LIST:VOLT ")
+    assert all(command.startswith(":SOUR:LIST:VOLT:APP ") for command in log.writes[1:])
+    tokens = []
+    for command in log.writes:
+        # the terminator still has to fit
+        assert len(command) + 1 <= K2401.SMU_INPUT_BUFFER
+        points = command.split(" ", 1)[1].split(",")
+        assert len(points) <= K2401.SMU_LIST_MAX_POINTS
+        tokens += points
+    assert np.allclose(np.array(tokens, dtype = float), values, rtol = 1e-6)
+
+def test_upload_list_cached(logged_smu, log):
+    values = np.linspace(0, 1, 200)
+    logged_smu.upload_list(":SOUR:LIST:VOLT", values)
+    n_writes = len(log.writes)
+    logged_smu.upload_list(":SOUR:LIST:VOLT", values.copy())
+    assert len(log.writes) == n_writes
+    values[7] = 0.5
+    logged_smu.upload_list(":SOUR:LIST:VOLT", values)
+    assert len(log.writes) > n_writes
+
+def test_configure_sends_only_changes(logged_smu, log):
+    assert logged_smu.configure(":SENS:CURR:NPLC", 1)
+    assert not logged_smu.configure(":SENS:CURR:NPLC", 1)
+    assert log.writes == [":SENS:CURR:NPLC 1"]
+    assert logged_smu.configure(":SENS:CURR:NPLC", 0.1)
+    logged_smu.invalidate_state()
+    assert logged_smu.configure(":SENS:CURR:NPLC", 0.1)
+    assert log.writes == [":SENS:CURR:NPLC 1", ":SENS:CURR:NPLC 0.1", ":SENS:CURR:NPLC 0.1"]
+
+def test_verify_state_drops_mismatches(smu, sim):
+    smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)
+    assert smu.verify_state() == {}
+    # changed behind the driver's back
+    sim.write(":SENS:CURR:NPLC 10")
+    mismatches = smu.verify_state()
+    assert list(mismatches) == [":SENS:CURR:NPLC"]
+    assert ":SENS:CURR:NPLC" not in smu.state
+
+def test_validate_levels():
+    assert K2401.validate_levels([0, 1e-3], K2401.SMU_I_HARD_MAX).dtype == np.float64
+    for levels in ([], [np.nan], [1.0], [[0.0]]):
+        with pytest.raises(ValueError):
+            K2401.validate_levels(levels, K2401.SMU_I_HARD_MAX)
+
+def test_plan_speed_profile(smu):
+    # plenty of time: the most accurate settings of the class
+    profile = smu.plan_speed_profile(1.0, "high")
+    assert (profile["NPLC"], profile["autozero"], profile["display"], profile["feasible"]) == (10, "ON", True, True)
+    # tighter: the display goes before the integration time, then the NPLC comes down
+    tight = smu.plan_speed_profile(0.025, "normal")
+    assert tight["feasible"] and tight["point_time"] <= 0.025
+    assert tight["NPLC"] < 1
+    # the timing model is what plan_speed_profile checks against
+    assert smu.estimate_point_time(tight) == tight["point_time"]
+    impossible = smu.plan_speed_profile(1e-3, "high")
+    assert not impossible["feasible"]
+    assert impossible["NPLC"] == 1
+    with pytest.raises(ValueError):
+        smu.plan_speed_profile(1.0, "ludicrous")
+
+def test_apply_speed_profile(smu, sim):
+    smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)
+    profile = smu.plan_speed_profile(5e-3, "fast")
+    smu.apply_speed_profile(profile)
+    assert float(sim.state["SENS:VOLT:NPLC"]) == profile["NPLC"]
+    assert sim.state["SYST:AZER"] == "0"
+    assert smu.state[":DISP:ENAB"] == ("ON" if profile["display"] else "OFF")
+    # a current source measures voltage, the fast class does not auto range
+    assert smu.state[":SENS:VOLT:RANG:AUTO"] == "OFF"
+    assert smu.current_speed_profile(profile["NPLC"], measured = "VOLT")["auto_range"] is False
+    # ONCE autozeroes on every apply, the rest is cached
+    n_writes = sim.n_writes
+    smu.apply_speed_profile(profile)
+    assert sim.n_writes - n_writes == (1 if profile["autozero"] == "ONCE" else 0)
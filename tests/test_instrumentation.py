@@ -0,0 +1,43 @@
+import json
+import pytest
+import instrumentation
+
+def test_scpi_header():
+    assert instrumentation.scpi_header(":SOUR:CURR:LEV 0.001;:OUTP ON") == ":SOUR:CURR:LEV;:OUTP"
+    assert instrumentation.scpi_header(":READ?") == ":READ?"
+
+def test_counts_commands_and_callers(smu, sim):
+    stats = instrumentation.Instrumentation()
+    smu.instrumentation = stats
+    n_before = sim.n_writes + sim.n_reads
+    smu.setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+    smu.turn_on()
+    for _ in range(3):
+        smu.single_Vmeas()
+    data = stats.to_dict()
+    # a read is keyed by the command written before it
+    assert data["commands"]["write :READ?"]["count"] == 3
+    assert data["commands"]["read :READ?"]["count"] == 3
+    assert data["commands"]["write :SOUR:CURR:LEV"]["bytes_out"] > 0
+    assert data["callers"]["single_Vmeas"]["count"] == 6
+    assert data["callers"]["setup_single_Vmeas"]["count"] > 0
+    # every transaction is counted once under its command
+    assert sum(c["count"] for c in data["commands"].values()) == sim.n_writes + sim.n_reads - n_before
+
+def test_percentiles_and_summary(tmp_path):
+    stats = instrumentation.CommandStats()
+    for seconds in [1e-4]*99 + [1e-1]:
+        stats.add(seconds, 10, 0)
+    assert stats.percentile(50) < 2e-4
+    assert stats.percentile(100) == pytest.approx(1e-1)
+
+    log = instrumentation.Instrumentation(attribute_callers = False)
+    log.record(None, "write", ":SOUR:VOLT:LEV 1", 1e-3, 16)
+    log.record(None, "read", None, 2e-3, 0, 12)
+    assert "read :SOUR:VOLT:LEV" in log.to_dict()["commands"]
+    path = str(tmp_path/"io.txt")
+    log.save_summary(path)
+    with open(str(tmp_path/"io.json")) as f:
+        assert json.load(f)["bus_time"] == pytest.approx(3e-3)
+    log.reset()
+    assert log.to_dict()["commands"] == {}
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import mmapstore
+
+def fill(store, n_rows, t_offset = 0):
+    for i in range(n_rows):
+        store.write_row((t_offset + i, 1e-3*i, np.sin(i)))
+
+def test_append_reopens(tmp_path):
+    directory = str(tmp_path/"store")
+    store = mmapstore.MmapStore(directory, factor = 4, n_levels = 2)
+    fill(store, 30)
+    store.close()
+    store = mmapstore.MmapStore(directory, mode = "a")
+    assert store.n_rows == 30
+    fill(store, 10, t_offset = 30)
+    assert np.array_equal(store.column("timestamp"), np.arange(40))
+    store.close()
+
+def test_overwrite_starts_fresh(tmp_path):
+    directory = str(tmp_path/"store")
+    store = mmapstore.MmapStore(directory, mode = "w")
+    fill(store, 300)
+    store.close()
+    store = mmapstore.MmapStore(directory, mode = "w")
+    fill(store, 20)
+    assert store.n_rows == 20
+    assert np.array_equal(store.column("timestamp"), np.arange(20))
+    assert all(level.n_rows == 0 for level in store.levels[1:])
+    store.close()
+
+def test_invalid_mode(tmp_path):
+    with pytest.raises(ValueError):
+        mmapstore.MmapStore(str(tmp_path/"store"), mode = "r")
+
+def test_window_uses_pyramid(tmp_path):
+    store = mmapstore.MmapStore(str(tmp_path/"store"), factor = 4, n_levels = 3)
+    fill(store, 1000)
+    raw = store.window(100, 140)
+    assert raw["level"] == 0
+    assert np.array_equal(raw["timestamp"], np.arange(100, 141))
+    coarse = store.window(max_points = 100)
+    assert coarse["level"] > 0
+    # the buckets' min and max still cover every reading
+    voltage = np.sin(np.arange(1000))
+    assert coarse["Voltage (V)"].min() == voltage.min()
+    assert coarse["Voltage (V)"].max() == voltage.max()
+    store.close()
+
+def test_crash_keeps_rows_up_to_last_meta(tmp_path):
+    directory = str(tmp_path/"store")
+    store = mmapstore.MmapStore(directory, factor = 4, n_levels = 2, meta_every = 10)
+    fill(store, 25)
+    # no close, as if the process died
+    del store
+    store = mmapstore.MmapStore(directory)
+    assert store.n_rows == 20
+    assert np.array_equal(store.column("timestamp"), np.arange(20))
+    store.close()
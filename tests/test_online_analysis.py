@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+import online_analysis
+
+def test_charge_constant_current():
+    counter = online_analysis.ChargeCounter()
+    for t in np.arange(0, 10.5, 0.5):
+        counter.update(t, 2e-3)
+    assert counter.charge == pytest.approx(2e-2)
+    assert counter.throughput == pytest.approx(2e-2)
+
+def test_charge_through_zero():
+    counter = online_analysis.ChargeCounter()
+    counter.update(0, 1.0)
+    counter.update(2, -1.0)
+    # crosses zero halfway, +0.5 C then -0.5 C
+    assert counter.charge == pytest.approx(0.0)
+    assert counter.throughput == pytest.approx(1.0)
+
+def test_charge_matches_trapezoid():
+    t = np.linspace(0, 5, 101)
+    current = np.sin(t)
+    counter = online_analysis.ChargeCounter()
+    for time, value in zip(t, current):
+        counter.update(time, value)
+    assert counter.charge == pytest.approx(np.sum(0.5*(current[1:] + current[:-1])*np.diff(t)))
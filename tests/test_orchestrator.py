@@ -0,0 +1,63 @@
+import pytest
+import orchestrator
+import simulated_smu
+
+class ListSink():
+
+    def __init__(self):
+        self.rows = []
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+def open_pool(resistances):
+    pool = orchestrator.InstrumentPool()
+    for i, resistance in enumerate(resistances):
+        name = "cell{}".format(i + 1)
+        pool.open(name, simulated_smu.SimulatedKeithley2401(name, resistance = resistance))
+        pool[name].setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+        pool[name].turn_on()
+    return pool
+
+@pytest.mark.parametrize("mode", ["overlap", "interleave"])
+def test_channels_keep_their_own_rows(mode):
+    pool = open_pool([1e3, 2e3])
+    run = orchestrator.Orchestrator(pool, mode)
+    sinks = {name: ListSink() for name in ("cell1", "cell2")}
+    for name, sink in sinks.items():
+        run.add_channel(name, 2e-3, num_readings = 5, sinks = [sink])
+    run.start()
+    run.join(timeout = 10)
+    run.check()
+    for name, volts in (("cell1", 1.0), ("cell2", 2.0)):
+        rows = sinks[name].rows
+        assert len(rows) == 5
+        assert all(V == pytest.approx(volts) for t, I, V in rows)
+        # each channel on its own schedule
+        assert all(b[0] > a[0] for a, b in zip(rows, rows[1:]))
+    pool.close()
+
+def test_overlap_aborts_the_others_on_failure():
+    pool = open_pool([1e3, 1e3])
+    def broken_fetch(timeout = None):
+        raise(RuntimeError("bus error"))
+    pool["cell1"].fetch_data = broken_fetch
+    run = orchestrator.Orchestrator(pool, "overlap")
+    run.add_channel("cell1", 2e-3, num_readings = 3)
+    run.add_channel("cell2", 2e-3, num_readings = 3)
+    run.start()
+    run.join(timeout = 10)
+    with pytest.raises(RuntimeError):
+        run.check()
+    # neither SMU is left with a reading pending
+    assert not pool["cell1"].armed and not pool["cell2"].armed
+    # and the locks are released
+    assert pool.lock("cell1").acquire(blocking = False)
+    pool.lock("cell1").release()
+    pool.close()
+
+def test_pool_rejects_duplicate_names():
+    pool = open_pool([1e3])
+    with pytest.raises(ValueError):
+        pool.open("cell1", simulated_smu.SimulatedKeithley2401())
+    pool.close()
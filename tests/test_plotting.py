@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+import plotting
+
+@pytest.mark.parametrize("max_buckets", [2, 3, 5, 8, 101])
+def test_decimator_keeps_extremes(max_buckets):
+    rng = np.random.default_rng(1)
+    y = rng.standard_normal(5003)
+    y[17] = -50
+    y[4990] = 50
+    decimator = plotting.MinMaxDecimator(max_buckets)
+    for x, value in enumerate(y):
+        decimator.append(x, value)
+    xs, ys = decimator.points()
+    assert ys.min() == -50 and ys.max() == 50
+    assert np.all(np.diff(xs) > 0)
+    assert len(xs) <= 2*max_buckets + 2
+    # every point returned is a real reading
+    assert np.array_equal(y[xs.astype(int)], ys)
+
+def test_decimator_odd_bucket_carried_over():
+    decimator = plotting.MinMaxDecimator(5)
+    y = np.zeros(50)
+    # in the fifth bucket when the first merge happens
+    y[4] = 99
+    for x, value in enumerate(y):
+        decimator.append(x, value)
+    assert decimator.points()[1].max() == 99
+
+def test_decimator_short_run_untouched():
+    decimator = plotting.MinMaxDecimator(100)
+    for x in range(10):
+        decimator.append(x, x*x)
+    xs, ys = decimator.points()
+    assert np.array_equal(xs, np.arange(10))
+
+def test_decimator_rejects_one_bucket():
+    with pytest.raises(ValueError):
+        plotting.MinMaxDecimator(1)
@@ -0,0 +1,51 @@
+import pytest
+import Keithley2401_voltmeter_063023 as K2401
+import protocol
+import simulated_smu
+
+CV = {"type": "cv", "initial_voltage": 0, "final_voltage": 1, "scan_rate": 10, "step": 0.05, "NPLC": 0.01}
+HOLD = {"type": "constant_current", "level": 1e-4, "duration": 0.3, "interval": 0.05}
+
+class Rows():
+    def __init__(self):
+        self.rows = []
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+@pytest.mark.parametrize("step", [
+    {"type": "ocv", "duration": 1},
+    {"type": "constant_current", "level": 1e-3, "duration": 10},
+    {"type": "constant_current", "level": 1e-3, "duration": 10, "interval": 1, "V_range": 20},
+    {"type": "constant_voltage", "level": 1, "duration": 10, "interval": 0},
+    {"type": "constant_current", "level": 2*K2401.SMU_I_HARD_MAX, "duration": 10, "interval": 1},
+    {"type": "constant_voltage", "level": 6, "duration": 10, "interval": 1},
+    {"type": "constant_voltage", "level": 12, "duration": 10, "interval": 1, "V_compliance": 11},
+])
+def test_validate_rejects(step):
+    with pytest.raises(ValueError):
+        protocol.validate([step])
+
+def test_validate_accepts():
+    protocol.validate([CV, HOLD, {"type": "constant_voltage", "level": 6, "duration": 10, "interval": 1, "V_compliance": 11}])
+    with pytest.raises(ValueError):
+        protocol.validate([])
+
+def test_runner_checks_every_step_before_touching_the_smu(logged_smu, log):
+    with pytest.raises(ValueError):
+        protocol.ProtocolRunner(logged_smu, [CV, dict(CV, scan_rate = 1e3)])
+    assert log.writes == []
+
+def test_runner_on_simulator():
+    # in real time, so the SMU's clock and the host's agree as they would on the bench
+    smu = K2401.Keithley2401(simulated_smu.SimulatedKeithley2401(realtime = True))
+    smu.initial_setup()
+    sink = Rows()
+    results = protocol.ProtocolRunner(smu, [CV, HOLD], sinks = [sink]).run()
+    assert [result["type"] for result in results] == ["cv", "constant_current"]
+    assert results[0]["n_readings"] == 40
+    assert results[1]["n_readings"] == 6
+    assert len(sink.rows) == 46
+    assert [row[3] for row in sink.rows] == [0]*40 + [1]*6
+    # timestamps run on from one step to the next
+    assert sink.rows[40][0] >= sink.rows[39][0]
@@ -0,0 +1,43 @@
+import numpy as np
+import acquisition
+import shm_ring
+
+def test_ring_buffer_overwrite_counts_dropped():
+    ring = acquisition.RingBuffer(8)
+    for i in range(5):
+        ring.write((i, 0, 0))
+    assert np.array_equal(ring.read_new()[:, 0], np.arange(5))
+    for i in range(5, 25):
+        ring.write((i, 0, 0))
+    rows = ring.read_new()
+    assert np.array_equal(rows[:, 0], np.arange(17, 25))
+    assert ring.dropped == 12
+
+def test_ring_buffer_drops_row_being_written():
+    ring = acquisition.RingBuffer(4)
+    for i in range(4):
+        ring.write((i, 0, 0))
+    # the writer has announced the next row, which reuses the oldest slot, but not finished it
+    ring.writing = ring.written + 1
+    rows = ring.read_new()
+    assert np.array_equal(rows[:, 0], [1, 2, 3])
+    assert ring.dropped == 1
+
+def test_shared_ring_round_trip():
+    ring = shm_ring.SharedRingBuffer(capacity = 16, metadata = {"cell": "A"})
+    try:
+        reader = shm_ring.SharedRingReader(ring.name)
+        assert reader.metadata == {"cell": "A"}
+        assert ring.wait_for_readers(1, 0) == 1
+        ring.write_rows(np.column_stack((np.arange(10.0), np.zeros(10), np.zeros(10))))
+        ring.write_row((10.0, 0, 0))
+        assert reader.pending() == 11
+        assert np.array_equal(reader.read_new()[:, 0], np.arange(11))
+        # more than a buffer behind
+        ring.write_rows(np.column_stack((np.arange(11.0, 51.0), np.zeros(40), np.zeros(40))))
+        rows = reader.read_new()
+        assert np.array_equal(rows[:, 0], np.arange(35, 51))
+        assert reader.dropped == 24
+        reader.close()
+    finally:
+        ring.close()
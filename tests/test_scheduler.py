@@ -0,0 +1,55 @@
+import pytest
+import scheduler
+
+class FakeClock():
+    '''
+    time.monotonic and time.sleep for the scheduler, sleeping only moves the clock
+    '''
+
+    def __init__(self):
+        self.now = 100.0
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+def make(policy, fake):
+    return scheduler.DeadlineScheduler(0.1, policy = policy, clock = fake.clock, sleep = fake.sleep)
+
+def test_slow_iteration_does_not_shift_later_ticks():
+    fake = FakeClock()
+    clock = make("catch_up", fake)
+    assert clock.wait() == 0
+    fake.now += 0.25
+    # the two ticks missed fire straight away, then the schedule is back at multiples of the interval
+    assert [clock.wait() for _ in range(4)] == pytest.approx([0.1, 0.2, 0.3, 0.4])
+    assert fake.now == pytest.approx(100.4)
+    stats = clock.stats()
+    assert stats["ticks"] == 5 and stats["overruns"] == 1 and stats["skipped"] == 0
+    assert stats["jitter_max"] == pytest.approx(0.15)
+
+def test_skip_drops_missed_ticks():
+    fake = FakeClock()
+    clock = make("skip", fake)
+    clock.wait()
+    fake.now += 0.35
+    assert clock.wait() == pytest.approx(0.3)
+    assert clock.wait() == pytest.approx(0.4)
+    assert clock.stats()["skipped"] == 2
+
+def test_set_interval_applies_from_next_deadline():
+    fake = FakeClock()
+    clock = make("catch_up", fake)
+    clock.wait()
+    clock.set_interval(0.5)
+    assert clock.remaining() == pytest.approx(0.5)
+    assert clock.wait() == pytest.approx(0.5)
+    assert clock.wait() == pytest.approx(1.0)
+
+def test_invalid_settings():
+    with pytest.raises(ValueError):
+        scheduler.DeadlineScheduler(0)
+    with pytest.raises(ValueError):
+        scheduler.DeadlineScheduler(1, policy = "whenever")
@@ -0,0 +1,50 @@
+import pytest
+import Keithley2401_voltmeter_063023 as K2401
+import session_recorder
+import simulated_smu
+
+def session(resource):
+    # a short run using queries, status polls and readings
+    smu = K2401.Keithley2401(resource)
+    smu.initial_setup()
+    smu.setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+    smu.turn_on()
+    readings = [smu.single_Vmeas()]
+    smu.arm()
+    readings.append(smu.fetch_data())
+    smu.turn_off()
+    return readings
+
+def test_replay_matches_recording(tmp_path):
+    path = str(tmp_path/"session.smurec")
+    recorder = session_recorder.RecordingResource(simulated_smu.SimulatedKeithley2401(resistance = 1e3), path)
+    recorded = session(recorder)
+    recorder.close()
+    header, records = session_recorder.read_session(path)
+    assert header["resource_name"] == "SIM::2401::INSTR"
+    counts, length = session_recorder.summary(path)
+    assert counts["W"]["count"] > 0 and length > 0
+
+    replay = session_recorder.ReplayResource(path, latency_scale = 0)
+    assert session(replay) == recorded
+    assert replay.remaining() == 0
+
+def test_replay_rejects_other_traffic(tmp_path):
+    path = str(tmp_path/"session.smurec")
+    recorder = session_recorder.RecordingResource(simulated_smu.SimulatedKeithley2401(), path)
+    session(recorder)
+    recorder.close()
+    smu = K2401.Keithley2401(session_recorder.ReplayResource(path, latency_scale = 0))
+    smu.initial_setup()
+    with pytest.raises(session_recorder.ReplayError):
+        smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)
+
+def test_truncated_recording_drops_last_record(tmp_path):
+    path = str(tmp_path/"session.smurec")
+    recorder = session_recorder.RecordingResource(simulated_smu.SimulatedKeithley2401(), path)
+    session(recorder)
+    recorder.close()
+    n_records = len(session_recorder.read_session(path)[1])
+    with open(path, "rb+") as f:
+        f.truncate(f.seek(0, 2) - 1)
+    assert len(session_recorder.read_session(path)[1]) == n_records - 1
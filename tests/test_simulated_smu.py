@@ -0,0 +1,174 @@
+import numpy as np
+import pytest
+import pyvisa
+import Keithley2401_voltmeter_063023 as K2401
+import cv_engine
+import techniques
+import simulated_smu
+
+def test_single_reading_follows_ohms_law(smu):
+    smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)
+    smu.turn_on()
+    current, voltage = smu.single_Vmeas()
+    assert current == pytest.approx(1e-3)
+    assert voltage == pytest.approx(1.0)
+
+@pytest.mark.parametrize("data_format", ["ascii", "sreal", "real64"])
+def test_list_sweep_in_every_format(smu, data_format):
+    smu.set_data_format(data_format)
+    levels = np.linspace(-1e-3, 1e-3, 21)
+    smu.setup_timeseries_Vmeas(NPLC = 0.01, current_list = levels, interval = 0.01)
+    smu.turn_on()
+    smu.initiate_timeseries_Vmeas()
+    data = smu.read_data()
+    assert np.allclose(data["Voltage (V)"], levels*1e3, rtol = 1e-5)
+    assert np.allclose(np.diff(data["timestamp"]), 0.01, rtol = 1e-3)
+
+def test_arm_and_fetch(smu):
+    smu.setup_single_Vmeas(NPLC = 1, current_level = 2e-3)
+    smu.turn_on()
+    for _ in range(3):
+        smu.arm()
+        current, voltage = smu.fetch_data(timeout = 2)
+        assert voltage == pytest.approx(2.0)
+    assert not smu.armed
+
+def test_service_request_wait(smu, sim):
+    # VISA only queues service requests once they are enabled
+    with pytest.raises(pyvisa.errors.VisaIOError):
+        sim.wait_on_event(pyvisa.constants.EventType.service_request, 10)
+    smu.use_srq = True
+    smu.setup_single_Vmeas(NPLC = 1, current_level = 1e-3)
+    smu.turn_on()
+    for _ in range(3):
+        smu.arm()
+        assert smu.fetch_data(timeout = 2)[1] == pytest.approx(1.0)
+    assert sim.srq_enabled
+
+def test_cv_engine(smu):
+    smu.apply_speed_profile(smu.plan_speed_profile(0.01, "fast"))
+    cv = cv_engine.CVEngine(smu, NPLC = 0.1)
+    interval = cv.program(0, 1, 1, step = 0.01, cycles = 2)
+    assert interval == pytest.approx(0.01)
+    with pytest.raises(ValueError):
+        cv.program(0, 1, 10, step = 0.01)
+    smu.turn_on()
+    cycles = list(cv.run())
+    assert [c["cycle"] for c in cycles] == [1, 2]
+    for c in cycles:
+        assert np.allclose(c["Set voltage (V)"], c["Voltage (V)"])
+        assert np.allclose(np.diff(c["timestamp"]), interval, rtol = 1e-3)
+    # left at the start of the sweep
+    assert smu.state[":SOUR:VOLT:MODE"] == "FIXED"
+
+def test_cv_engine_long_cycle_split(smu):
+    cv = cv_engine.CVEngine(smu, NPLC = 0.01)
+    cv.program(0, 10, 1, step = 0.005)
+    assert len(cv.segments) == 2
+    assert all(len(segment["levels"]) <= K2401.SMU_LIST_MAX_LENGTH for segment in cv.segments)
+    smu.turn_on()
+    cycle, = cv.run()
+    assert len(cycle["timestamp"]) == 4000
+    assert np.allclose(cycle["Voltage (V)"], cycle["Set voltage (V)"])
+    assert np.all(np.diff(cycle["timestamp"]) > 0)
+
+def test_min_interval_follows_line_frequency(smu):
+    cv = cv_engine.CVEngine(smu, NPLC = 1)
+    at_60 = cv.min_interval()
+    smu.line_frequency = 50
+    assert cv.min_interval() > at_60
+
+def test_min_interval_follows_settings(smu):
+    cv = cv_engine.CVEngine(smu, NPLC = 1)
+    # after *RST autozero, the display and auto range are on, autozero doubles the integration
+    default = cv.min_interval()
+    smu.apply_speed_profile({"NPLC": 1, "autozero": "OFF", "display": False, "auto_range": False, "source_delay": 0, "trigger_delay": 0})
+    assert cv.min_interval() < default/1.5
+
+def test_step_edges(smu):
+    smu.apply_speed_profile(smu.plan_speed_profile(5e-3, "fast"))
+    technique = techniques.chronoamperometry(smu, 1, 0.2, initial_voltage = 0, initial_time = 0.1, interval = 5e-3, source_delay = 1e-3)
+    smu.turn_on()
+    data = techniques.collect(technique)
+    assert np.array_equal(np.unique(data["step"]), [0, 1])
+    first = np.argmax(data["step"] == 1)
+    # the first point of a step is measured source_delay after its edge
+    assert data["time since edge (s)"][first] == pytest.approx(1e-3)
+    assert data["time since edge (s)"][first + 10] == pytest.approx(1e-3 + 10*5e-3, rel = 1e-3)
+    assert data["Set voltage (V)"][first] == 1
+
+def test_pulse_train_with_slow_rests(smu):
+    technique = techniques.gitt(smu, 1e-3, 0.05, 0.2, 3, interval = 5e-3, rest_interval = 0.05)
+    # a pulse and a rest per list
+    assert len(technique.segments) == 6
+    smu.turn_on()
+    parts = list(technique.run())
+    assert len(parts) == 6
+    assert [len(part["step"]) for part in parts] == [10, 4]*3
+    assert parts[-1]["Set current (A)"][-1] == 0
+
+def test_one_point_lists(smu):
+    # each pulse is a list of its own, one point long
+    technique = techniques.pulse_train(smu, 1e-3, 5e-3, 0.04, 3, interval = 5e-3, rest_interval = 0.02)
+    assert [len(segment["levels"]) for segment in technique.segments] == [1, 2]*3
+    smu.turn_on()
+    data = techniques.collect(technique)
+    assert len(data["timestamp"]) == 9
+    assert np.allclose(data["Voltage (V)"], data["Set current (A)"]*1e3)
+
+def test_fixed_level_is_next_list_start(smu, sim):
+    # in the gap after each list the output is already at the next list's first level
+    technique = techniques.gitt(smu, 1e-3, 0.05, 0.2, 2, interval = 5e-3, rest_interval = 0.05)
+    levels = []
+    write = sim.write
+    def recording_write(txt):
+        write(txt)
+        if txt.strip().endswith(":READ?"):
+            levels.append(float(sim.state["SOUR:CURR:LEV"]))
+    sim.write = recording_write
+    smu.turn_on()
+    parts = list(technique.run())
+    starts = [segment["levels"][0] for segment in technique.segments]
+    assert levels == starts[1:] + [technique.segments[-1]["levels"][-1]]
+    # a step that starts a list is timed from the end of the list before
+    for before, part in zip(parts, parts[1:]):
+        assert part["time since edge (s)"][0] == pytest.approx(part["timestamp"][0] - before["timestamp"][-1])
+
+def test_cv_segments_hold_level_between_lists():
+    # an RC cell relaxes toward the fixed level while the host sets up the next list
+    sim = simulated_smu.SimulatedKeithley2401(model = "rc", resistance = 1e3, capacitance = 1e-4, latency = 2e-3)
+    smu = K2401.Keithley2401(sim)
+    smu.initial_setup()
+    engine = cv_engine.CVEngine(smu, NPLC = 0.01, V_compliance = 11)
+    engine.program(0, 10, scan_rate = 0.5, step = 0.0035, cycles = 2)
+    # the lists end mid-ramp
+    assert len(engine.segments) == 3
+    smu.setup_single_Imeas(NPLC = 0.01, voltage_level = 0)
+    smu.turn_on()
+    current = np.concatenate([cycle["Current (A)"] for cycle in engine.run()])
+    smu.turn_off()
+    # the charging current C*dV/dt is 50 uA, a return to 0 V between lists would draw mA at the next point
+    assert np.abs(current).max() < 1e-4
+
+def test_acquire_trace_in_chunks(smu, sim):
+    smu.setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+    smu.turn_on()
+    chunks = []
+    data = smu.acquire_trace(25, interval = 2e-3, chunk_size = 10, on_chunk = lambda chunk: chunks.append(len(chunk["timestamp"])))
+    assert chunks == [10, 10, 5]
+    assert len(data["timestamp"]) == 25
+    assert np.allclose(data["Voltage (V)"], 1.0)
+    assert np.all(np.diff(data["timestamp"]) > 0)
+    assert not smu.armed
+
+def test_acquire_trace_stops_early(smu):
+    smu.setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+    smu.turn_on()
+    data = smu.acquire_trace(30, chunk_size = 10, on_chunk = lambda chunk: True)
+    assert len(data["timestamp"]) == 10
+    # the chunk already started is aborted, the SMU answers the next command normally
+    assert not smu.armed
+    smu.setup_single_Vmeas(NPLC = 0.01, current_level = 1e-3)
+    assert smu.single_Vmeas()[1] == pytest.approx(1.0)
+    with pytest.raises(ValueError):
+        smu.acquire_trace(0)
@@ -0,0 +1,35 @@
+import threading
+import pytest
+import smu_daemon
+
+@pytest.fixture
+def daemon(smu):
+    # port 0 picks a free port
+    server = smu_daemon.SMUDaemon(smu, port = 0)
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_hold_job_streams_rows(daemon, sim):
+    job = {"type": "hold", "source": "current", "level": 1e-3, "interval": 2e-3, "num_readings": 5, "NPLC": 0.01}
+    with smu_daemon.DaemonClient(port = daemon.server_address[1], timeout = 10) as client:
+        messages = list(client.submit(job))
+        assert [m["type"] for m in messages] == ["start"] + ["row"]*5 + ["done"]
+        assert all(m["row"][2] == pytest.approx(1.0) for m in messages[1:-1])
+        # the second run of the same job only sends what the first one changed back
+        n_writes = sim.n_writes
+        list(client.submit(job))
+        n_repeat = sim.n_writes - n_writes
+        n_writes = sim.n_writes
+        list(client.submit(dict(job, NPLC = 0.1)))
+        assert sim.n_writes - n_writes > n_repeat
+
+def test_errors_are_replies(daemon):
+    with smu_daemon.DaemonClient(port = daemon.server_address[1], timeout = 10) as client:
+        with pytest.raises(RuntimeError, match = "Unknown job type"):
+            list(client.submit({"type": "dance"}))
+        # the connection is still usable
+        info, = client.submit({"type": "info"})
+        assert info["info"]["model_number"] == "Keithley2401"
@@ -0,0 +1,42 @@
+import os
+import numpy as np
+import streamfile
+
+def write_file(path, n_rows, chunk_rows = 16):
+    rows = np.column_stack((np.arange(n_rows), np.arange(n_rows)*1e-3, np.ones(n_rows)))
+    with streamfile.StreamWriter(path, chunk_rows = chunk_rows, metadata = {"cell": "A"}) as writer:
+        for row in rows:
+            writer.write_row(row)
+    return rows
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path/"run.smu")
+    rows = write_file(path, 50)
+    header, data, end = streamfile.read_stream(path)
+    assert header["metadata"] == {"cell": "A"}
+    assert np.array_equal(data, rows)
+    assert end == os.path.getsize(path)
+
+def test_recover_truncated(tmp_path):
+    path = str(tmp_path/"run.smu")
+    rows = write_file(path, 48)
+    # a crash in the middle of the last chunk
+    size = os.path.getsize(path)
+    with open(path, "r+b") as f:
+        f.truncate(size - 20)
+    assert streamfile.recover(path) == 32
+    header, data, end = streamfile.read_stream(path)
+    assert end == os.path.getsize(path)
+    assert np.array_equal(data, rows[:32])
+
+def test_recover_damaged_chunk(tmp_path):
+    path = str(tmp_path/"run.smu")
+    write_file(path, 48)
+    header, data, end = streamfile.read_stream(path)
+    chunk_size = streamfile.CHUNK_HEADER.size + 16*3*8
+    with open(path, "r+b") as f:
+        f.seek(end - chunk_size - 1)
+        f.write(b"\xff")
+    # the chunk with the bad byte and everything after it go
+    assert streamfile.recover(path) == 16
+    assert streamfile.recover(path) == 16
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import waveforms
+
+def test_ramp_hits_both_ends():
+    levels = waveforms.ramp(0, 1, 0.3)
+    assert levels[0] == 0 and levels[-1] == 1
+    assert np.all(np.diff(levels) <= 0.3 + 1e-12)
+
+def test_triangle_cycle_vertices_once():
+    cycle, actual_step = waveforms.triangle_cycle(0, 1, 0.03)
+    assert actual_step <= 0.03
+    assert np.count_nonzero(cycle == 1) == 1
+    assert np.count_nonzero(cycle == 0) == 1
+    # repeated end to end it has no doubled point at the start of a cycle
+    repeated = np.tile(cycle, 3)
+    assert np.all(np.abs(np.diff(repeated)) > 0)
+    assert np.allclose(np.abs(np.diff(repeated)), actual_step)
+
+def test_triangle_ends_on_initial_voltage():
+    times, levels = waveforms.triangle(0.2, -0.4, 0.1, 0.01, cycles = 2)
+    assert levels[-1] == 0.2
+    assert np.count_nonzero(levels == -0.4) == 2
+    assert np.allclose(np.diff(times), times[1])
+
+def test_piecewise_hits_segment_ends():
+    times, levels = waveforms.piecewise([(1, 0, 1), (0.5, 1, 1), (1, 1, -1)], 0.1)
+    assert len(levels) == 25
+    assert levels[9] == 1 and levels[-1] == -1
+
+def test_short_duration_rejected():
+    with pytest.raises(ValueError):
+        waveforms.pulse(0, 1, 1e-4, 1, 1e-3)
@@ -0,0 +1,116 @@
+import numpy as np
+
+# Every function returns (times, levels): numpy arrays of equal length, one entry per source-measure point,
+# with times = index*dt so the time base does not accumulate rounding. levels can go straight to
+# Keithley2401.setup_timeseries_Imeas / setup_timeseries_Vmeas, with interval = dt.
+
+def ramp(start, stop, max_step):
+    '''
+    Returns levels from start to stop, both included, in equal steps no larger than max_step.
+    '''
+    if max_step <= 0:
+        raise(ValueError("Invalid step: {}".format(max_step)))
+    n_steps = max(int(np.ceil(abs(stop - start)/max_step - 1e-9)), 1)
+    return np.linspace(start, stop, n_steps + 1)
+
+def timebase(n_points, dt):
+    return np.arange(n_points)*dt
+
+def triangle_cycle(initial_voltage, vertex_voltage, step):
+    '''
+    Returns one cyclic voltammetry cycle, initial -> vertex -> back to just before initial.
+    Each vertex appears exactly once, so cycles can be repeated end to end.
+
+    Returns
+    -------
+    levels : numpy array
+    actual_step : float
+        step used, at most step, chosen so both vertices are hit
+    '''
+    sweep = ramp(initial_voltage, vertex_voltage, step)
+    actual_step = abs(vertex_voltage - initial_voltage)/(len(sweep) - 1)
+    return np.concatenate((sweep[:-1], sweep[::-1][:-1])), actual_step
+
+def triangle(initial_voltage, vertex_voltage, scan_rate, step, cycles = 1):
+    '''
+    cyclic voltammetry program: cycles triangles followed by a final point back at initial_voltage.
+    The time between points is actual_step/scan_rate.
+    '''
+    if scan_rate <= 0 or cycles < 1:
+        raise(ValueError("Invalid cyclic voltammetry settings"))
+    cycle, actual_step = triangle_cycle(initial_voltage, vertex_voltage, step)
+    levels = np.append(np.tile(cycle, cycles), initial_voltage)
+    return timebase(len(levels), actual_step/scan_rate), levels
+
+def staircase(start, stop, step, step_time, dt):
+    '''
+    levels from start to stop in steps no larger than step, each held for step_time, sampled every dt
+    '''
+    per_step = _samples(step_time, dt)
+    levels = np.repeat(ramp(start, stop, step), per_step)
+    return timebase(len(levels), dt), levels
+
+def square_wave(low, high, period, dt, cycles = 1):
+    '''
+    cycles periods of high for half a period then low for half a period, sampled every dt
+    '''
+    half = _samples(period/2, dt)
+    levels = np.tile(np.repeat(np.array([high, low], dtype = float), half), cycles)
+    return timebase(len(levels), dt), levels
+
+def pulse(base, pulse_level, pulse_time, rest_time, dt, count = 1):
+    '''
+    count repetitions of pulse_level for pulse_time then base for rest_time, sampled every dt
+    '''
+    one = np.concatenate((np.full(_samples(pulse_time, dt), float(pulse_level)), np.full(_samples(rest_time, dt), float(base))))
+    levels = np.tile(one, count)
+    return timebase(len(levels), dt), levels
+
+def piecewise(segments, dt):
+    '''
+    Arbitrary program from linear segments.
+
+    Parameters
+    ----------
+    segments : list of (duration, start_level, end_level)
+        a segment with start_level == end_level is a hold. Each segment's
+        end_level is its last point, hit exactly.
+    dt : float
+        time between points (s)
+    '''
+    parts = []
+    for duration, start_level, end_level in segments:
+        n = _samples(duration, dt)
+        # the ramp reaches end_level on the segment's last point
+        parts.append(np.linspace(start_level, end_level, n + 1)[1:] if start_level != end_level else np.full(n, float(end_level)))
+    levels = np.concatenate(parts)
+    return timebase(len(levels), dt), levels
+
+def chunks(times, levels, chunk_size):
+    '''
+    splits a program into pieces of at most chunk_size points, ex. for SMU_LIST_MAX_LENGTH
+    '''
+    for start in range(0, len(levels), chunk_size):
+        yield times[start:start + chunk_size], levels[start:start + chunk_size]
+
+def repeat_chunks(pattern, repeats, dt, chunk_size, tail = ()):
+    '''
+    Lazily yields (times, levels) chunks of pattern repeated repeats times, then tail,
+    without building the whole program. Use it for programs too long to hold in memory.
+    '''
+    pattern = np.asarray(pattern, dtype = float)
+    tail = np.asarray(tail, dtype = float)
+    total = len(pattern)*repeats + len(tail)
+    for start in range(0, total, chunk_size):
+        index = np.arange(start, min(start + chunk_size, total))
+        in_pattern = index < len(pattern)*repeats
+        levels = np.empty(len(index))
+        levels[in_pattern] = pattern[index[in_pattern] % len(pattern)]
+        levels[~in_pattern] = tail[index[~in_pattern] - len(pattern)*repeats]
+        yield index*dt, levels
+
+def _samples(duration, dt):
+    n = int(round(duration/dt))
+    if n < 1:
+        raise(ValueError("Duration {} is shorter than one point of {} s".format(duration, dt)))
+    return n